@@ -1,6 +1,4 @@
 from flask import Flask, request, render_template, send_file, jsonify, Response, stream_with_context
-import requests
-import re
 import zipfile
 from io import BytesIO
 from werkzeug.utils import secure_filename
@@ -9,6 +7,14 @@ import logging
 import sys
 import time
 import json
+import secrets
+import shutil
+import tempfile
+from PIL import Image
+
+import metrics
+from sources import ArchiveSource, DriveSource, LocalDirectorySource
+from thumbnails import ThumbnailCache, render_thumbnail
 
 # Configure logging
 # Use INFO level in production, DEBUG in development
@@ -55,7 +61,8 @@ except ImportError as e:
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# 16MB max request size by default; raise MAX_UPLOAD_MB to accept photo archives
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 16)) * 1024 * 1024
 
 # Create upload directory
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -68,6 +75,25 @@ FACE_RECOGNITION_CONFIG = {
     'demo_mode': not FACE_RECOGNITION_AVAILABLE
 }
 
+# Server-side directories that may be used as a photo source (os.pathsep separated)
+LOCAL_SOURCE_ROOTS = [p for p in os.environ.get('LOCAL_SOURCE_ROOTS', '').split(os.pathsep) if p]
+
+# Progress events are coalesced so fast (cached) runs don't flood the SSE stream
+PROGRESS_CONFIG = {
+    'interval': float(os.environ.get('PROGRESS_INTERVAL', 0.5))  # Seconds between updates
+}
+
+# Photos are decoded at reduced size; the same image feeds detection and match previews
+DECODE_CONFIG = {
+    'max_dimension': int(os.environ.get('DECODE_MAX_DIMENSION', 1600))  # 0 decodes at full size
+}
+
+# Match previews streamed over SSE are served from this bounded cache
+thumbnail_cache = ThumbnailCache(
+    max_entries=int(os.environ.get('THUMBNAIL_CACHE_ENTRIES', 500)),
+    max_bytes=int(os.environ.get('THUMBNAIL_CACHE_BYTES', 32 * 1024 * 1024))
+)
+
 # Simple health check endpoint
 @app.route('/health')
 def health_check():
@@ -89,36 +115,29 @@ def api_status():
     }
     return jsonify(status), 200
 
+# Prometheus scrape endpoint for pipeline timings and counters
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose pipeline metrics in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Match previews referenced by the SSE stream
+@app.route('/thumbnail/<key>')
+def thumbnail(key):
+    """Serve a match preview thumbnail from the in-memory cache."""
+    data = thumbnail_cache.get(key)
+    if data is None:
+        metrics.CACHE_MISSES_TOTAL.inc(cache='thumbnail')
+        return jsonify({'error': 'Thumbnail not found or expired'}), 404
+    metrics.CACHE_HITS_TOTAL.inc(cache='thumbnail')
+    return Response(data, mimetype='image/jpeg', headers={'Cache-Control': 'private, max-age=3600'})
+
 # Root endpoint that also serves as a health check
 @app.route('/')
 def index():
     logger.info("Index endpoint called")
     return render_template('index.html')
 
-def check_folder_sharing(folder_id):
-    """Check if a Google Drive folder is publicly accessible."""
-    try:
-        # Try to access the folder
-        folder_url = f"https://drive.google.com/drive/folders/{folder_id}"
-        response = requests.get(folder_url)
-        
-        # Check if we got access denied
-        if "Access denied" in response.text or "You need permission" in response.text:
-            return False, "This folder is not publicly accessible. Please make sure the folder is shared with 'Anyone with the link can view'."
-        
-        # Check if we can see any files
-        file_pattern = r'https://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)'
-        file_ids = re.findall(file_pattern, response.text)
-        
-        if not file_ids:
-            return False, "No files found in this folder or the folder is empty."
-        
-        return True, "Folder is accessible and contains files."
-        
-    except Exception as e:
-        logger.error(f"Error checking folder sharing: {str(e)}")
-        return False, f"Error accessing the folder: {str(e)}"
-
 @app.route('/process', methods=['POST'])
 def process_photos():
     """Process photos with streaming Server-Sent Events (SSE) response."""
@@ -134,23 +153,20 @@ def process_photos():
         logger.error("Empty selfie filename")
         return jsonify({'error': 'No selfie file selected'}), 400
     
-    # Check if drive link is present
-    drive_link = request.form.get('drive_link')
-    if not drive_link:
-        logger.error("No drive link provided")
+    # Check that a photo source (Drive link, server directory or archive) is present
+    source = resolve_photo_source()
+    if source is None:
+        logger.error("No photo source provided")
         return jsonify({'error': 'No Google Drive link provided'}), 400
     
     def generate():
         """Generator function for streaming Server-Sent Events."""
+        job = metrics.JobMetrics()
+        temp_dir = None
         try:
-            # Extract folder ID and check sharing status
-            folder_id = extract_folder_id(drive_link)
-            if not folder_id:
-                yield f"data: {json.dumps({'error': 'Invalid Google Drive folder link'})}\n\n"
-                return
-            
-            # Check folder sharing status
-            is_accessible, message = check_folder_sharing(folder_id)
+            # Check the source is usable (valid link, folder shared, archive readable...)
+            with job.stage('list'):
+                is_accessible, message = source.check()
             if not is_accessible:
                 yield f"data: {json.dumps({'error': message})}\n\n"
                 return
@@ -164,8 +180,9 @@ def process_photos():
             # Load and encode the selfie face
             if FACE_RECOGNITION_CONFIG['enabled']:
                 try:
-                    selfie_image = face_recognition.load_image_file(selfie_path)
-                    selfie_encodings = face_recognition.face_encodings(selfie_image)
+                    with job.stage('selfie'):
+                        selfie_image = face_recognition.load_image_file(selfie_path)
+                        selfie_encodings = face_recognition.face_encodings(selfie_image)
                     
                     if not selfie_encodings:
                         yield f"data: {json.dumps({'error': 'No face detected in the selfie. Please upload a clear photo of your face.'})}\n\n"
@@ -175,6 +192,7 @@ def process_photos():
                     selfie_encoding = selfie_encodings[0]
                     logger.info("Selfie face encoded successfully")
                 except Exception as e:
+                    job.error('selfie', e)
                     logger.error(f"Error processing selfie: {str(e)}")
                     yield f"data: {json.dumps({'error': 'Error processing selfie image. Please try a different photo.'})}\n\n"
                     if os.path.exists(selfie_path):
@@ -185,91 +203,122 @@ def process_photos():
                 selfie_encoding = [random.random() for _ in range(128)]
                 logger.info("Running in demo mode - using simulated face encoding")
             
-            # Get list of files from Google Drive
-            drive_files = list_drive_files(folder_id)
+            # Get list of files from the source
+            with job.stage('list'):
+                drive_files = source.list_photos()
             if not drive_files:
-                yield f"data: {json.dumps({'error': 'No image files found in the specified Google Drive folder'})}\n\n"
+                yield f"data: {json.dumps({'error': f'No image files found in the specified {source.label}'})}\n\n"
                 os.remove(selfie_path)
                 return
             
-            logger.info(f"Found {len(drive_files)} files in the Drive folder")
+            logger.info(f"Found {len(drive_files)} files in the {source.label}")
             
-            # Create a temporary directory for matching photos
-            temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp_matches')
-            os.makedirs(temp_dir, exist_ok=True)
+            # A directory of its own for this job's photos: local sources hard-link
+            # originals in, so files left behind by another job must never be reused
+            temp_dir = tempfile.mkdtemp(prefix='matches_', dir=app.config['UPLOAD_FOLDER'])
             
             matching_photos = []
-            total_photos = len(drive_files)
+            # Only images are processed, so progress and ETA are measured against them
+            image_files = [f for f in drive_files if f['mimeType'].startswith('image/')]
+            total_photos = len(image_files)
             processed_count = 0
             face_detection_errors = 0
+            throttle = metrics.ProgressThrottle(PROGRESS_CONFIG['interval'])
+            loop_started = time.perf_counter()
             
             # Process each photo
-            for file in drive_files:
-                if not file['mimeType'].startswith('image/'):
-                    continue
-                    
+            for file in image_files:
+                stage = 'download'
                 try:
                     # Download the photo
-                    photo_path = download_drive_file(file['id'], temp_dir)
+                    with job.stage('download'):
+                        photo_path = source.fetch(file, temp_dir)
+                    job.add_bytes(os.path.getsize(photo_path))
                     
                     if FACE_RECOGNITION_CONFIG['enabled']:
                         try:
-                            # Load and encode the photo
-                            photo_image = face_recognition.load_image_file(photo_path)
-                            photo_encodings = face_recognition.face_encodings(photo_image)
+                            # Load the photo, find faces (HOG) and encode them
+                            stage = 'decode'
+                            with job.stage('decode'):
+                                reduced_image = load_reduced_image(photo_path)
+                                photo_image = np.array(reduced_image)
+                            stage = 'detect'
+                            with job.stage('detect'):
+                                face_locations = face_recognition.face_locations(photo_image)
+                            stage = 'encode'
+                            with job.stage('encode'):
+                                photo_encodings = face_recognition.face_encodings(
+                                    photo_image, known_face_locations=face_locations
+                                )
                             
                             if not photo_encodings:
                                 face_detection_errors += 1
+                                job.photo_done(0, False)
                                 logger.warning(f"No faces detected in {file['name']}")
                                 # Clean up downloaded file
                                 if os.path.exists(photo_path):
                                     os.remove(photo_path)
-                                continue
-                            
-                            # Check if any face in the photo matches the selfie
-                            matches = face_recognition.compare_faces(
-                                [selfie_encoding], 
-                                photo_encodings[0], 
-                                tolerance=FACE_RECOGNITION_CONFIG['tolerance']
-                            )
-                            face_distances = face_recognition.face_distance([selfie_encoding], photo_encodings[0])
-                            
-                            if matches[0] and face_distances[0] < FACE_RECOGNITION_CONFIG['min_face_distance']:
-                                original_name = file['name']
-                                new_path = os.path.join(temp_dir, original_name)
-                                if os.path.exists(photo_path):
-                                    os.rename(photo_path, new_path)
-                                matching_photos.append(new_path)
-                                logger.info(f"Match found in {original_name} (distance: {face_distances[0]:.2f})")
                             else:
-                                # Clean up non-matching photo
-                                if os.path.exists(photo_path):
-                                    os.remove(photo_path)
+                                # Check if any face in the photo matches the selfie
+                                stage = 'match'
+                                with job.stage('match'):
+                                    matches = face_recognition.compare_faces(
+                                        [selfie_encoding], 
+                                        photo_encodings[0], 
+                                        tolerance=FACE_RECOGNITION_CONFIG['tolerance']
+                                    )
+                                    face_distances = face_recognition.face_distance([selfie_encoding], photo_encodings[0])
+                                is_match = bool(matches[0] and face_distances[0] < FACE_RECOGNITION_CONFIG['min_face_distance'])
+                                job.photo_done(len(photo_encodings), is_match)
+                                
+                                if is_match:
+                                    original_name = file['name']
+                                    new_path = os.path.join(temp_dir, original_name)
+                                    if os.path.exists(photo_path):
+                                        os.rename(photo_path, new_path)
+                                    matching_photos.append(new_path)
+                                    logger.info(f"Match found in {original_name} (distance: {face_distances[0]:.2f})")
+                                    
+                                    # Stream the match straight away instead of waiting for the ZIP
+                                    yield f"data: {json.dumps(match_event(job, reduced_image, original_name, face_distances[0]))}\n\n"
+                                else:
+                                    # Clean up non-matching photo
+                                    if os.path.exists(photo_path):
+                                        os.remove(photo_path)
                         except Exception as e:
+                            job.error(stage, e)
                             logger.error(f"Error processing photo {file['name']}: {str(e)}")
                             if os.path.exists(photo_path):
                                 os.remove(photo_path)
-                            continue
                     else:
                         # Demo mode - randomly match photos
-                        if random.random() < 0.3:  # 30% chance of matching
+                        is_match = random.random() < 0.3  # 30% chance of matching
+                        job.photo_done(1, is_match)
+                        if is_match:
                             matching_photos.append(photo_path)
                             logger.info(f"Demo mode: Matched {file['name']}")
+                            stage = 'decode'
+                            with job.stage('decode'):
+                                reduced_image = load_reduced_image(photo_path)
+                            yield f"data: {json.dumps(match_event(job, reduced_image, file['name']))}\n\n"
                         else:
                             # Clean up non-matching photo in demo mode
                             if os.path.exists(photo_path):
                                 os.remove(photo_path)
                     
-                    processed_count += 1
-                    progress = (processed_count / total_photos) * 100
-                    logger.info(f"Processed {processed_count}/{total_photos} photos ({progress:.1f}%)")
-                    
-                    # Send progress update
-                    yield f"data: {json.dumps({'progress': progress, 'status': f'Processing photo {processed_count} of {total_photos}'})}\n\n"
-                    
                 except Exception as e:
+                    job.error(stage, e)
                     logger.error(f"Error processing photo {file['name']}: {str(e)}")
-                    continue
+                
+                # Failed photos still count towards progress so the bar reaches 100%
+                processed_count += 1
+                logger.debug(f"Processed {processed_count}/{total_photos} photos")
+                
+                # Send a coalesced progress update
+                if throttle.ready(force=processed_count == total_photos):
+                    event = progress_event(job, processed_count, total_photos, loop_started)
+                    logger.info(f"Processed {processed_count}/{total_photos} photos ({event['progress']:.1f}%)")
+                    yield f"data: {json.dumps(event)}\n\n"
             
             # Create ZIP file with matching photos
             if matching_photos:
@@ -277,12 +326,13 @@ def process_photos():
                 zip_path = os.path.join(app.config['UPLOAD_FOLDER'], zip_filename)
                 
                 try:
-                    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                        for photo_path in matching_photos:
-                            if os.path.exists(photo_path):
-                                # Use the original filename in the ZIP
-                                arcname = os.path.basename(photo_path)
-                                zipf.write(photo_path, arcname)
+                    with job.stage('zip'):
+                        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                            for photo_path in matching_photos:
+                                if os.path.exists(photo_path):
+                                    # Use the original filename in the ZIP
+                                    arcname = os.path.basename(photo_path)
+                                    zipf.write(photo_path, arcname)
                     
                     logger.info(f"Created ZIP file with {len(matching_photos)} matching photos")
                     
@@ -292,16 +342,21 @@ def process_photos():
                         os.remove(selfie_path)
                     
                     # Send final progress update
-                    yield f"data: {json.dumps({'progress': 100, 'status': 'Processing complete!', 'download_url': f'/download/{zip_filename}'})}\n\n"
+                    summary = job.finish('matched')
+                    logger.info(f"Job finished: {json.dumps(summary)}")
+                    yield f"data: {json.dumps({'progress': 100, 'status': 'Processing complete!', 'download_url': f'/download/{zip_filename}', 'metrics': summary})}\n\n"
                     
                 except Exception as e:
+                    job.error('zip', e)
                     logger.error(f"Error creating ZIP file: {str(e)}")
-                    yield f"data: {json.dumps({'error': 'Error creating ZIP file'})}\n\n"
+                    yield f"data: {json.dumps({'error': 'Error creating ZIP file', 'metrics': job.finish('error')})}\n\n"
             else:
                 error_msg = 'No matching photos found'
                 if face_detection_errors > 0:
                     error_msg += f'. Note: {face_detection_errors} photos had no detectable faces.'
-                yield f"data: {json.dumps({'error': error_msg})}\n\n"
+                summary = job.finish('no_match')
+                logger.info(f"Job finished: {json.dumps(summary)}")
+                yield f"data: {json.dumps({'error': error_msg, 'metrics': summary})}\n\n"
                 
                 # Clean up
                 cleanup_temp_files(temp_dir)
@@ -309,8 +364,15 @@ def process_photos():
                     os.remove(selfie_path)
                 
         except Exception as e:
+            job.error('job', e)
             logger.error(f"Error processing photos: {str(e)}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield f"data: {json.dumps({'error': str(e), 'metrics': job.finish('error')})}\n\n"
+        finally:
+            # Early returns (bad link, no face in selfie, ...) still count as jobs
+            job.finish('aborted')
+            source.close()
+            if temp_dir is not None and os.path.isdir(temp_dir):
+                shutil.rmtree(temp_dir, ignore_errors=True)
     
     # Return streaming response with proper headers for Server-Sent Events
     return Response(
@@ -323,6 +385,74 @@ def process_photos():
         }
     )
 
+def resolve_photo_source():
+    """Pick the photo source for /process from the submitted form.
+
+    An uploaded 'archive' wins over 'source_dir' (a directory under
+    LOCAL_SOURCE_ROOTS), which wins over the usual 'drive_link'.
+    """
+    archive_file = request.files.get('archive')
+    if archive_file and archive_file.filename:
+        archive_name = f"archive_{secrets.token_hex(8)}_{secure_filename(archive_file.filename)}"
+        archive_path = os.path.join(app.config['UPLOAD_FOLDER'], archive_name)
+        archive_file.save(archive_path)
+        logger.info(f"Archive saved to {archive_path}")
+        return ArchiveSource(archive_path, delete_on_close=True)
+    
+    source_dir = request.form.get('source_dir')
+    if source_dir:
+        return LocalDirectorySource(source_dir, LOCAL_SOURCE_ROOTS)
+    
+    drive_link = request.form.get('drive_link')
+    if drive_link:
+        return DriveSource(drive_link)
+    return None
+
+def load_reduced_image(photo_path):
+    """Decode a photo as RGB, no larger than DECODE_CONFIG['max_dimension'].
+
+    JPEGs are decoded with DCT scaling (Image.draft), which is much cheaper
+    than decoding at full resolution and shrinking afterwards.
+    """
+    max_dimension = DECODE_CONFIG['max_dimension']
+    with Image.open(photo_path) as source:
+        if max_dimension:
+            source.draft('RGB', (max_dimension, max_dimension))
+        image = source.convert('RGB')
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+    return image
+
+def match_event(job, image, name, distance=None):
+    """Build an SSE payload announcing a match, with a cached preview thumbnail."""
+    match = {'name': name}
+    if distance is not None:
+        match['distance'] = round(float(distance), 3)
+    try:
+        with job.stage('thumbnail'):
+            key = thumbnail_cache.put(render_thumbnail(image))
+        match['thumbnail_url'] = f'/thumbnail/{key}'
+    except Exception as e:
+        job.error('thumbnail', e)
+        logger.warning(f"Could not create thumbnail for {name}: {str(e)}")
+    return {'match': match, 'matches': job.matches}
+
+def progress_event(job, processed_count, total_photos, loop_started):
+    """Build an SSE progress payload with throughput, ETA and per-stage counts."""
+    elapsed = time.perf_counter() - loop_started
+    rate = processed_count / elapsed if elapsed > 0 else 0.0
+    remaining = total_photos - processed_count
+    return {
+        'progress': (processed_count / total_photos) * 100 if total_photos else 100,
+        'status': f'Processing photo {processed_count} of {total_photos}',
+        'processed': processed_count,
+        'total': total_photos,
+        'matches': job.matches,
+        'photos_per_second': round(rate, 2),
+        'eta_seconds': round(remaining / rate, 1) if rate > 0 else None,
+        'stages': job.stage_counts()
+    }
+
 @app.route('/download/<filename>')
 def download_file(filename):
     return send_file(
@@ -332,81 +462,6 @@ def download_file(filename):
         download_name=filename
     )
 
-def extract_folder_id(drive_link):
-    """Extract folder ID from Google Drive link."""
-    pattern = r'/folders/([a-zA-Z0-9_-]+)'
-    match = re.search(pattern, drive_link)
-    return match.group(1) if match else None
-
-def list_drive_files(folder_id):
-    """List files in a public Google Drive folder."""
-    try:
-        # Construct the folder URL
-        folder_url = f"https://drive.google.com/drive/folders/{folder_id}"
-        
-        # Get the folder page
-        response = requests.get(folder_url)
-        response.raise_for_status()
-        
-        # Extract file IDs from the page
-        # Google Drive uses a specific data structure in the page
-        file_pattern = r'https://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)'
-        file_ids = re.findall(file_pattern, response.text)
-        
-        # Get file details
-        files = []
-        for file_id in file_ids:
-            # Get file metadata
-            file_url = f"https://drive.google.com/file/d/{file_id}/view"
-            file_response = requests.get(file_url)
-            
-            # Check if it's an image
-            if any(ext in file_response.text.lower() for ext in ['.jpg', '.jpeg', '.png', '.gif']):
-                files.append({
-                    'id': file_id,
-                    'name': f'photo_{file_id}.jpg',  # We'll determine the actual name when downloading
-                    'mimeType': 'image/jpeg'  # We'll determine the actual type when downloading
-                })
-        
-        return files
-    except Exception as e:
-        logger.error(f"Error listing Drive files: {str(e)}")
-        return []
-
-def download_drive_file(file_id, save_dir):
-    """Download a file from a public Google Drive link."""
-    try:
-        # Construct the direct download URL
-        download_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-        
-        # Download the file
-        response = requests.get(download_url, stream=True)
-        response.raise_for_status()
-        
-        # Determine file type from content-type
-        content_type = response.headers.get('content-type', '')
-        if 'image' not in content_type:
-            raise ValueError(f"Not an image file: {content_type}")
-        
-        # Determine file extension
-        ext = '.jpg'  # default
-        if 'png' in content_type:
-            ext = '.png'
-        elif 'gif' in content_type:
-            ext = '.gif'
-        
-        # Save the file
-        file_path = os.path.join(save_dir, f'photo_{file_id}{ext}')
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        return file_path
-    except Exception as e:
-        logger.error(f"Error downloading file {file_id}: {str(e)}")
-        raise
-
 def cleanup_temp_files(directory):
     """Clean up temporary files."""
     for file in os.listdir(directory):
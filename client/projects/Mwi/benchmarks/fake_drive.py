@@ -0,0 +1,130 @@
+"""
+Local stand-in for the parts of Google Drive the extractor scrapes.
+
+Serves three endpoints shaped like the real ones:
+
+- /drive/folders/<folder_id>      HTML page linking every file in the folder
+- /file/d/<file_id>/view          HTML page mentioning the file name
+- /uc?export=download&id=<id>     Raw image bytes with an image/* content type
+
+Point the app at it with DRIVE_BASE_URL=http://127.0.0.1:<port>.
+"""
+
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+CONTENT_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif'}
+
+
+def generate_corpus(count, width=2400, height=1600, seed=0, quality=85):
+    """Build `count` synthetic JPEG photos as {file_id: (name, content_type, bytes)}."""
+    rng = random.Random(seed)
+    corpus = {}
+    for index in range(count):
+        image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            w, h = rng.randrange(40, width // 3), rng.randrange(40, height // 3)
+            draw.ellipse((x, y, x + w, y + h), fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        file_id = f'bench{seed:04d}x{index:06d}'
+        corpus[file_id] = (f'photo_{index:06d}.jpg', 'image/jpeg', buffer.getvalue())
+    return corpus
+
+
+def load_corpus(directory):
+    """Load every image under `directory` as {file_id: (name, content_type, bytes)}."""
+    corpus = {}
+    for index, name in enumerate(sorted(os.listdir(directory))):
+        ext = os.path.splitext(name)[1].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            corpus[f'local{index:06d}'] = (name, CONTENT_TYPES[ext], f.read())
+    return corpus
+
+
+class FakeDriveServer:
+    """Threaded HTTP server publishing a corpus as a single public folder."""
+
+    def __init__(self, corpus, folder_id='benchfolder', latency_ms=0, host='127.0.0.1', port=0):
+        self.corpus = corpus
+        self.folder_id = folder_id
+        self.latency = latency_ms / 1000.0
+        self.requests_served = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def folder_link(self):
+        return f'https://drive.google.com/drive/folders/{self.folder_id}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server.requests_served += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                parts = url.path.strip('/').split('/')
+                if parts[:2] == ['drive', 'folders'] and len(parts) == 3 and parts[2] == server.folder_id:
+                    # The scraper only looks for absolute file links in the page body
+                    links = ''.join(
+                        f'<a href="https://drive.google.com/file/d/{file_id}/view">{name}</a>\n'
+                        for file_id, (name, _, _) in server.corpus.items()
+                    )
+                    return self._send(200, 'text/html', f'<html><body>{links}</body></html>'.encode())
+                if parts[:2] == ['file', 'd'] and len(parts) == 4 and parts[2] in server.corpus:
+                    name = server.corpus[parts[2]][0]
+                    return self._send(200, 'text/html', f'<html><title>{name}</title></html>'.encode())
+                if parts == ['uc']:
+                    file_id = parse_qs(url.query).get('id', [''])[0]
+                    if file_id in server.corpus:
+                        _, content_type, data = server.corpus[file_id]
+                        return self._send(200, content_type, data)
+                return self._send(404, 'text/html', b'<html>You need permission</html>')
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
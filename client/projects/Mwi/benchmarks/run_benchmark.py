@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Mwi Pipeline Benchmark
+======================
+Drives POST /process end to end against a local fake Google Drive, so runs
+are reproducible and need no network access.
+
+Usage:
+    python benchmarks/run_benchmark.py                         # 50 synthetic photos, 3 runs
+    python benchmarks/run_benchmark.py --photos 200 --runs 5
+    python benchmarks/run_benchmark.py --corpus ~/event-photos --selfie me.jpg
+    python benchmarks/run_benchmark.py --latency-ms 40         # simulate Drive round trips
+    python benchmarks/run_benchmark.py --compare benchmarks/results/baseline.json
+
+The fake Drive server runs in a child process so the reported peak RSS is the
+pipeline's, not the corpus'. With face_recognition installed, pass a --selfie
+that contains a face; synthetic photos have no faces, so they exercise
+download/decode/detect timings but never match.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_drive import FakeDriveServer, generate_corpus, load_corpus
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def print_header(text):
+    """Print a formatted header"""
+    print("\n" + "=" * 70)
+    print(text.center(70))
+    print("=" * 70 + "\n")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def serve_corpus(args, ready):
+    """Child process: build the corpus and serve it until terminated."""
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.photos, args.width, args.height, seed=args.seed)
+    server = FakeDriveServer(corpus, latency_ms=args.latency_ms).start()
+    ready.put((server.base_url, server.folder_link, len(corpus), sum(len(c[2]) for c in corpus.values())))
+    while True:
+        time.sleep(3600)
+
+
+def synthetic_selfie():
+    from PIL import Image
+    buffer = BytesIO()
+    Image.new('RGB', (320, 320), (200, 170, 150)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def parse_events(body):
+    """Split an SSE body into decoded JSON events."""
+    return [json.loads(chunk[6:]) for chunk in body.split('\n\n') if chunk.startswith('data: ')]
+
+
+def run_once(client, selfie_bytes, folder_link):
+    """Run one /process job and return its timing record."""
+    started = time.perf_counter()
+    first_match = None
+    events = []
+    response = client.post('/process', data={
+        'selfie': (BytesIO(selfie_bytes), 'selfie.jpg'),
+        'drive_link': folder_link,
+    }, content_type='multipart/form-data', buffered=False)
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        *complete, buffer = buffer.split('\n\n')
+        for event in parse_events('\n\n'.join(complete) + '\n\n'):
+            if 'match' in event and first_match is None:
+                first_match = time.perf_counter() - started
+            events.append(event)
+    response.close()
+    wall = time.perf_counter() - started
+
+    final = events[-1] if events else {}
+    summary = final.get('metrics')
+    if summary is None:
+        raise RuntimeError(f"Job did not produce a metrics summary: {final.get('error', final)}")
+    return {
+        'wall_seconds': round(wall, 3),
+        'time_to_first_match_seconds': round(first_match, 3) if first_match is not None else None,
+        'events': len(events),
+        'outcome': 'error' if 'error' in final and 'download_url' not in final else 'complete',
+        'photos': summary['photos'],
+        'matches': summary['matches'],
+        'photos_per_second': round(summary['photos'] / wall, 3) if wall else 0.0,
+        'bytes_downloaded': summary['bytes_downloaded'],
+        'errors': summary['errors'],
+        'stages': {
+            name: {key: stage[key] for key in ('count', 'mean_seconds', 'p50_seconds', 'p95_seconds')}
+            for name, stage in summary['stages'].items()
+        },
+    }
+
+
+def summarize(runs):
+    """Median of each per-run figure across runs."""
+    stage_names = sorted({name for run in runs for name in run['stages']})
+    return {
+        'photos_per_second': round(statistics.median(r['photos_per_second'] for r in runs), 3),
+        'wall_seconds': round(statistics.median(r['wall_seconds'] for r in runs), 3),
+        'stages': {
+            name: {
+                pct: round(statistics.median(r['stages'][name][pct] for r in runs if name in r['stages']), 4)
+                for pct in ('p50_seconds', 'p95_seconds')
+            }
+            for name in stage_names
+        },
+    }
+
+
+def compare(result, baseline_path):
+    """Print throughput and per-stage p95 changes versus a previous result file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print_header("COMPARISON WITH BASELINE")
+    old, new = baseline['summary'], result['summary']
+
+    def delta(before, after):
+        return f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+
+    print(f"{'photos/sec':20} {old['photos_per_second']:>10} -> {new['photos_per_second']:<10} {delta(old['photos_per_second'], new['photos_per_second'])}")
+    for name, stage in new['stages'].items():
+        before = old['stages'].get(name, {}).get('p95_seconds')
+        if before is not None:
+            print(f"{name + ' p95 (s)':20} {before:>10} -> {stage['p95_seconds']:<10} {delta(before, stage['p95_seconds'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Mwi photo pipeline offline')
+    parser.add_argument('--photos', type=int, default=50, help='Synthetic photos to generate')
+    parser.add_argument('--width', type=int, default=2400, help='Synthetic photo width')
+    parser.add_argument('--height', type=int, default=1600, help='Synthetic photo height')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic corpus seed')
+    parser.add_argument('--corpus', help='Directory of real photos to serve instead')
+    parser.add_argument('--selfie', help='Selfie image (required when face_recognition is installed)')
+    parser.add_argument('--runs', type=int, default=3, help='Number of /process jobs to run')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Added latency per fake Drive request')
+    parser.add_argument('--output', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Previous JSON result to compare against')
+    args = parser.parse_args()
+    # The app is run from a scratch directory, so resolve user paths first
+    for name in ('corpus', 'selfie', 'output', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(os.path.expanduser(getattr(args, name))))
+
+    print_header("MWI PIPELINE BENCHMARK")
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve_corpus, args=(args, ready), daemon=True)
+    server.start()
+    try:
+        base_url, folder_link, corpus_size, corpus_bytes = ready.get(timeout=600)
+        print(f"📁 Corpus: {corpus_size} photos, {corpus_bytes / 1e6:.1f} MB served from {base_url}")
+
+        # The app reads its config at import and writes uploads/ under the cwd
+        os.environ['DRIVE_BASE_URL'] = base_url
+        os.environ.setdefault('LOG_LEVEL', 'WARNING')
+        os.chdir(tempfile.mkdtemp(prefix='mwi-bench-'))
+        import app as mwi
+
+        if args.selfie:
+            with open(args.selfie, 'rb') as f:
+                selfie_bytes = f.read()
+        elif mwi.FACE_RECOGNITION_CONFIG['enabled']:
+            print("❌ face_recognition is installed: pass --selfie with a visible face")
+            return 1
+        else:
+            selfie_bytes = synthetic_selfie()
+
+        client = mwi.app.test_client()
+        rss_before = peak_rss_mb()
+        runs = []
+        for index in range(args.runs):
+            run = run_once(client, selfie_bytes, folder_link)
+            runs.append(run)
+            print(f"▶️  Run {index + 1}/{args.runs}: {run['photos']} photos in {run['wall_seconds']}s "
+                  f"({run['photos_per_second']} photos/sec, {run['matches']} matches)")
+    finally:
+        server.terminate()
+
+    result = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'face_recognition': mwi.FACE_RECOGNITION_CONFIG['enabled'],
+            'decode_max_dimension': mwi.DECODE_CONFIG['max_dimension'],
+        },
+        'config': {
+            'photos': corpus_size,
+            'corpus_bytes': corpus_bytes,
+            'corpus': args.corpus or 'synthetic',
+            'runs': args.runs,
+            'latency_ms': args.latency_ms,
+        },
+        'peak_rss_mb': {'before_runs': rss_before, 'after_runs': peak_rss_mb()},
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+
+    print_header("BENCHMARK SUMMARY")
+    print(f"Photos/sec (median): {result['summary']['photos_per_second']}")
+    print(f"Peak RSS:            {result['peak_rss_mb']['after_runs']} MB")
+    print(f"\n{'stage':12} {'p50 (s)':>10} {'p95 (s)':>10}")
+    for name, stage in result['summary']['stages'].items():
+        print(f"{name:12} {stage['p50_seconds']:>10} {stage['p95_seconds']:>10}")
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', datetime.now().strftime('bench_%Y%m%d_%H%M%S.json'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\n💾 Results written to {output}")
+
+    if args.compare:
+        compare(result, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Lightweight in-process metrics for the Mwi photo extractor.
+
+Counters and histograms are kept in a module-level registry and rendered in
+Prometheus text format by the /metrics endpoint. Every gunicorn worker keeps
+its own registry, so scrape each worker (or run a single worker) when you
+need exact totals.
+"""
+
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Seconds; covers a cached decode (~5ms) up to a slow Drive download
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        with _lock:
+            self._values[_label_key(labels)] += amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0.0)
+
+    def collect(self):
+        with _lock:
+            items = sorted(self._values.items())
+        return ['{}{} {}'.format(self.name, _format_labels(key), _format_value(value)) for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with _lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = [('le', _format_value(bound) if bound == float('inf') else repr(float(bound)))]
+                lines.append('{}_bucket{} {}'.format(self.name, _format_labels(key, le), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, _format_labels(key), repr(float(total))))
+            lines.append('{}_count{} {}'.format(self.name, _format_labels(key), count))
+        return lines
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100.0 * len(ordered)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def counter(name, documentation):
+    """Register (or fetch) a counter."""
+    with _lock:
+        if name not in _registry:
+            _registry[name] = Counter(name, documentation)
+        return _registry[name]
+
+
+def histogram(name, documentation, buckets=DEFAULT_BUCKETS):
+    """Register (or fetch) a histogram."""
+    with _lock:
+        if name not in _registry:
+            _registry[name] = Histogram(name, documentation, buckets)
+        return _registry[name]
+
+
+def render():
+    """Render every registered metric in Prometheus text exposition format."""
+    with _lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# ============= PIPELINE METRICS =============
+
+STAGE_SECONDS = histogram('mwi_stage_seconds', 'Time spent per pipeline stage')
+JOB_SECONDS = histogram('mwi_job_seconds', 'Wall-clock time per /process job',
+                        buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+JOB_PHOTOS_PER_SECOND = histogram('mwi_job_photos_per_second', 'Photo throughput per job',
+                                  buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100))
+FACES_PER_PHOTO = histogram('mwi_faces_per_photo', 'Faces detected per processed photo',
+                            buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50))
+PHOTOS_TOTAL = counter('mwi_photos_processed_total', 'Photos processed')
+MATCHES_TOTAL = counter('mwi_matches_total', 'Photos matched against the selfie')
+BYTES_DOWNLOADED_TOTAL = counter('mwi_bytes_downloaded_total', 'Bytes downloaded from photo sources')
+CACHE_HITS_TOTAL = counter('mwi_cache_hits_total', 'Cache hits by cache name')
+CACHE_MISSES_TOTAL = counter('mwi_cache_misses_total', 'Cache misses by cache name')
+ERRORS_TOTAL = counter('mwi_errors_total', 'Errors by pipeline stage and exception type')
+JOBS_TOTAL = counter('mwi_jobs_total', 'Finished /process jobs by outcome')
+
+
+class JobMetrics:
+    """Per-job stage timers and counters.
+
+    Every observation is also folded into the global registry so /metrics
+    aggregates across jobs, while summary() describes just this job.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ended = None
+        self.stages = {}
+        # Raw per-stage latencies, kept for the job's p50/p95
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.photos = 0
+        self.matches = 0
+        self.faces = 0
+        self.bytes_downloaded = 0
+        self._finished = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as pipeline stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+
+    def observe_stage(self, name, elapsed):
+        totals = self.stages.setdefault(name, [0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+        self.samples[name].append(elapsed)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def stage_counts(self):
+        return {name: count for name, (count, _) in self.stages.items()}
+
+    def add_bytes(self, count):
+        self.bytes_downloaded += count
+        BYTES_DOWNLOADED_TOTAL.inc(count)
+
+    def photo_done(self, faces, matched):
+        self.photos += 1
+        self.faces += faces
+        PHOTOS_TOTAL.inc()
+        FACES_PER_PHOTO.observe(faces)
+        if matched:
+            self.matches += 1
+            MATCHES_TOTAL.inc()
+
+    def error(self, stage, exc):
+        error_type = type(exc).__name__
+        self.errors[error_type] += 1
+        ERRORS_TOTAL.inc(stage=stage, type=error_type)
+
+    @property
+    def elapsed(self):
+        return (self.ended or time.perf_counter()) - self.started
+
+    def photos_per_second(self):
+        elapsed = self.elapsed
+        return self.photos / elapsed if elapsed > 0 else 0.0
+
+    def finish(self, outcome):
+        """Record job-level histograms once and return the job summary."""
+        if self._finished is None:
+            self._finished = outcome
+            self.ended = time.perf_counter()
+            JOB_SECONDS.observe(self.elapsed)
+            if self.photos:
+                JOB_PHOTOS_PER_SECOND.observe(self.photos_per_second())
+            JOBS_TOTAL.inc(outcome=outcome)
+        return self.summary()
+
+    def summary(self):
+        """JSON-serialisable summary sent in the final SSE event."""
+        return {
+            'elapsed_seconds': round(self.elapsed, 3),
+            'photos': self.photos,
+            'matches': self.matches,
+            'photos_per_second': round(self.photos_per_second(), 3),
+            'faces_per_photo': round(self.faces / self.photos, 3) if self.photos else 0.0,
+            'bytes_downloaded': self.bytes_downloaded,
+            'errors': dict(self.errors),
+            'stages': {
+                name: {'count': count, 'total_seconds': round(total, 4),
+                       'mean_seconds': round(total / count, 4) if count else 0.0,
+                       'p50_seconds': round(percentile(self.samples[name], 50), 4),
+                       'p95_seconds': round(percentile(self.samples[name], 95), 4)}
+                for name, (count, total) in self.stages.items()
+            },
+        }
+
+
+class ProgressThrottle:
+    """Rate-limit progress events to at most one per `interval` seconds."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._last = None
+
+    def ready(self, force=False):
+        now = time.perf_counter()
+        if force or self._last is None or now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
@@ -257,10 +257,19 @@ function setupFormSubmission() {
                                     return;
                                 }
                                 
+                                if (data.match) {
+                                    addMatchPreview(data.match);
+                                }
+                                
                                 if (data.progress !== undefined) {
                                     progressBar.style.width = data.progress + '%';
                                     if (statusMessage) {
-                                        statusMessage.textContent = data.status || 'Processing...';
+                                        let status = data.status || 'Processing...';
+                                        // Newer servers also report throughput and an ETA
+                                        if (data.eta_seconds !== undefined && data.eta_seconds !== null && data.progress < 100) {
+                                            status += ` (about ${Math.ceil(data.eta_seconds)}s left)`;
+                                        }
+                                        statusMessage.textContent = status;
                                     }
                                 }
                                 
@@ -292,6 +301,18 @@ function setupFormSubmission() {
         });
     }
 
+    function addMatchPreview(match) {
+        const previews = document.getElementById('matchPreviews');
+        if (!previews || !match.thumbnail_url) return;
+        
+        const img = document.createElement('img');
+        img.src = match.thumbnail_url;
+        img.alt = match.name;
+        img.title = match.name;
+        img.loading = 'lazy';
+        previews.appendChild(img);
+    }
+
     function resetForm() {
         // Reset file input and preview
         const fileInput = document.getElementById('selfie');
@@ -315,6 +336,9 @@ function setupFormSubmission() {
         // Reset progress bar
         progressBar.style.width = '0%';
         statusMessage.textContent = '';
+        
+        // Clear match previews
+        document.getElementById('matchPreviews').innerHTML = '';
     }
 }
 
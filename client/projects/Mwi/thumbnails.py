@@ -0,0 +1,59 @@
+"""
+Bounded in-memory cache of match preview thumbnails.
+
+Thumbnails are rendered from the image that was already decoded for face
+detection and kept here until they are evicted, so /thumbnail/<key> never
+touches the disk or decodes the original photo again.
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+THUMBNAIL_SIZE = (240, 240)
+THUMBNAIL_QUALITY = 70
+
+
+def render_thumbnail(image, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """Encode a PIL image as a small JPEG without modifying the original."""
+    thumb = image.copy()
+    thumb.thumbnail(size)
+    if thumb.mode != 'RGB':
+        thumb = thumb.convert('RGB')
+    buffer = BytesIO()
+    thumb.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+class ThumbnailCache:
+    """LRU cache bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries=500, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        """Store thumbnail bytes and return the unguessable key to fetch them by."""
+        key = secrets.token_urlsafe(12)
+        with self._lock:
+            self._entries[key] = data
+            self.total_bytes += len(data)
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self.total_bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def __len__(self):
+        return len(self._entries)
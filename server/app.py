@@ -1,61 +1,298 @@
-from flask import Flask, request, jsonify, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+from contextlib import contextmanager
+from functools import wraps
 from datetime import timedelta, datetime
 import os
 from dotenv import load_dotenv
-import secrets
-
-from models import db, ma, User, user_schema
+from sqlalchemy import event
+
+from models import db, User
+from hashing import password_pool, PasswordPoolBusy
+from blocklist import token_blocklist
+from user_cache import user_cache
+from serialization import init_json, user_to_dict
+from user_directory import ADMIN_USER_SERIALIZER, DEFAULT_PAGE_SIZE, list_users
+from export_users import FORMATS as EXPORT_FORMATS, export_users
+from reset_tokens import reset_tokens
+from outbox import outbox
+from auth_events import auth_events, event_totals, events_per_minute, top_failed_logins
+from ratelimit import rate_limiter
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, request_metrics, render as render_metrics
+from static_assets import static_manifest
 
 # Load environment variables
 load_dotenv()
 
-# Initialize app
-app = Flask(__name__, static_folder='../client', static_url_path='')
-
-# Configuration
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///usiu_app.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-app.config['JWT_TOKEN_LOCATION'] = ['headers']
-app.config['JWT_HEADER_NAME'] = 'Authorization'
-app.config['JWT_HEADER_TYPE'] = 'Bearer'
-
-# Initialize extensions
-db.init_app(app)
-ma.init_app(app)
-jwt = JWTManager(app)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+jwt = JWTManager()
+cors = CORS()
+routes = Blueprint('routes', __name__)
+
+
+# ============= CONFIGURATION =============
+
+def load_config(app):
+    """Read every setting from the environment into app.config"""
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret-key')
+    app.config['CLIENT_DIR'] = os.getenv('CLIENT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'client'))
+    # Hash, precompress and cache the client at startup; turn off while editing client files
+    app.config['STATIC_MANIFEST'] = os.getenv('STATIC_MANIFEST', 'true').lower() in ('1', 'true', 'yes')
+    app.config['STATIC_MAX_MEMORY_FILE'] = int(os.getenv('STATIC_MAX_MEMORY_FILE', 1024 * 1024))
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///usiu_app.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    app.config['JWT_TOKEN_LOCATION'] = ['headers']
+    app.config['JWT_HEADER_NAME'] = 'Authorization'
+    app.config['JWT_HEADER_TYPE'] = 'Bearer'
+    # How often each worker syncs revocations from other workers, and prunes expired ones
+    app.config['JWT_BLOCKLIST_REFRESH_SECONDS'] = float(os.getenv('JWT_BLOCKLIST_REFRESH_SECONDS', 5))
+    app.config['JWT_BLOCKLIST_PRUNE_SECONDS'] = float(os.getenv('JWT_BLOCKLIST_PRUNE_SECONDS', 300))
+    # Revoked JTIs are kept in one Bloom filter per expiry window; the table is only read on a hit
+    app.config['JWT_BLOCKLIST_WINDOW_SECONDS'] = int(os.getenv('JWT_BLOCKLIST_WINDOW_SECONDS', 3600))
+    app.config['JWT_BLOCKLIST_BLOOM_CAPACITY'] = int(os.getenv('JWT_BLOCKLIST_BLOOM_CAPACITY', 10000))
+    app.config['JWT_BLOCKLIST_BLOOM_ERROR_RATE'] = float(os.getenv('JWT_BLOCKLIST_BLOOM_ERROR_RATE', 0.001))
+    # 'claims' answers /api/verify-token from the token's profile claim alone; 'db' checks the user still exists
+    app.config['VERIFY_TOKEN_MODE'] = os.getenv('VERIFY_TOKEN_MODE', 'claims')
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL_SECONDS'] = float(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+    # Password reset links stay valid this long; expired ones are swept in the background
+    app.config['RESET_TOKEN_TTL_SECONDS'] = int(os.getenv('RESET_TOKEN_TTL_SECONDS', 3600))
+    app.config['RESET_TOKEN_SWEEP_SECONDS'] = float(os.getenv('RESET_TOKEN_SWEEP_SECONDS', 600))
+    # Public address the emailed reset link points at, e.g. https://usiug6.com; empty uses the request's host
+    app.config['RESET_URL_BASE'] = os.getenv('RESET_URL_BASE', '')
+    # bcrypt runs on a bounded pool; requests beyond workers + queue get a 503
+    app.config['BCRYPT_POOL_WORKERS'] = int(os.getenv('BCRYPT_POOL_WORKERS', os.cpu_count() or 2))
+    app.config['BCRYPT_POOL_QUEUE'] = int(os.getenv('BCRYPT_POOL_QUEUE', 16))
+    # bcrypt cost: a fixed number, or 'auto' to calibrate against BCRYPT_TARGET_MS at startup
+    app.config['BCRYPT_ROUNDS'] = os.getenv('BCRYPT_ROUNDS', 'auto')
+    app.config['BCRYPT_TARGET_MS'] = float(os.getenv('BCRYPT_TARGET_MS', 250))
+    # SQLite pragmas applied to every new connection (WAL lets readers run alongside a writer)
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    app.config['SQLITE_CACHE_SIZE_KB'] = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    # Connection pool; recycle/pre-ping only apply to server databases
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    # Reverse proxies in front of the app (nginx, a load balancer): their X-Forwarded-For/-Proto/-Host
+    # headers are trusted this many hops deep, so rate limits and logs see the client, not the proxy
+    app.config['TRUSTED_PROXIES'] = int(os.getenv('TRUSTED_PROXIES', 0))
+    # 'auto' uses orjson for JSON responses when it is installed; 'default' keeps Flask's encoder
+    app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'auto')
+    # Outgoing mail; delivery is off (emails stay queued in the outbox) until MAIL_SERVER is set
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', '')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 25))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'false').lower() in ('1', 'true', 'yes')
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+    app.config['MAIL_SENDER'] = os.getenv('MAIL_SENDER', 'no-reply@usiug6.com')
+    app.config['MAIL_TIMEOUT'] = float(os.getenv('MAIL_TIMEOUT', 10))
+    # The SMTP connection is kept open between batches and closed after this long without mail
+    app.config['MAIL_IDLE_SECONDS'] = float(os.getenv('MAIL_IDLE_SECONDS', 30))
+    app.config['OUTBOX_BATCH_SIZE'] = int(os.getenv('OUTBOX_BATCH_SIZE', 50))
+    app.config['OUTBOX_POLL_SECONDS'] = float(os.getenv('OUTBOX_POLL_SECONDS', 2))
+    app.config['OUTBOX_LEASE_SECONDS'] = int(os.getenv('OUTBOX_LEASE_SECONDS', 120))
+    # Temporary failures are retried after BACKOFF * 2^(attempt-1) seconds, up to MAX_ATTEMPTS
+    app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+    app.config['OUTBOX_BACKOFF_SECONDS'] = float(os.getenv('OUTBOX_BACKOFF_SECONDS', 30))
+    app.config['OUTBOX_RETENTION_SECONDS'] = int(os.getenv('OUTBOX_RETENTION_SECONDS', 7 * 24 * 3600))
+    # Login/logout/register/reset events, buffered in memory and appended in batches
+    app.config['AUTH_EVENTS_ENABLED'] = os.getenv('AUTH_EVENTS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    # 'db' appends to the auth_events table; 'ndjson' to rotated files in AUTH_EVENTS_DIR
+    app.config['AUTH_EVENTS_SINK'] = os.getenv('AUTH_EVENTS_SINK', 'db')
+    app.config['AUTH_EVENTS_DIR'] = os.getenv('AUTH_EVENTS_DIR', 'auth-events')
+    app.config['AUTH_EVENTS_ROTATE_BYTES'] = int(os.getenv('AUTH_EVENTS_ROTATE_BYTES', 64 * 1024 * 1024))
+    # Events past this many waiting are dropped (and counted) rather than slowing logins
+    app.config['AUTH_EVENTS_QUEUE_SIZE'] = int(os.getenv('AUTH_EVENTS_QUEUE_SIZE', 10000))
+    app.config['AUTH_EVENTS_BATCH_SIZE'] = int(os.getenv('AUTH_EVENTS_BATCH_SIZE', 500))
+    app.config['AUTH_EVENTS_FLUSH_SECONDS'] = float(os.getenv('AUTH_EVENTS_FLUSH_SECONDS', 1))
+    # Per-route latency/status metrics, SQL and bcrypt timers on /metrics
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    # Token buckets per client IP and per email on the endpoints that run bcrypt
+    app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    app.config['RATELIMIT_IP_PER_MINUTE'] = float(os.getenv('RATELIMIT_IP_PER_MINUTE', 60))
+    app.config['RATELIMIT_IP_BURST'] = float(os.getenv('RATELIMIT_IP_BURST', 30))
+    app.config['RATELIMIT_EMAIL_PER_MINUTE'] = float(os.getenv('RATELIMIT_EMAIL_PER_MINUTE', 5))
+    app.config['RATELIMIT_EMAIL_BURST'] = float(os.getenv('RATELIMIT_EMAIL_BURST', 5))
+    app.config['RATELIMIT_MAX_KEYS'] = int(os.getenv('RATELIMIT_MAX_KEYS', 100000))
+    # e.g. redis://localhost:6379/0 to share buckets between workers; empty keeps them per worker
+    app.config['RATELIMIT_STORAGE_URL'] = os.getenv('RATELIMIT_STORAGE_URL', '')
+
+
+# ============= DATABASE TUNING =============
+
+def engine_options(config):
+    """SQLAlchemy engine options for the configured backend"""
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    pool = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if uri.startswith('sqlite'):
+        if ':memory:' in uri or uri.rstrip('/') == 'sqlite:':
+            return {}  # Flask-SQLAlchemy shares one connection (StaticPool)
+        # Connections are handed between request threads; SQLite needs no recycling
+        return dict(pool, connect_args={
+            'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000.0,
+            'check_same_thread': False,
+        })
+    # Drop connections the server closed while idle, before a request trips over them
+    return dict(pool, pool_pre_ping=True, pool_recycle=config['DB_POOL_RECYCLE'])
+
+
+def sqlite_pragmas(config):
+    """Connect listener applying the SQLITE_* settings to each new connection"""
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}")
+        cursor.close()
+    return set_sqlite_pragmas
+
+
+# ============= APPLICATION FACTORY =============
+
+class StartupTimer:
+    """Wall time of each startup phase, for the breakdown printed at boot"""
+
+    def __init__(self):
+        self.phases = [('imports', IMPORT_SECONDS)]
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def report(self):
+        total = self.total()
+        lines = [f"Startup took {total * 1000:.0f} ms:"]
+        for name, seconds in sorted(self.phases, key=lambda phase: -phase[1]):
+            share = seconds / total * 100 if total else 0
+            lines.append(f"  {name:24} {seconds * 1000:8.1f} ms  {share:5.1f}%")
+        return '\n'.join(lines)
+
+
+def create_app(config=None):
+    """Build the application; `config` overrides settings read from the environment
+
+    Timings of each phase are kept in app.extensions['startup'] (a StartupTimer).
+    """
+    timer = StartupTimer()
+    with timer.phase('config'):
+        # The client is served by static_manifest rather than Flask's static route
+        app = Flask(__name__, static_folder=None)
+        load_config(app)
+        app.config.update(config or {})
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+        app.extensions['startup'] = timer
+        if app.config['TRUSTED_PROXIES']:
+            hops = app.config['TRUSTED_PROXIES']
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    with timer.phase('database'):
+        db.init_app(app)
+        with app.app_context():
+            if db.engine.dialect.name == 'sqlite':
+                event.listen(db.engine, 'connect', sqlite_pragmas(app.config))
+    with timer.phase('bcrypt calibration'):
+        password_pool.init_app(app)
+    with timer.phase('caches and limits'):
+        token_blocklist.init_app(app)
+        user_cache.init_app(app)
+        reset_tokens.init_app(app)
+        rate_limiter.init_app(app)
+        outbox.init_app(app)
+        auth_events.init_app(app)
+    with timer.phase('static manifest'):
+        static_manifest.init_app(app)
+    with timer.phase('metrics and routes'):
+        if app.config['METRICS_ENABLED']:
+            with app.app_context():
+                request_metrics.init_app(app, db.engine, password_pool, gauges={
+                    'password_pool_queued': lambda: password_pool.stats()['queued'],
+                    'password_pool_running': lambda: password_pool.stats()['running'],
+                    'token_blocklist_entries': lambda: len(token_blocklist),
+                    'user_cache_entries': lambda: len(user_cache),
+                    'rate_limiter_buckets': lambda: rate_limiter.stats()['buckets'],
+                    'auth_events_queued': lambda: auth_events.stats()['queued'],
+                })
+        init_json(app)
+        jwt.init_app(app)
+        cors.init_app(app, resources={r"/api/*": {"origins": "*"}})
+        app.register_blueprint(routes)
+    return app
 
-# Blacklist for logged out tokens
-jwt_blacklist = set()
 
 @jwt.token_in_blocklist_loader
 def check_if_token_in_blacklist(jwt_header, jwt_payload):
     """Check if token has been blacklisted (logged out)"""
     jti = jwt_payload['jti']
-    return jti in jwt_blacklist
+    return token_blocklist.is_revoked(jti, jwt_payload.get('exp'))
+
+
+def issue_token(user):
+    """Access token carrying the user's profile so verification needs no DB lookup"""
+    return create_access_token(identity=str(user.id), additional_claims={'profile': user_to_dict(user)})
+
+
+def busy_response(error):
+    """503 telling the client when the hashing pool should have capacity again"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def admin_required(view):
+    """jwt_required, plus the caller must currently have the admin role"""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        # Read from the database, not the token, so a demotion takes effect at once
+        user = db.session.get(User, int(get_jwt_identity()))
+        if user is None or user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
 
 # ============= ROUTES =============
 
-@app.route('/')
+@routes.route('/')
 def serve_index():
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_manifest.serve('index.html')
 
-@app.route('/<path:path>')
+@routes.route('/<path:path>')
 def serve_static(path):
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_manifest.serve(path)
 
 
 # ============= AUTH ENDPOINTS =============
 
-@app.route('/api/register', methods=['POST'])
+@routes.route('/api/register', methods=['POST'])
+@rate_limiter.limit('register')
 def register():
     """Register a new user"""
     try:
@@ -81,27 +318,27 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        auth_events.record('register', user.id, user.email)
         
         # Create access token
-        access_token = create_access_token(identity=str(user.id))
+        access_token = issue_token(user)
         
         return jsonify({
             'message': 'Registration successful',
             'access_token': access_token,
-            'user': {
-                'id': user.id,
-                'firstName': user.first_name,
-                'lastName': user.last_name,
-                'email': user.email
-            }
+            'user': user_to_dict(user)
         }), 201
         
+    except PasswordPoolBusy as e:
+        db.session.rollback()
+        return busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/login', methods=['POST'])
+@routes.route('/api/login', methods=['POST'])
+@rate_limiter.limit('login')
 def login():
     """Login user"""
     try:
@@ -115,69 +352,75 @@ def login():
         user = User.query.filter_by(email=data['email'].lower()).first()
         
         if not user or not user.check_password(data['password']):
+            auth_events.record('login_failed', user.id if user else None, data['email'])
             return jsonify({'error': 'Invalid email or password'}), 401
         
+        # Transparently move the stored hash to the current bcrypt cost
+        if user.password_needs_rehash():
+            try:
+                user.set_password(data['password'])
+                db.session.commit()
+            except PasswordPoolBusy:
+                db.session.rollback()  # retried on a later login
+        
+        auth_events.record('login', user.id, user.email)
+        
         # Create access token
-        access_token = create_access_token(identity=str(user.id))
+        access_token = issue_token(user)
         
         return jsonify({
             'message': 'Login successful',
             'access_token': access_token,
-            'user': {
-                'id': user.id,
-                'firstName': user.first_name,
-                'lastName': user.last_name,
-                'email': user.email
-            }
+            'user': user_to_dict(user)
         }), 200
         
+    except PasswordPoolBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/logout', methods=['POST'])
+@routes.route('/api/logout', methods=['POST'])
 @jwt_required()
 def logout():
     """Logout user by blacklisting their token"""
     try:
-        jti = get_jwt()['jti']
-        jwt_blacklist.add(jti)
+        token = get_jwt()
+        token_blocklist.revoke(token['jti'], datetime.utcfromtimestamp(token['exp']))
+        auth_events.record('logout', int(get_jwt_identity()))
         return jsonify({'message': 'Logout successful'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/user', methods=['GET'])
+@routes.route('/api/user', methods=['GET'])
 @jwt_required()
 def get_current_user():
     """Get current logged in user"""
     try:
         user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
+        user = user_cache.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({
-            'user': {
-                'id': user.id,
-                'firstName': user.first_name,
-                'lastName': user.last_name,
-                'email': user.email
-            }
-        }), 200
+        return jsonify({'user': user}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/verify-token', methods=['GET'])
+@routes.route('/api/verify-token', methods=['GET'])
 @jwt_required()
 def verify_token():
     """Verify if token is valid"""
     try:
+        # Signature, expiry and revocation are already checked by @jwt_required
+        if current_app.config['VERIFY_TOKEN_MODE'] == 'claims' and 'profile' in get_jwt():
+            return jsonify({'valid': True}), 200
+        
         user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
+        user = user_cache.get(user_id)
         
         if not user:
             return jsonify({'valid': False}), 401
@@ -188,9 +431,115 @@ def verify_token():
         return jsonify({'valid': False}), 401
 
 
+@routes.route('/api/health', methods=['GET'])
+def health():
+    """Liveness check with hashing pool, token blocklist, rate limiter, outbox and auth event statistics"""
+    return jsonify({
+        'status': 'ok',
+        'password_pool': password_pool.stats(),
+        'token_blocklist': token_blocklist.stats(),
+        'rate_limiter': rate_limiter.stats(),
+        'outbox': outbox.stats(),
+        'auth_events': auth_events.stats()
+    }), 200
+
+
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+# ============= ADMIN ENDPOINTS =============
+
+@routes.route('/api/admin/users', methods=['GET'])
+@admin_required
+def admin_list_users():
+    """Page through users newest first; ?limit, ?cursor (from next_cursor), ?role, ?q (name/email search)"""
+    try:
+        users, next_cursor = list_users(
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor'),
+            role=request.args.get('role'),
+            search=request.args.get('q'),
+        )
+        return jsonify({
+            'users': ADMIN_USER_SERIALIZER.dump_many(users),
+            'next_cursor': next_cursor
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@routes.route('/api/admin/users/export', methods=['GET'])
+@admin_required
+def admin_export_users():
+    """Stream every user as ?format=csv (default) or ndjson, optionally only one ?role"""
+    try:
+        fmt = request.args.get('format', 'csv')
+        chunks = export_users(fmt, role=request.args.get('role'))
+        # Fail before the first byte is sent rather than halfway through the stream
+        first = next(chunks, '')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        yield first
+        yield from chunks
+    
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="users.{fmt}"',
+        'Cache-Control': 'no-store'
+    })
+
+
+@routes.route('/api/admin/auth-events/summary', methods=['GET'])
+@admin_required
+def admin_auth_events_summary():
+    """Auth event totals, logins per minute and top failing IPs over the last ?minutes (default 60)"""
+    try:
+        minutes = request.args.get('minutes', 60, type=int)
+        if not 1 <= minutes <= 7 * 24 * 60:
+            raise ValueError('minutes must be between 1 and 10080')
+        until = datetime.utcnow()
+        since = until - timedelta(minutes=minutes)
+        return jsonify({
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'totals': event_totals(since, until),
+            'per_minute': events_per_minute(since=since, until=until),
+            'top_failed_ips': top_failed_logins(since, until),
+            'recorder': auth_events.stats()
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============= PASSWORD RESET ENDPOINTS =============
 
-@app.route('/api/forgot-password', methods=['POST'])
+RESET_EMAIL = """Hi {first_name},
+
+Use this link to choose a new password for your USIU G6 account:
+
+{reset_url}
+
+The link expires in {minutes} minutes. If you did not ask to reset your
+password, you can ignore this email.
+"""
+
+
+@routes.route('/api/forgot-password', methods=['POST'])
+@rate_limiter.limit('forgot-password')
 def forgot_password():
     """Request password reset"""
     try:
@@ -204,27 +553,32 @@ def forgot_password():
         if not user:
             return jsonify({'message': 'If the email exists, a reset link has been sent'}), 200
         
-        # Generate reset token
-        reset_token = secrets.token_urlsafe(32)
-        user.reset_token = reset_token
-        user.reset_token_expiry = datetime.utcnow() + timedelta(hours=1)
+        # Generate reset token (only its hash is stored)
+        reset_token = reset_tokens.issue(user)
+        base = current_app.config['RESET_URL_BASE'] or request.host_url
+        reset_url = f"{base.rstrip('/')}/resetpassword.html?token={reset_token}"
         
+        # Queued in the same transaction as the token; the outbox dispatcher sends it
+        outbox.enqueue(user.email, 'Reset your USIU G6 password', RESET_EMAIL.format(
+            first_name=user.first_name, reset_url=reset_url,
+            minutes=current_app.config['RESET_TOKEN_TTL_SECONDS'] // 60))
         db.session.commit()
+        outbox.wake()
+        auth_events.record('password_reset_requested', user.id, user.email)
         
-        # will send email with reset link in production
-        reset_url = f"http://localhost:5000/client/resetpassword.html?token={reset_token}"
-        
-        return jsonify({
-            'message': 'If the email exists, a reset link has been sent',
-            'reset_url': reset_url  # to be removed in production
-        }), 200
+        response = {'message': 'If the email exists, a reset link has been sent'}
+        # The link is only ever emailed, except to test and debug clients
+        if current_app.testing or current_app.debug:
+            response['reset_url'] = reset_url
+        return jsonify(response), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/reset-password', methods=['POST'])
+@routes.route('/api/reset-password', methods=['POST'])
+@rate_limiter.limit('reset-password', by_email=False)
 def reset_password():
     """Reset password with token"""
     try:
@@ -235,25 +589,32 @@ def reset_password():
             if field not in data or not data[field]:
                 return jsonify({'error': f'{field} is required'}), 400
         
-        # Find user with valid token
-        user = User.query.filter_by(reset_token=data['token']).first()
+        # Find the reset by the token's hash (one indexed lookup)
+        reset = reset_tokens.find(data['token'])
         
-        if not user:
+        if not reset:
             return jsonify({'error': 'Invalid or expired reset token'}), 400
         
         # Check if token is expired
-        if user.reset_token_expiry < datetime.utcnow():
+        if reset.expires_at < datetime.utcnow():
             return jsonify({'error': 'Reset token has expired'}), 400
         
+        user = db.session.get(User, reset.user_id)
+        if not user:
+            return jsonify({'error': 'Invalid or expired reset token'}), 400
+        
         # Update password
         user.set_password(data['newPassword'])
-        user.reset_token = None
-        user.reset_token_expiry = None
+        reset_tokens.discard(user.id)
         
         db.session.commit()
+        auth_events.record('password_reset', user.id, user.email)
         
         return jsonify({'message': 'Password reset successful'}), 200
         
+    except PasswordPoolBusy as e:
+        db.session.rollback()
+        return busy_response(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -261,14 +622,35 @@ def reset_password():
 
 # ============= INITIALIZATION =============
 
-def init_db():
+_default_app = None
+
+
+def default_app():
+    """The app behind `from app import app`, built on first use"""
+    global _default_app
+    if _default_app is None:
+        _default_app = create_app()
+    return _default_app
+
+
+def __getattr__(name):
+    # Keeps `from app import app` working for seed.py, the tests and the benchmarks
+    if name == 'app':
+        return default_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def init_db(app=None):
     """Initialize database"""
-    with app.app_context():
+    app = app or default_app()
+    with app.app_context(), app.extensions['startup'].phase('create tables'):
         db.create_all()
         print("Database initialized!")
 
 
 if __name__ == '__main__':
-    init_db()
+    app = create_app()
+    init_db(app)
+    print(app.extensions['startup'].report())
     print("Starting Flask server on http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
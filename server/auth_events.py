@@ -0,0 +1,289 @@
+"""
+Append-only log of authentication events.
+
+Logins, failed logins, logouts, registrations and password resets are
+recorded without touching the database on the request path: record() only
+appends to an in-memory buffer. A background thread writes the buffer out
+in one transaction (or one file append) when it reaches
+AUTH_EVENTS_BATCH_SIZE events, or AUTH_EVENTS_FLUSH_SECONDS after the
+oldest waiting event, whichever comes first.
+
+The buffer is bounded by AUTH_EVENTS_QUEUE_SIZE. When the writer falls
+behind, new events are dropped and counted, so a slow disk or a locked
+database costs log entries, never login latency. A batch the sink cannot
+take right now (database locked or unreachable, disk full) goes back to
+the front of the buffer and is retried after a backoff; a batch the
+database rejects is retried row by row, so only the offending rows are
+lost. Events that are still buffered at normal interpreter exit are
+flushed then.
+
+Sinks:
+- 'db' (default): the auth_events table, which the aggregate queries below
+  (logins per minute, totals, top failing IPs) and the admin summary read.
+- 'ndjson': AUTH_EVENTS_DIR/auth-events.ndjson, renamed to
+  auth-events-<timestamp>.ndjson once it grows past AUTH_EVENTS_ROTATE_BYTES.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, IntegrityError
+
+from metrics import Counter
+from models import db, AuthEvent
+
+EVENTS = ('login', 'login_failed', 'logout', 'register', 'password_reset_requested', 'password_reset')
+
+EVENTS_TOTAL = Counter('usiu_auth_events_total', 'Auth events recorded, by event', ['event'])
+EVENTS_DROPPED = Counter('usiu_auth_events_dropped_total', 'Auth events lost to a full buffer or a failed write',
+                         ['reason'])
+
+# Emails come straight from the request: cut them to fit rather than fail the batch
+EMAIL_LENGTH = AuthEvent.__table__.c.email.type.length
+IP_LENGTH = AuthEvent.__table__.c.ip.type.length
+# Errors caused by the rows themselves; anything else is assumed to pass (a lock, a full disk)
+REJECTED_ROW_ERRORS = (IntegrityError, DataError)
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class AuthEventRecorder:
+    """Buffers auth events in memory and appends them to the sink in batches"""
+
+    def __init__(self):
+        self.enabled = True
+        self.sink = 'db'
+        self.directory = 'auth-events'
+        self.max_queue = 10000
+        self.batch_size = 500
+        self.flush_seconds = 1.0
+        self.rotate_bytes = 64 * 1024 * 1024
+        self._buffer = deque()
+        self._lock = threading.Condition()
+        self._write_lock = threading.Lock()  # one batch written at a time, in order
+        self._writer = None
+        self._app = None
+        self._backoff = 0.0  # seconds the writer waits before retrying an unavailable sink
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    def init_app(self, app):
+        """Read the AUTH_EVENTS_* settings"""
+        self.enabled = app.config.get('AUTH_EVENTS_ENABLED', self.enabled)
+        self.sink = app.config.get('AUTH_EVENTS_SINK', self.sink)
+        if self.sink not in ('db', 'ndjson'):
+            raise ValueError(f"AUTH_EVENTS_SINK must be 'db' or 'ndjson', not {self.sink!r}")
+        self.directory = app.config.get('AUTH_EVENTS_DIR', self.directory)
+        self.max_queue = app.config.get('AUTH_EVENTS_QUEUE_SIZE', self.max_queue)
+        self.batch_size = app.config.get('AUTH_EVENTS_BATCH_SIZE', self.batch_size)
+        self.flush_seconds = app.config.get('AUTH_EVENTS_FLUSH_SECONDS', self.flush_seconds)
+        self.rotate_bytes = app.config.get('AUTH_EVENTS_ROTATE_BYTES', self.rotate_bytes)
+
+    def record(self, event, user_id=None, email=None):
+        """Buffer one event; returns False if it was dropped because the buffer is full"""
+        if not self.enabled:
+            return False
+        self.start(current_app._get_current_object())
+        entry = {
+            'event': event,
+            'user_id': user_id,
+            'email': email.lower()[:EMAIL_LENGTH] if email else None,
+            'ip': request.remote_addr[:IP_LENGTH] if has_request_context() and request.remote_addr else None,
+            'created_at': datetime.utcnow(),
+        }
+        with self._lock:
+            if len(self._buffer) >= self.max_queue:
+                self.dropped += 1
+                EVENTS_DROPPED.labels(reason='queue_full').inc()
+                return False
+            self._buffer.append(entry)
+            self.recorded += 1
+            if len(self._buffer) >= self.batch_size:
+                self._lock.notify()
+        EVENTS_TOTAL.labels(event=event).inc()
+        return True
+
+    # ============= WRITING =============
+
+    def flush(self, app=None):
+        """Write everything buffered so far; returns the number of events written
+
+        Stops early, leaving the rest buffered, if the sink is unavailable.
+        """
+        app = app or self._app or current_app._get_current_object()
+        written = 0
+        with self._write_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+                if not batch:
+                    return written
+                try:
+                    self._write(app, batch)
+                except REJECTED_ROW_ERRORS:
+                    self.failed_batches += 1
+                    app.logger.exception('Writing %d auth events failed; retrying them one at a time', len(batch))
+                    count, finished = self._write_each(app, batch)
+                except Exception:
+                    self.failed_batches += 1
+                    self._retry_later(app, batch)
+                    count, finished = 0, False
+                else:
+                    self.batches += 1
+                    self._backoff = 0.0
+                    count, finished = len(batch), True
+                self.written += count
+                written += count
+                if not finished:
+                    return written
+
+    def _write_each(self, app, batch):
+        """Write rows one at a time, dropping those the database rejects; returns (written, finished)"""
+        # One bad row must not take the rest of its batch down with it
+        written = 0
+        for index, entry in enumerate(batch):
+            try:
+                self._write(app, [entry])
+                written += 1
+            except REJECTED_ROW_ERRORS:
+                with self._lock:
+                    self.dropped += 1
+                EVENTS_DROPPED.labels(reason='write_failed').inc()
+                app.logger.warning('Dropped auth event %s for user %s', entry['event'], entry['user_id'])
+            except Exception:
+                self._retry_later(app, batch[index:])
+                return written, False
+        return written, True
+
+    def _retry_later(self, app, entries):
+        """Put entries back at the front of the buffer and back off before the next write"""
+        with self._lock:
+            self._buffer.extendleft(reversed(entries))
+        self._backoff = min(max(self._backoff * 2, self.flush_seconds), MAX_BACKOFF_SECONDS)
+        app.logger.warning('Auth event sink unavailable; retrying %d events in %.1fs',
+                           len(entries), self._backoff, exc_info=True)
+
+    def _write(self, app, batch):
+        if self.sink == 'db':
+            with app.app_context():
+                # Its own connection: never commits a request's unfinished session
+                with db.engine.begin() as connection:
+                    connection.execute(AuthEvent.__table__.insert(), batch)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, 'auth-events.ndjson')
+            lines = ''.join(json.dumps(dict(entry, created_at=entry['created_at'].isoformat())) + '\n'
+                            for entry in batch)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+                size = f.tell()
+            if size >= self.rotate_bytes:
+                stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+                os.replace(path, os.path.join(self.directory, f'auth-events-{stamp}.ndjson'))
+
+    def start(self, app):
+        """Start the writer thread once per process"""
+        # Started on first use so importing the app never starts threads
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._app = app
+                self._writer = threading.Thread(target=self._write_forever, name='auth-event-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_forever(self):
+        while True:
+            if self._backoff:
+                # The last write found the sink unavailable; hammering it would only hold it up
+                time.sleep(self._backoff)
+            else:
+                with self._lock:
+                    # Wake for a full batch, or once the oldest event has waited flush_seconds
+                    self._lock.wait_for(lambda: len(self._buffer) >= self.batch_size, timeout=self.flush_seconds)
+            self.flush(self._app)
+
+    def stats(self):
+        """Buffer depth and counters for this process"""
+        with self._lock:
+            queued = len(self._buffer)
+        return {
+            'enabled': self.enabled,
+            'sink': self.sink,
+            'queued': queued,
+            'recorded': self.recorded,
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'failed_batches': self.failed_batches,
+            'backoff_seconds': self._backoff,
+        }
+
+
+auth_events = AuthEventRecorder()
+
+
+# ============= AGGREGATES =============
+
+def _minute(column):
+    if db.engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m-%d %H:%M', column)
+    return func.date_trunc('minute', column)
+
+
+def events_per_minute(events=('login', 'login_failed'), since=None, until=None):
+    """[{'minute': ..., <event>: count, ...}] for each minute with any of `events`, oldest first"""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=1)
+    minute = _minute(AuthEvent.created_at).label('minute')
+    rows = db.session.execute(
+        select(minute, AuthEvent.event, func.count())
+        .where(AuthEvent.event.in_(events), AuthEvent.created_at >= since, AuthEvent.created_at < until)
+        .group_by(minute, AuthEvent.event)
+        .order_by(minute)
+    )
+    buckets = {}
+    for bucket, event, count in rows:
+        key = bucket if isinstance(bucket, str) else bucket.strftime('%Y-%m-%d %H:%M')
+        buckets.setdefault(key, dict.fromkeys(events, 0))[event] = count
+    return [dict(counts, minute=key) for key, counts in buckets.items()]
+
+
+def event_totals(since=None, until=None):
+    """{event: count} over the window (default: the last hour)"""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=1)
+    rows = db.session.execute(
+        select(AuthEvent.event, func.count())
+        .where(AuthEvent.created_at >= since, AuthEvent.created_at < until)
+        .group_by(AuthEvent.event)
+    )
+    totals = dict.fromkeys(EVENTS, 0)
+    for event, count in rows:
+        totals[event] = count
+    return totals
+
+
+def top_failed_logins(since=None, until=None, limit=10):
+    """IPs with the most failed logins in the window, and how many emails they tried"""
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=1)
+    failures = func.count().label('failures')
+    rows = db.session.execute(
+        select(AuthEvent.ip, failures, func.count(AuthEvent.email.distinct()))
+        .where(AuthEvent.event == 'login_failed', AuthEvent.created_at >= since, AuthEvent.created_at < until)
+        .group_by(AuthEvent.ip)
+        .order_by(failures.desc())
+        .limit(limit)
+    )
+    return [{'ip': ip, 'failures': count, 'emails': emails} for ip, count, emails in rows]
@@ -0,0 +1,264 @@
+"""
+Revoked-token store shared by every worker.
+
+Logged-out JTIs are written to the revoked_tokens table together with the
+token's expiry, so revocations survive restarts and are seen by all gunicorn
+workers.
+
+Almost no token presented to the API has been revoked, so each worker answers
+"not revoked" from Bloom filters instead of the database. There is one filter
+per expiry window (JWT_BLOCKLIST_WINDOW_SECONDS), which means a filter can be
+dropped as a whole once every token it covers has expired. Only a filter hit
+consults the table, and the answer is remembered in small LRU caches so a
+replayed token or a false positive costs one query, not one per request.
+
+Filters are topped up incrementally at most every
+JWT_BLOCKLIST_REFRESH_SECONDS, and expired rows are pruned from the table every
+JWT_BLOCKLIST_PRUNE_SECONDS. Ids are allocated at insert but become visible at
+commit, so a row can appear after a higher id was already read; each top-up
+therefore re-reads the last RESYNC_ROWS ids below the highest one seen. The
+first load blocks every caller until it is done: until then the filters are
+empty and would pass revoked tokens.
+"""
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, RevokedToken
+
+EPOCH = datetime(1970, 1, 1)
+# Ids below the newest seen that are read again on each refresh, for late commits
+RESYNC_ROWS = 100
+
+
+def to_epoch(value):
+    """Seconds since the epoch for a naive UTC datetime (ints pass through)"""
+    if isinstance(value, datetime):
+        return (value - EPOCH).total_seconds()
+    return value
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, sized for a capacity and error rate"""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Kirsch-Mitzenmacher: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def estimated_error_rate(self):
+        """Expected false-positive rate at the current fill level"""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class LRUSet:
+    """Bounded set that forgets the least recently used member"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+
+    def add(self, item):
+        self._items[item] = True
+        self._items.move_to_end(item)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+    def __contains__(self, item):
+        if item in self._items:
+            self._items.move_to_end(item)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._items)
+
+
+class TokenBlocklist:
+    """Database-backed JWT blocklist with per-worker Bloom filters"""
+
+    def __init__(self, refresh_interval=5, prune_interval=300, window=3600,
+                 capacity=10000, error_rate=0.001, cache_size=4096):
+        self.refresh_interval = refresh_interval
+        self.prune_interval = prune_interval
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def init_app(self, app):
+        """Read intervals and filter sizing from the JWT_BLOCKLIST_* settings"""
+        self.refresh_interval = app.config.get('JWT_BLOCKLIST_REFRESH_SECONDS', self.refresh_interval)
+        self.prune_interval = app.config.get('JWT_BLOCKLIST_PRUNE_SECONDS', self.prune_interval)
+        self.window = app.config.get('JWT_BLOCKLIST_WINDOW_SECONDS', self.window)
+        self.capacity = app.config.get('JWT_BLOCKLIST_BLOOM_CAPACITY', self.capacity)
+        self.error_rate = app.config.get('JWT_BLOCKLIST_BLOOM_ERROR_RATE', self.error_rate)
+        self.reset()
+
+    def reset(self):
+        """Forget local state; the next check reloads it from the database"""
+        with self._lock:
+            self._filters = {}  # expiry window -> BloomFilter
+            self._revoked = LRUSet(self.cache_size)  # confirmed by the table
+            self._not_revoked = LRUSet(self.cache_size)  # filter false positives
+            self._last_id = 0
+            self._last_refresh = None
+            self._last_prune = time.monotonic()
+            self.checks = 0
+            self.filter_hits = 0
+            self.false_positives = 0
+            self.store_lookups = 0
+            self.last_sync_lag = 0.0
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self._filters.values())
+
+    def _window_for(self, expires_at):
+        return int(to_epoch(expires_at) // self.window)
+
+    def _add(self, jti, expires_at):
+        window = self._window_for(expires_at)
+        bloom = self._filters.get(window)
+        if bloom is None:
+            bloom = self._filters[window] = BloomFilter(self.capacity, self.error_rate)
+        if jti not in bloom:  # re-read rows are already there
+            bloom.add(jti)
+        self._not_revoked.discard(jti)
+
+    def revoke(self, jti, expires_at):
+        """Persist a revocation and apply it to this worker immediately"""
+        db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # already revoked
+        with self._lock:
+            self._add(jti, expires_at)
+            self._revoked.add(jti)
+
+    def is_revoked(self, jti, expires_at=None):
+        """Bloom filter check; the table is only consulted on a filter hit
+
+        expires_at (the token's 'exp') selects the filter for its window;
+        without it every live filter is checked.
+        """
+        last_refresh = self._last_refresh
+        if last_refresh is None:
+            self.refresh(wait=True)
+        elif time.monotonic() - last_refresh >= self.refresh_interval:
+            self.refresh()
+
+        self.checks += 1
+        if expires_at is not None:
+            bloom = self._filters.get(self._window_for(expires_at))
+            maybe_revoked = bloom is not None and jti in bloom
+        else:
+            maybe_revoked = any(jti in bloom for bloom in list(self._filters.values()))
+        if not maybe_revoked:
+            return False
+
+        self.filter_hits += 1
+        with self._lock:
+            if jti in self._revoked:
+                return True
+            if jti in self._not_revoked:
+                return False
+        self.store_lookups += 1
+        revoked = db.session.query(RevokedToken.id).filter_by(jti=jti).first() is not None
+        with self._lock:
+            if revoked:
+                self._revoked.add(jti)
+            else:
+                self.false_positives += 1
+                self._not_revoked.add(jti)
+        return revoked
+
+    def refresh(self, wait=False):
+        """Pull revocations added since the last refresh and prune when due
+
+        With wait=False a refresh already running in another thread is left to
+        finish and this call returns at once; wait=True blocks until a refresh
+        has completed (needed before the first answer).
+        """
+        # Only one thread refreshes; the others keep answering from the filters
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            if wait and self._last_refresh is not None:
+                return  # another thread loaded the filters while this one waited
+            now = datetime.utcnow()
+            last_seen = self._last_id
+            rows = db.session.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at,
+                                    RevokedToken.revoked_at) \
+                .filter(RevokedToken.id > last_seen - RESYNC_ROWS, RevokedToken.expires_at > now) \
+                .order_by(RevokedToken.id) \
+                .all()
+            for row_id, jti, expires_at, revoked_at in rows:
+                self._add(jti, expires_at)
+                self._last_id = max(self._last_id, row_id)
+            rows = [row for row in rows if row.id > last_seen]
+            if rows and rows[-1].revoked_at is not None:
+                # How long the newest revocation took to reach this worker
+                self.last_sync_lag = max((now - rows[-1].revoked_at).total_seconds(), 0.0)
+            if time.monotonic() - self._last_prune >= self.prune_interval:
+                self._prune(now)
+            self._last_refresh = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def _prune(self, now):
+        """Drop filters whose window has fully expired, and expired table rows"""
+        current = self._window_for(now)
+        self._filters = {window: bloom for window, bloom in self._filters.items() if window >= current}
+        RevokedToken.query.filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+        db.session.commit()
+        self._last_prune = time.monotonic()
+
+    def stats(self):
+        """Filter effectiveness and refresh lag for health checks and metrics"""
+        filters = list(self._filters.values())
+        last_refresh = self._last_refresh
+        return {
+            'entries': sum(bloom.count for bloom in filters),
+            'filters': len(filters),
+            'filter_bytes': sum(len(bloom.bits) for bloom in filters),
+            'checks': self.checks,
+            'filter_hits': self.filter_hits,
+            'store_lookups': self.store_lookups,
+            'false_positives': self.false_positives,
+            'false_positive_rate': round(self.false_positives / self.checks, 6) if self.checks else 0.0,
+            'estimated_false_positive_rate': round(max([b.estimated_error_rate() for b in filters] or [0.0]), 6),
+            'refresh_age_seconds': round(time.monotonic() - last_refresh, 3) if last_refresh is not None else None,
+            'last_sync_lag_seconds': round(self.last_sync_lag, 3),
+        }
+
+
+token_blocklist = TokenBlocklist()
@@ -0,0 +1,373 @@
+"""
+Client asset build.
+
+Copies client/ to an output directory (build/client by default), with every
+page's local CSS and JS minified, merged into bundles and given
+content-hashed names, and the page's <script>/<link> tags rewritten to match:
+
+- adjacent local scripts with the same attributes (e.g. both `defer`) become
+  one bundle, so execution order is unchanged; the same goes for adjacent
+  stylesheets. Tags separated by anything but whitespace or comments stay
+  separate.
+- bundles are named <members>.<hash>.<ext> under assets/bundles/, so pages
+  that load the same files share one cached bundle, and the static server
+  marks them immutable.
+- the original files are copied too, for anything that links them directly.
+- raster images under assets/img get resized AVIF/WebP/JPEG derivatives
+  (see build_images.py) and their <img> tags become <picture> elements with
+  srcset, so small screens download small files. --no-images skips this.
+
+The minifiers only drop comments and redundant whitespace (JS keeps its line
+breaks, so automatic semicolon insertion is unaffected); no renaming.
+
+Usage:
+    python build_assets.py                  # client/ -> build/client/
+    python build_assets.py --output /srv/usiu-client
+    python build_assets.py --no-images      # skip the (slow on first run) image step
+
+Then serve the build with CLIENT_DIR=../build/client.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from build_images import DEFAULT_CACHE as IMAGE_CACHE, build_images
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE = os.path.join(REPO_DIR, 'client')
+DEFAULT_OUTPUT = os.path.join(REPO_DIR, 'build', 'client')
+BUNDLE_DIR = 'assets/bundles'
+IMAGE_DIR = 'assets/img'
+RESPONSIVE_DIR = 'assets/img/responsive'
+# Most images are card thumbnails: full width on phones, a column on desktop.
+# Images shown at a fixed size (avatars, nav thumbnails) carry their own
+# <img sizes="..."> in the page, which overrides this.
+DEFAULT_SIZES = '(max-width: 768px) 100vw, 33vw'
+HASH_LENGTH = 10
+
+SCRIPT_RE = re.compile(r'<script\b([^>]*?)\bsrc\s*=\s*["\']([^"\']+)["\']([^>]*)>\s*</script>', re.I | re.S)
+LINK_RE = re.compile(r'<link\b[^>]*>', re.I | re.S)
+IMG_RE = re.compile(r'<img\b[^>]*>', re.I | re.S)
+ATTR_RE = re.compile(r'([\w-]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?', re.S)
+# What may sit between two tags that are merged into one bundle
+GAP_RE = re.compile(r'^(?:\s|<!--.*?-->)*$', re.S)
+
+
+# ============= MINIFIERS =============
+
+def _skip_string(source, i, quote):
+    """Index just past the string literal starting at source[i] == quote"""
+    i += 1
+    while i < len(source):
+        if source[i] == '\\':
+            i += 2
+            continue
+        if source[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def minify_css(source):
+    """Drop comments and whitespace that CSS does not need"""
+    out = []
+    i = 0
+    pending_space = False
+    while i < len(source):
+        ch = source[i]
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = len(source) if end == -1 else end + 2
+            continue
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        if pending_space:
+            # Spaces matter between words ("0 auto") and before ':' in selectors ("a :hover")
+            if out and out[-1][-1:] not in '{};,>(:' and ch not in '{};,>)':
+                out.append(' ')
+            pending_space = False
+        if ch in '"\'':
+            end = _skip_string(source, i, ch)
+            out.append(source[i:end])
+            i = end
+            continue
+        if ch == '}' and out and out[-1] == ';':
+            out.pop()
+        out.append(ch)
+        i += 1
+    return ''.join(out).strip() + '\n'
+
+
+# Tokens after which a '/' starts a regular expression rather than a division
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^\n')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void', 'throw')
+
+
+def _regex_allowed(out):
+    text = ''.join(out[-3:]).rstrip(' \t')
+    if not text:
+        return True
+    if text[-1] in _REGEX_PRECEDERS:
+        return True
+    word = re.search(r'[A-Za-z_$]+$', text)
+    return bool(word) and word.group(0) in _REGEX_KEYWORDS
+
+
+def _skip_regex(source, i):
+    """Index just past the regex literal starting at source[i] == '/'"""
+    i += 1
+    in_class = False
+    while i < len(source) and source[i] != '\n':
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '[':
+            in_class = True
+        elif ch == ']':
+            in_class = False
+        elif ch == '/' and not in_class:
+            i += 1
+            while i < len(source) and (source[i].isalnum() or source[i] == '_'):
+                i += 1  # flags
+            return i
+        i += 1
+    return i
+
+
+def minify_js(source):
+    """Drop comments, indentation and blank lines; line breaks are kept for ASI"""
+    out = []
+    i = 0
+    while i < len(source):
+        ch = source[i]
+        if ch in '"\'`':
+            end = _skip_string(source, i, ch)
+            out.append(source[i:end])
+            i = end
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = len(source) if end == -1 else end
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            comment = source[i:len(source) if end == -1 else end + 2]
+            i = len(source) if end == -1 else end + 2
+            # A comment spanning lines still ends a statement for ASI
+            out.append('\n' if '\n' in comment else ' ')
+        elif ch == '/' and _regex_allowed(out):
+            end = _skip_regex(source, i)
+            out.append(source[i:end])
+            i = end
+        else:
+            out.append(ch)
+            i += 1
+    lines = (line.strip() for line in ''.join(out).split('\n'))
+    return '\n'.join(re.sub(r'[ \t]+', ' ', line) for line in lines if line) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# ============= BUILD =============
+
+def parse_attributes(tag):
+    """Attributes of an HTML start tag as a dict (valueless attributes map to '')"""
+    body = re.sub(r'^<\w+|/?>$', '', tag.strip())
+    return {m.group(1).lower(): next((g for g in m.groups()[1:] if g is not None), '')
+            for m in ATTR_RE.finditer(body)}
+
+
+def is_local(url):
+    return not re.match(r'^(?:[a-z][a-z0-9+.-]*:|//)', url, re.I) and '?' not in url and '#' not in url
+
+
+def find_assets(html):
+    """(start, end, kind, url, other_attributes) for each local script/stylesheet tag, in order"""
+    found = []
+    for match in SCRIPT_RE.finditer(html):
+        url = match.group(2)
+        if is_local(url):
+            attrs = parse_attributes(match.group(1) + match.group(3))
+            found.append((match.start(), match.end(), 'js', url, tuple(sorted(attrs.items()))))
+    for match in LINK_RE.finditer(html):
+        attrs = parse_attributes(match.group(0))
+        url = attrs.pop('href', '')
+        if attrs.get('rel', '').lower() == 'stylesheet' and is_local(url):
+            found.append((match.start(), match.end(), 'css', url, tuple(sorted(attrs.items()))))
+    return sorted(found)
+
+
+def group_assets(html, assets):
+    """Split tags into runs that can share a bundle"""
+    groups = []
+    for asset in assets:
+        previous = groups[-1][-1] if groups else None
+        if (previous and previous[2:3] == asset[2:3] and previous[4] == asset[4]
+                and GAP_RE.match(html[previous[1]:asset[0]])):
+            groups[-1].append(asset)
+        else:
+            groups.append([asset])
+    return groups
+
+
+class AssetBuilder:
+    """Builds fingerprinted bundles and rewrites pages; bundles are shared across pages"""
+
+    def __init__(self, source, output, images=False, image_cache=IMAGE_CACHE, image_workers=None):
+        self.source = os.path.abspath(source)
+        self.output = os.path.abspath(output)
+        self.images = images
+        self.image_cache = image_cache
+        self.image_workers = image_workers
+        self.bundles = {}  # tuple of member paths -> bundle path
+        self.minified = {}  # member path -> minified text
+        self.responsive = {}  # image name under IMAGE_DIR -> srcset data
+        self.report = {'pages': {}, 'bundles': {}}
+
+    def resolve(self, page, url):
+        """Path of a referenced asset relative to the source root"""
+        base = '' if url.startswith('/') else os.path.dirname(page)
+        return os.path.normpath(os.path.join(base, url.lstrip('/'))).replace(os.sep, '/')
+
+    def member_text(self, path):
+        if path not in self.minified:
+            with open(os.path.join(self.source, path), encoding='utf-8') as f:
+                text = f.read()
+            self.minified[path] = MINIFIERS[os.path.splitext(path)[1]](text)
+        return self.minified[path]
+
+    def bundle(self, members, kind):
+        """Write (once) the bundle for these member files and return its path"""
+        key = tuple(members)
+        if key not in self.bundles:
+            separator = '\n' if kind == 'css' else ';\n'
+            text = separator.join(self.member_text(path).rstrip('\n;') for path in members) + '\n'
+            data = text.encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+            stem = '-'.join(os.path.splitext(os.path.basename(path))[0] for path in members)
+            path = f'{BUNDLE_DIR}/{stem}.{digest}.{kind}'
+            target = os.path.join(self.output, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            original = sum(os.path.getsize(os.path.join(self.source, m)) for m in members)
+            self.report['bundles'][path] = {'members': list(members), 'bytes': len(data), 'source_bytes': original}
+            self.bundles[key] = path
+        return self.bundles[key]
+
+    def picture(self, page, tag):
+        """<picture> replacement for an <img> of a derived image, or None to keep the tag"""
+        attrs = parse_attributes(tag)
+        url = attrs.pop('src', '')
+        if not is_local(url):
+            return None
+        directory, name = os.path.split(self.resolve(page, url))
+        image = self.responsive.get(name) if directory == IMAGE_DIR else None
+        if image is None:
+            return None
+        sizes = attrs.pop('sizes', DEFAULT_SIZES)
+        attrs.pop('srcset', None)
+        sources = ''.join(f'<source type="{mime}" srcset="{srcset}" sizes="{sizes}" />'
+                          for mime, srcset in image['srcset'].items() if mime != image['fallback_type'])
+        rest = ''.join(f' {k}="{v}"' if v else f' {k}' for k, v in attrs.items())
+        fallback = (f'<img src="{image["fallback"]}" srcset="{image["srcset"][image["fallback_type"]]}"'
+                    f' sizes="{sizes}"{rest} />')
+        return f'<picture>{sources}{fallback}</picture>'
+
+    def rewrite_images(self, page, html):
+        """Swap <img> tags of derived images for <picture>; returns (html, count)"""
+        count = 0
+
+        def replace(match):
+            nonlocal count
+            picture = self.picture(page, match.group(0))
+            if picture is None:
+                return match.group(0)
+            count += 1
+            return picture
+
+        return IMG_RE.sub(replace, html), count
+
+    def rewrite_page(self, page):
+        with open(os.path.join(self.source, page), encoding='utf-8') as f:
+            html = f.read()
+        images = 0
+        if self.responsive:
+            html, images = self.rewrite_images(page, html)
+        groups = group_assets(html, find_assets(html))
+        requests_before = sum(len(group) for group in groups)
+        pieces = []
+        position = 0
+        for group in groups:
+            kind = group[0][2]
+            members = [self.resolve(page, asset[3]) for asset in group]
+            if not all(os.path.isfile(os.path.join(self.source, m)) for m in members):
+                continue  # leave references to missing files alone
+            url = '/' + self.bundle(members, kind)
+            attrs = ''.join(f' {k}="{v}"' if v else f' {k}' for k, v in group[0][4])
+            if kind == 'js':
+                tag = f'<script src="{url}"{attrs}></script>'
+            else:
+                tag = f'<link href="{url}"{attrs} />'
+            pieces.append(html[position:group[0][0]])
+            pieces.append(tag)
+            position = group[-1][1]
+        pieces.append(html[position:])
+        with open(os.path.join(self.output, page), 'w', encoding='utf-8') as f:
+            f.write(''.join(pieces))
+        self.report['pages'][page] = {'requests_before': requests_before, 'requests_after': len(groups),
+                                      'responsive_images': images}
+
+    def build(self):
+        if os.path.isdir(self.output):
+            shutil.rmtree(self.output)
+        shutil.copytree(self.source, self.output,
+                        ignore=shutil.ignore_patterns('.*', '__pycache__'))
+        if self.images and os.path.isdir(os.path.join(self.source, IMAGE_DIR)):
+            self.responsive, rebuilt = build_images(
+                os.path.join(self.source, IMAGE_DIR), os.path.join(self.output, RESPONSIVE_DIR),
+                self.image_cache, workers=self.image_workers, url_prefix=f'/{RESPONSIVE_DIR}/')
+            self.report['images'] = {'sources': len(self.responsive), 'rebuilt': rebuilt}
+        for directory, subdirs, files in os.walk(self.source):
+            subdirs[:] = [d for d in subdirs if not d.startswith('.') and d != '__pycache__']
+            for name in files:
+                if name.endswith('.html'):
+                    page = os.path.relpath(os.path.join(directory, name), self.source).replace(os.sep, '/')
+                    self.rewrite_page(page)
+        os.makedirs(os.path.join(self.output, BUNDLE_DIR), exist_ok=True)
+        with open(os.path.join(self.output, BUNDLE_DIR, 'manifest.json'), 'w') as f:
+            json.dump(self.report, f, indent=2, sort_keys=True)
+        return self.report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Minify, bundle and fingerprint the client assets')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='Client directory to build')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Where to write the built client')
+    parser.add_argument('--no-images', action='store_true', help='Skip responsive image derivatives')
+    parser.add_argument('--image-cache', default=IMAGE_CACHE, help='Derivative cache kept between builds')
+    args = parser.parse_args()
+
+    report = AssetBuilder(args.source, args.output, images=not args.no_images, image_cache=args.image_cache).build()
+    before = sum(page['requests_before'] for page in report['pages'].values())
+    after = sum(page['requests_after'] for page in report['pages'].values())
+    source_bytes = sum(b['source_bytes'] for b in report['bundles'].values())
+    built_bytes = sum(b['bytes'] for b in report['bundles'].values())
+    for path, bundle in sorted(report['bundles'].items()):
+        print(f"  {path:50} {bundle['source_bytes']:>8} -> {bundle['bytes']:>8} bytes")
+    print(f"Built {len(report['pages'])} pages into {args.output}")
+    print(f"Local CSS/JS requests: {before} -> {after}; bytes: {source_bytes} -> {built_bytes}")
+    if 'images' in report:
+        rewritten = sum(page['responsive_images'] for page in report['pages'].values())
+        print(f"Responsive images: {report['images']['sources']} sources "
+              f"({report['images']['rebuilt']} re-encoded), {rewritten} <img> tags rewritten")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Responsive image derivatives.
+
+Every raster image under client/assets/img is resized to a few widths and
+encoded as AVIF, WebP and JPEG (PNG for images with transparency), so browsers
+can download the smallest file that fits the screen instead of the full-size
+original. Derivatives are written as <name>-<width>.<source hash>.<ext>, which
+the static server caches as immutable.
+
+Results are cached on disk under a key made of the source's SHA-256 and the
+encoding settings: unchanged images are never re-encoded, and sources are
+processed in parallel across cores. A responsive.json next to the output maps
+each source path to its srcset strings; build_assets.py uses it to turn
+<img> tags into <picture> elements.
+
+Usage:
+    python build_images.py                                  # into build/client/assets/img/responsive
+    python build_images.py --widths 480,960 --workers 4
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SOURCE = os.path.join(REPO_DIR, 'client', 'assets', 'img')
+DEFAULT_OUTPUT = os.path.join(REPO_DIR, 'build', 'client', 'assets', 'img', 'responsive')
+DEFAULT_CACHE = os.path.join(REPO_DIR, 'build', 'image-cache')
+# 160 covers avatars and thumbnails shown around 50-60 CSS px, up to 3x screens
+DEFAULT_WIDTHS = (160, 320, 640, 960, 1280)
+
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.avif')
+# format -> (Pillow format, extension, MIME type, save options)
+ENCODINGS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 75, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'png', 'image/png', {'optimize': True}),
+}
+# Bump when the encoding logic changes so cached derivatives are rebuilt
+PIPELINE_VERSION = 1
+
+
+def available_formats(has_alpha):
+    """Modern formats first, then a fallback every browser can show"""
+    formats = [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+    return formats + ['png' if has_alpha else 'jpeg']
+
+
+def cache_key(data, widths):
+    settings = json.dumps([PIPELINE_VERSION, list(widths), ENCODINGS], sort_keys=True, default=str)
+    return hashlib.sha256(data + settings.encode('utf-8')).hexdigest()
+
+
+def target_widths(source_width, widths):
+    """Requested widths below the source's, plus the source width if it is smaller than the largest"""
+    chosen = [w for w in widths if w < source_width]
+    if not chosen or max(widths) > source_width:
+        chosen.append(source_width)
+    return sorted(set(chosen))
+
+
+def render_derivatives(source_path, name, key, widths, cache_dir):
+    """Worker: decode one source and write every width/format into cache_dir/key"""
+    directory = os.path.join(cache_dir, key)
+    os.makedirs(directory, exist_ok=True)
+    with Image.open(source_path) as image:
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        source_width, source_height = image.size
+        largest = max(target_widths(source_width, widths))
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, much cheaper than a full-size decode
+        image.draft('RGB', (largest, max(source_height * largest // source_width, 1)))
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    stem = os.path.splitext(name)[0]
+    variants = []
+    for width in target_widths(source_width, widths):
+        height = max(round(source_height * width / source_width), 1)
+        resized = image if image.size == (width, height) else image.resize((width, height), Image.LANCZOS)
+        for fmt in available_formats(has_alpha):
+            pil_format, ext, mime, options = ENCODINGS[fmt]
+            filename = f'{stem}-{width}.{key[:10]}.{ext}'
+            frame = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            frame.save(os.path.join(directory, filename), pil_format, **options)
+            variants.append({'file': filename, 'width': width, 'height': height, 'type': mime,
+                             'bytes': os.path.getsize(os.path.join(directory, filename))})
+
+    meta = {'source_width': source_width, 'source_height': source_height, 'variants': variants}
+    # Written last: a directory without meta.json is an interrupted build and is redone
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def build_images(source_dir=DEFAULT_SOURCE, output_dir=DEFAULT_OUTPUT, cache_dir=DEFAULT_CACHE,
+                 widths=DEFAULT_WIDTHS, workers=None, url_prefix='/assets/img/responsive/'):
+    """Generate (or reuse) derivatives for every source image
+
+    Returns (images, rebuilt): images maps each source name (relative to
+    source_dir) to its size, per-type srcset strings and a fallback URL, and is
+    also written to output_dir/responsive.json; rebuilt counts the sources
+    that had to be encoded.
+    """
+    sources = {}
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if os.path.isfile(path) and name.lower().endswith(SOURCE_EXTENSIONS):
+            with open(path, 'rb') as f:
+                sources[name] = (path, cache_key(f.read(), widths))
+
+    metas = {}
+    stale = {}
+    for name, (path, key) in sources.items():
+        meta_path = os.path.join(cache_dir, key, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                metas[name] = json.load(f)
+        else:
+            stale[name] = (path, key)
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            futures = {name: executor.submit(render_derivatives, path, name, key, tuple(widths), cache_dir)
+                       for name, (path, key) in stale.items()}
+            for name, future in futures.items():
+                metas[name] = future.result()
+
+    os.makedirs(output_dir, exist_ok=True)
+    images = {}
+    for name, meta in metas.items():
+        key = sources[name][1]
+        srcset = {}
+        for variant in meta['variants']:
+            shutil.copyfile(os.path.join(cache_dir, key, variant['file']), os.path.join(output_dir, variant['file']))
+            srcset.setdefault(variant['type'], []).append(f"{url_prefix}{variant['file']} {variant['width']}w")
+        fallback_type = list(srcset)[-1]
+        largest = max(v['width'] for v in meta['variants'])
+        fallback = next(v for v in meta['variants'] if v['type'] == fallback_type and v['width'] == largest)
+        images[name] = {
+            'width': meta['source_width'],
+            'height': meta['source_height'],
+            'srcset': {mime: ', '.join(entries) for mime, entries in srcset.items()},
+            'fallback': url_prefix + fallback['file'],
+            'fallback_type': fallback_type,
+            'source_bytes': os.path.getsize(sources[name][0]),
+            'smallest_bytes': min(v['bytes'] for v in meta['variants']),
+        }
+
+    with open(os.path.join(output_dir, 'responsive.json'), 'w') as f:
+        json.dump({'images': images, 'stats': {'sources': len(sources), 'rebuilt': len(stale)}},
+                  f, indent=2, sort_keys=True)
+    return images, len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate responsive image derivatives')
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='Directory of source images')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Where to write the derivatives')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help='Content-hash keyed derivative cache')
+    parser.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)), help='Comma-separated widths')
+    parser.add_argument('--workers', type=int, help='Encoding processes (default: CPU count)')
+    args = parser.parse_args()
+
+    widths = tuple(int(w) for w in args.widths.split(','))
+    images, rebuilt = build_images(args.source, args.output, args.cache, widths, args.workers)
+    for name, image in images.items():
+        print(f"  {name:28} {image['source_bytes']:>9} bytes -> {image['smallest_bytes']:>7} bytes (smallest variant)")
+    print(f"{len(images)} images, {rebuilt} rebuilt, written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
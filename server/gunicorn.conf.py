@@ -0,0 +1,68 @@
+"""
+gunicorn settings for the auth server.
+
+    cd server
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Worker counts follow the CPU count: bcrypt is the bottleneck and it already
+runs on a per-worker thread pool, so more processes than cores only adds
+memory, while a few threads per worker cover requests waiting on the
+database. Override with GUNICORN_WORKERS / GUNICORN_THREADS.
+
+The app is preloaded: bcrypt calibration, the static manifest and the
+imports happen once in the master and forked workers share that memory.
+`kill -HUP <master>` replaces the workers gracefully (in-flight requests
+finish, up to graceful_timeout); because of preloading it does not pick up
+new code -- restart the master, or `kill -USR2` then `-TERM` the old one,
+for that.
+
+Behind a reverse proxy (the usual setup), set TRUSTED_PROXIES to the number
+of proxies in front of gunicorn, e.g. TRUSTED_PROXIES=1 for a single nginx.
+Otherwise every request appears to come from the proxy's address: all
+clients share one rate-limit bucket and the auth event log records the
+proxy. Leave it at 0 when clients connect directly, or they could spoof
+X-Forwarded-For.
+"""
+
+import os
+import tempfile
+
+cpu_count = os.cpu_count() or 1
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('GUNICORN_WORKERS', max(cpu_count, 2)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+# Split the cores between the workers' bcrypt pools instead of giving each worker all of them
+os.environ.setdefault('BCRYPT_POOL_WORKERS', str(max(cpu_count // workers, 1)))
+# Calibrate the bcrypt cost once, here in the master, so every worker hashes at the same cost
+if os.getenv('BCRYPT_ROUNDS', 'auto') == 'auto':
+    from hashing import calibrate_rounds
+    os.environ['BCRYPT_ROUNDS'] = str(calibrate_rounds(float(os.getenv('BCRYPT_TARGET_MS', 250))))
+    print(f"bcrypt cost calibrated to {os.environ['BCRYPT_ROUNDS']}; "
+          f"set BCRYPT_ROUNDS={os.environ['BCRYPT_ROUNDS']} to keep it across restarts and hosts", flush=True)
+# Workers record metrics in files here, so /metrics on any worker reports all of them.
+# Set before the app (and prometheus_client) is preloaded; a fresh directory per master.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='usiu-metrics-'))
+
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+# Recycle workers now and then, staggered so they never restart together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from wsgi import after_fork
+    after_fork()
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's in-flight gauge; its counters stay in the totals
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,224 @@
+"""
+Password hashing off the request threads.
+
+bcrypt is deliberately slow (~250ms per call), so hashing and verification run
+on a small dedicated thread pool with a bounded queue. When the pool is full,
+new work is rejected straight away with PasswordPoolBusy and the API answers
+503 + Retry-After, instead of every request queueing behind a login burst.
+bcrypt releases the GIL while hashing, so the threads run in parallel.
+
+The bcrypt cost is either fixed (BCRYPT_ROUNDS) or calibrated at startup so
+one hash takes about BCRYPT_TARGET_MS on this machine; hashes stored at a
+lower cost are upgraded the next time their owner logs in. Hashes at a higher
+cost are left alone, so processes that settled on different costs never undo
+each other's upgrades. Production should still run one cost everywhere:
+gunicorn.conf.py calibrates once in the master, and several hosts should pin
+BCRYPT_ROUNDS.
+
+Run `python hashing.py` to print the time per hash at each cost.
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+MIN_ROUNDS = 10
+MAX_ROUNDS = 16
+DEFAULT_ROUNDS = 12
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when the hashing pool cannot accept more work"""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing pool is saturated')
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """Size-limited executor for bcrypt hash/verify calls"""
+
+    def __init__(self, workers=None, queue_size=16):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._listeners = []
+        self.rounds = DEFAULT_ROUNDS
+        self.configure(workers, queue_size)
+
+    def init_app(self, app):
+        """Configure the pool and bcrypt cost from the BCRYPT_* settings"""
+        self.configure(app.config.get('BCRYPT_POOL_WORKERS'), app.config.get('BCRYPT_POOL_QUEUE', 16))
+        rounds = str(app.config.get('BCRYPT_ROUNDS', DEFAULT_ROUNDS))
+        if rounds == 'auto':
+            self.rounds = calibrate_rounds(app.config.get('BCRYPT_TARGET_MS', 250))
+        else:
+            self.rounds = int(rounds)
+
+    def configure(self, workers=None, queue_size=16):
+        """(Re)size the pool; work already submitted finishes on the old executor"""
+        with self._lock:
+            old_executor = self._executor
+            self.workers = max(int(workers or os.cpu_count() or 2), 1)
+            self.queue_size = max(int(queue_size), 0)
+            self._executor = None
+            # One slot per running or queued task; acquiring never blocks
+            self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+            self._reset_stats()
+        if old_executor is not None:
+            old_executor.shutdown(wait=False)
+
+    def _reset_stats(self):
+        self.in_flight = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.service_seconds_total = 0.0
+
+    def _get_executor(self):
+        # Created lazily so importing the app never starts threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def add_listener(self, listener):
+        """Call listener(func_name, wait_seconds, service_seconds) after every task"""
+        self._listeners.append(listener)
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: time to drain the current queue"""
+        with self._lock:
+            avg_service = self.service_seconds_total / self.completed if self.completed else 0.25
+            backlog = self.in_flight / self.workers
+        return max(int(math.ceil(backlog * avg_service)), 1)
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool, or raise PasswordPoolBusy if it is full"""
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordPoolBusy(self.retry_after())
+
+        enqueued = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    wait = started - enqueued
+                    self.wait_seconds_total += wait
+                    self.wait_seconds_max = max(self.wait_seconds_max, wait)
+                    self.service_seconds_total += finished - started
+                for listener in self._listeners:
+                    listener(func.__name__, started - enqueued, finished - started)
+
+        try:
+            return self._get_executor().submit(task).result()
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            slots.release()
+
+    def hash(self, password, rounds=None):
+        """Hash a password with a fresh salt at the current (or given) bcrypt cost"""
+        salt = bcrypt.gensalt(rounds or self.rounds)
+        return self.run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made at a lower cost than the current one"""
+        return (hash_rounds(password_hash) or 0) < self.rounds
+
+    def verify(self, password, password_hash):
+        """Check a password against a stored bcrypt hash"""
+        return self.run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def stats(self):
+        """Queue depth and wait/service times for health checks and metrics"""
+        with self._lock:
+            completed = self.completed
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'running': self.running,
+                'queued': self.in_flight - self.running,
+                'completed': completed,
+                'rejected': self.rejected,
+                'wait_ms_avg': round(self.wait_seconds_total / completed * 1000, 2) if completed else 0.0,
+                'wait_ms_max': round(self.wait_seconds_max * 1000, 2),
+                'service_ms_avg': round(self.service_seconds_total / completed * 1000, 2) if completed else 0.0,
+            }
+
+
+def hash_rounds(password_hash):
+    """Cost factor encoded in a bcrypt hash ('$2b$12$...' -> 12)"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def time_hash(rounds, samples=1):
+    """Best-of-`samples` seconds for one bcrypt hash at the given cost"""
+    salt = bcrypt.gensalt(rounds)
+    best = None
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration-password', salt)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def calibrate_rounds(target_ms, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS):
+    """Highest cost whose hash time stays within target_ms on this machine
+
+    Each extra round doubles the work, so a single measurement at min_rounds
+    is enough to extrapolate; startup only pays for two cheap hashes.
+    """
+    baseline_ms = time_hash(min_rounds, samples=2) * 1000
+    if baseline_ms <= 0:
+        return max_rounds
+    extra = int(math.floor(math.log2(float(target_ms) / baseline_ms))) if target_ms > baseline_ms else 0
+    return max(min_rounds, min(max_rounds, min_rounds + extra))
+
+
+# Shared pool used by User.set_password / User.check_password
+password_pool = PasswordHasher()
+
+
+def main():
+    """Print time per hash at each bcrypt cost and the cost auto-calibration would pick"""
+    parser = argparse.ArgumentParser(description='Benchmark bcrypt cost factors on this machine')
+    parser.add_argument('--min-rounds', type=int, default=8, help='Lowest cost to time')
+    parser.add_argument('--max-rounds', type=int, default=14, help='Highest cost to time')
+    parser.add_argument('--samples', type=int, default=3, help='Hashes per cost (best is reported)')
+    parser.add_argument('--target-ms', type=float, default=250, help='Target hash latency for calibration')
+    args = parser.parse_args()
+
+    print(f"{'cost':>6} {'ms/hash':>10} {'hashes/s/core':>15}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        elapsed = time_hash(rounds, args.samples)
+        print(f"{rounds:>6} {elapsed * 1000:>10.1f} {1 / elapsed:>15.1f}")
+    print(f"\nCalibrated cost for a {args.target_ms:g}ms target: {calibrate_rounds(args.target_ms)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Bulk user import.
+
+Loads large rosters (tens of thousands of students) from CSV or NDJSON without
+the per-row cost of the API: records are streamed, existing emails are checked
+one chunk at a time with a single IN query, passwords are bcrypt-hashed across
+a process pool, and each chunk is inserted with one executemany in its own
+transaction.
+
+After every committed chunk the number of input rows consumed is written to a
+checkpoint file, so an interrupted import can be re-run with --resume and picks
+up where it stopped. Rows committed just before a crash are detected by the
+existing-email check and skipped, so resuming never creates duplicates.
+
+Usage:
+    python import_users.py students.csv
+    python import_users.py students.ndjson --chunk-size 2000 --workers 8
+    python import_users.py students.csv --resume
+
+Records need email, password, firstName and lastName (first_name/last_name
+are accepted too); an optional role is 'user' (the default) or 'admin'.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import bcrypt
+
+from models import db, User, ROLES
+
+FIELD_ALIASES = {
+    'firstName': ('firstName', 'first_name'),
+    'lastName': ('lastName', 'last_name'),
+}
+
+
+def read_records(path, fmt=None):
+    """Stream dicts from a CSV (with a header row) or NDJSON file"""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def normalize(record):
+    """User column values for a record, or None if a required field is missing"""
+    values = {
+        'email': (record.get('email') or '').strip().lower(),
+        'password': record.get('password') or '',
+    }
+    for field, aliases in FIELD_ALIASES.items():
+        values[field] = next((record[a].strip() for a in aliases if record.get(a)), '')
+    if not all(values.values()):
+        return None
+    values['role'] = (record.get('role') or 'user').strip().lower()
+    if values['role'] not in ROLES:
+        return None
+    return values
+
+
+def _hash_password(args):
+    # Module-level so worker processes can unpickle it
+    password, rounds = args
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+class ImportStats:
+    """Running totals for an import, printable as a progress line"""
+
+    def __init__(self, already_done=0):
+        self.rows = already_done
+        self.imported = 0
+        self.existing = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.started = time.perf_counter()
+        self.already_done = already_done
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return (self.rows - self.already_done) / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'existing': self.existing,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+    def __str__(self):
+        return (f"{self.rows} rows: {self.imported} imported, {self.existing} existing, "
+                f"{self.duplicates} duplicate, {self.invalid} invalid ({self.rows_per_second:.0f} rows/sec)")
+
+
+def load_checkpoint(path):
+    """Input rows already consumed by a previous run (0 if there is no checkpoint)"""
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f).get('rows_done', 0)
+
+
+def save_checkpoint(path, stats):
+    # Write-then-rename so a crash never leaves a truncated checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(stats.as_dict(), rows_done=stats.rows, updated_at=datetime.utcnow().isoformat()), f)
+    os.replace(tmp_path, path)
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_users(records, chunk_size=1000, workers=None, rounds=None,
+                 checkpoint=None, resume=False, progress=None):
+    """Insert users from an iterable of dicts; must run inside an app context
+
+    Returns the ImportStats. `progress`, if given, is called with the stats
+    after every committed chunk.
+    """
+    from hashing import password_pool
+
+    rounds = rounds or password_pool.rounds
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+    skip = load_checkpoint(checkpoint) if resume else 0
+    stats = ImportStats(already_done=skip)
+    seen = set()
+    table = User.__table__
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for chunk in _chunks(records, chunk_size):
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            chunk, skip = chunk[skip:], 0
+
+            candidates = []
+            for record in chunk:
+                values = normalize(record)
+                if values is None:
+                    stats.invalid += 1
+                elif values['email'] in seen:
+                    stats.duplicates += 1
+                else:
+                    seen.add(values['email'])
+                    candidates.append(values)
+
+            # One IN query per chunk instead of one lookup per row
+            emails = [values['email'] for values in candidates]
+            existing = {email for (email,) in db.session.query(User.email).filter(User.email.in_(emails))} \
+                if emails else set()
+            new = [values for values in candidates if values['email'] not in existing]
+            stats.existing += len(candidates) - len(new)
+
+            jobs = [(values['password'], rounds) for values in new]
+            if executor is not None:
+                hashes = list(executor.map(_hash_password, jobs, chunksize=max(len(jobs) // (workers * 4), 1)))
+            else:
+                hashes = [_hash_password(job) for job in jobs]
+
+            if new:
+                now = datetime.utcnow()
+                db.session.execute(table.insert(), [{
+                    'email': values['email'],
+                    'first_name': values['firstName'],
+                    'last_name': values['lastName'],
+                    'password_hash': password_hash,
+                    'role': values['role'],
+                    'created_at': now,
+                    'updated_at': now,
+                } for values, password_hash in zip(new, hashes)])
+            db.session.commit()
+
+            stats.imported += len(new)
+            stats.rows += len(chunk)
+            if checkpoint:
+                save_checkpoint(checkpoint, stats)
+            if progress:
+                progress(stats)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import users from CSV or NDJSON')
+    parser.add_argument('path', help='CSV (with header) or NDJSON file')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='Input format (default: from extension)')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per IN check and insert transaction')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Hashing processes')
+    parser.add_argument('--rounds', type=int, help='bcrypt cost (default: the server setting)')
+    parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+    parser.add_argument('--resume', action='store_true', help='Skip rows consumed by a previous run')
+    args = parser.parse_args()
+
+    from app import app
+
+    checkpoint = args.checkpoint or args.path + '.checkpoint'
+    with app.app_context():
+        db.create_all()
+        stats = import_users(
+            read_records(args.path, args.format),
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            rounds=args.rounds,
+            checkpoint=checkpoint,
+            resume=args.resume,
+            progress=lambda s: print(f"  {s}", flush=True),
+        )
+    print(f"Import finished: {stats}")
+    print(f"Checkpoint: {checkpoint}")
+
+
+if __name__ == '__main__':
+    main()
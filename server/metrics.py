@@ -0,0 +1,169 @@
+"""
+Prometheus metrics for the auth server, on prometheus_client.
+
+RequestMetrics hooks every request (latency histogram and status counter
+per route, plus an in-flight gauge), times each SQL statement through
+SQLAlchemy cursor events and each bcrypt call through a hashing pool
+listener. Other modules declare their own metrics with the prometheus_client
+classes re-exported here (the outbox and the auth event recorder do).
+
+Under gunicorn, gunicorn.conf.py points PROMETHEUS_MULTIPROC_DIR at a
+directory shared by the workers: each worker writes its samples there and a
+scrape of any worker returns the totals for all of them. Without it (the
+development server, tests) the process registry is used directly.
+
+usiu_component_state (pool queue, blocklist, cache and limiter sizes) is
+read at scrape time from the worker answering the scrape.
+"""
+
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               disable_created_metrics, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+
+__all__ = ['CONTENT_TYPE', 'Counter', 'Gauge', 'Histogram', 'render', 'request_metrics']
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# The *_created series double the output and nothing here graphs them
+disable_created_metrics()
+
+# Seconds; from a cached profile lookup (~1ms) to a queued bcrypt login
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# SQL statements are usually well under a millisecond on SQLite
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+
+REQUEST_SECONDS = Histogram('usiu_http_request_duration_seconds', 'Request latency by route',
+                            ['method', 'route'], buckets=DEFAULT_BUCKETS)
+REQUESTS_TOTAL = Counter('usiu_http_requests_total', 'Requests by route and status code',
+                         ['method', 'route', 'status'])
+# livesum: the sum over running workers, so a dead worker's requests do not linger
+REQUESTS_IN_FLIGHT = Gauge('usiu_http_requests_in_flight', 'Requests currently being handled',
+                           multiprocess_mode='livesum')
+HASH_SECONDS = Histogram('usiu_password_hash_seconds', 'bcrypt time per call by operation',
+                         ['operation'], buckets=DEFAULT_BUCKETS)
+HASH_WAIT_SECONDS = Histogram('usiu_password_hash_wait_seconds', 'Time bcrypt calls waited for a pool thread',
+                              ['operation'], buckets=DEFAULT_BUCKETS)
+QUERY_SECONDS = Histogram('usiu_db_query_duration_seconds', 'SQL statement time by statement type',
+                          ['operation'], buckets=QUERY_BUCKETS)
+
+# bcrypt callables -> operation label
+HASH_OPERATIONS = {'hashpw': 'hash', 'checkpw': 'verify'}
+
+
+class ComponentState(Collector):
+    """usiu_component_state, computed from registered functions when scraped"""
+
+    def __init__(self):
+        self.functions = {}
+
+    def collect(self):
+        family = GaugeMetricFamily('usiu_component_state', 'Sizes and queue depths of in-process components',
+                                   labels=['component'])
+        for name, function in sorted(self.functions.items()):
+            try:
+                family.add_metric([name], function())
+            except Exception:
+                continue  # a broken source must not take /metrics down
+        yield family
+
+
+component_state = ComponentState()
+
+
+def multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def render():
+    """Every metric in Prometheus text format, summed over workers in multiprocess mode"""
+    if multiprocess_dir():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(component_state)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
+
+
+class RequestMetrics:
+    """Wires the server metrics into an app's request hooks and database engine"""
+
+    def __init__(self):
+        self._registered = False
+
+    def init_app(self, app, engine, password_pool=None, gauges=None):
+        """Install request hooks and SQL timers; `gauges` maps a component name to a function"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _query_failed)
+
+        if password_pool is not None:
+            password_pool.add_listener(_observe_hash)
+        component_state.functions.update(gauges or {})
+        if not self._registered and not multiprocess_dir():
+            REGISTRY.register(component_state)
+            self._registered = True
+
+    @staticmethod
+    def _route():
+        rule = request.url_rule
+        return rule.rule if rule is not None else 'unmatched'
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            self._record(started, response.status_code)
+        return response
+
+    def _teardown_request(self, exc):
+        # after_request is skipped when a view raises; count the request as a 500
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            self._record(started, 500)
+
+    def _record(self, started, status):
+        route = self._route()
+        REQUESTS_IN_FLIGHT.dec()
+        REQUEST_SECONDS.labels(method=request.method, route=route).observe(time.perf_counter() - started)
+        REQUESTS_TOTAL.labels(method=request.method, route=route, status=status).inc()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if starts:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        QUERY_SECONDS.labels(operation=operation).observe(time.perf_counter() - starts.pop())
+
+
+def _query_failed(exception_context):
+    connection = exception_context.connection
+    starts = connection.info.get('metrics_query_start') if connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _observe_hash(name, wait, service):
+    operation = HASH_OPERATIONS.get(name, name)
+    HASH_SECONDS.labels(operation=operation).observe(service)
+    HASH_WAIT_SECONDS.labels(operation=operation).observe(wait)
+
+
+request_metrics = RequestMetrics()
@@ -1,45 +1,110 @@
 from flask_sqlalchemy import SQLAlchemy
-from flask_marshmallow import Marshmallow
 from datetime import datetime
-import bcrypt
+
+from hashing import password_pool
 
 db = SQLAlchemy()
-ma = Marshmallow()
+
+ROLES = ('user', 'admin')
 
 class User(db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
+    # Keyset pagination of the admin listing walks these newest-first
+    __table_args__ = (
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+        db.Index('ix_users_role_created_at_id', 'role', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(100), nullable=False)
     last_name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
-    reset_token = db.Column(db.String(255), nullable=True)
-    reset_token_expiry = db.Column(db.DateTime, nullable=True)
+    role = db.Column(db.String(20), nullable=False, default='user', server_default='user')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def set_password(self, password):
-        """Hash password using bcrypt"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Hash password using bcrypt (on the bounded hashing pool)"""
+        self.password_hash = password_pool.hash(password)
     
     def check_password(self, password):
-        """Verify password against hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify password against hash (on the bounded hashing pool)"""
+        return password_pool.verify(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        """True if the stored hash uses a lower bcrypt cost than the current target"""
+        return password_pool.needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.email}>'
 
 
-class UserSchema(ma.SQLAlchemyAutoSchema):
-    """Marshmallow schema for User serialization"""
-    class Meta:
-        model = User
-        load_instance = True
-        exclude = ('password_hash', 'reset_token', 'reset_token_expiry')
+class RevokedToken(db.Model):
+    """JWT revoked at logout, kept until the token would have expired anyway"""
+    __tablename__ = 'revoked_tokens'
+    # AUTOINCREMENT keeps ids monotonic after pruning, so workers can sync by id
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti}>'
+
+
+class PasswordResetToken(db.Model):
+    """Outstanding password reset; only a SHA-256 of the emailed token is stored"""
+    __tablename__ = 'password_reset_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<PasswordResetToken user={self.user_id}>'
+
+
+class OutboxEmail(db.Model):
+    """Email waiting for (or done with) delivery by the outbox dispatcher"""
+    __tablename__ = 'outbox_emails'
+    # The dispatcher's claim query: pending rows that are due, oldest first
+    __table_args__ = (db.Index('ix_outbox_emails_status_next_attempt', 'status', 'next_attempt_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # When the row may next be claimed: due time, or the end of a dispatcher's lease
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status} to={self.to_address}>'
 
 
-# Schema instances
-user_schema = UserSchema()
-users_schema = UserSchema(many=True)
+class AuthEvent(db.Model):
+    """Login, logout, registration or reset, appended in batches by the auth event recorder"""
+    __tablename__ = 'auth_events'
+    __table_args__ = (db.Index('ix_auth_events_event_created_at', 'event', 'created_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(32), nullable=False)
+    # No foreign key: the log outlives the users it mentions
+    user_id = db.Column(db.Integer)
+    email = db.Column(db.String(120))
+    ip = db.Column(db.String(45))
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AuthEvent {self.event} user={self.user_id}>'
@@ -0,0 +1,284 @@
+"""
+Transactional email outbox.
+
+Requests never talk SMTP. enqueue() adds an outbox_emails row to the
+caller's session, so the email is committed in the same transaction as
+whatever it announces (a reset token, say): both or neither. A background
+dispatcher then delivers it:
+
+- it claims up to OUTBOX_BATCH_SIZE due rows with one UPDATE, leasing them
+  for OUTBOX_LEASE_SECONDS. Dispatchers in other workers skip leased rows,
+  and a dispatcher that dies only delays its rows until the lease ends.
+- the batch is sent over one SMTP connection. The connection stays open
+  between batches and closes after MAIL_IDLE_SECONDS without mail.
+- a temporary failure (4xx or a dropped connection) is retried after
+  OUTBOX_BACKOFF_SECONDS * 2^(attempts-1), with jitter, up to
+  OUTBOX_MAX_ATTEMPTS. A permanent failure (5xx) fails the row at once.
+- the time from enqueue to the server accepting the message is recorded in
+  the usiu_email_delivery_seconds histogram.
+
+Delivery is off until MAIL_SERVER is set; queued emails wait for it.
+Sent rows are deleted after OUTBOX_RETENTION_SECONDS.
+"""
+
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from metrics import Counter, Histogram
+from models import db, OutboxEmail
+
+DELIVERY_SECONDS = Histogram('usiu_email_delivery_seconds', 'Time from enqueue to acceptance by the SMTP server',
+                             buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600))
+EMAILS_TOTAL = Counter('usiu_emails_total', 'Outbox delivery attempts by outcome', ['outcome'])
+
+# The connection broke mid-send: the message itself may be fine, so retry it
+TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+
+
+class SMTPConnection:
+    """One SMTP session reused across batches, reopened when it drops or idles out"""
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.smtp = None
+        self.last_used = 0.0
+        self.opened = 0
+
+    def get(self):
+        if self.smtp is not None and time.monotonic() - self.last_used > self.outbox.idle_seconds:
+            self.close()
+        if self.smtp is None:
+            outbox = self.outbox
+            smtp = smtplib.SMTP(outbox.server, outbox.port, timeout=outbox.timeout)
+            if outbox.use_tls:
+                smtp.starttls()
+            if outbox.username:
+                smtp.login(outbox.username, outbox.password)
+            self.smtp = smtp
+            self.opened += 1
+        self.last_used = time.monotonic()
+        return self.smtp
+
+    def discard(self):
+        """Forget a connection that failed, without talking to the server"""
+        if self.smtp is not None:
+            try:
+                self.smtp.close()
+            except OSError:
+                pass
+        self.smtp = None
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self.discard()
+
+
+class Outbox:
+    """Queues emails in the database and delivers them from a background thread"""
+
+    def __init__(self):
+        self.server = ''
+        self.port = 25
+        self.use_tls = False
+        self.username = ''
+        self.password = ''
+        self.sender = 'no-reply@usiug6.com'
+        self.timeout = 10.0
+        self.idle_seconds = 30.0
+        self.batch_size = 50
+        self.poll_seconds = 2.0
+        self.lease_seconds = 120
+        self.max_attempts = 6
+        self.backoff_seconds = 30.0
+        self.retention_seconds = 7 * 24 * 3600
+        self.connection = SMTPConnection(self)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dispatcher = None
+        self._last_prune = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        """Read the MAIL_* and OUTBOX_* settings"""
+        config = app.config
+        self.server = config.get('MAIL_SERVER', self.server)
+        self.port = config.get('MAIL_PORT', self.port)
+        self.use_tls = config.get('MAIL_USE_TLS', self.use_tls)
+        self.username = config.get('MAIL_USERNAME', self.username)
+        self.password = config.get('MAIL_PASSWORD', self.password)
+        self.sender = config.get('MAIL_SENDER', self.sender)
+        self.timeout = config.get('MAIL_TIMEOUT', self.timeout)
+        self.idle_seconds = config.get('MAIL_IDLE_SECONDS', self.idle_seconds)
+        self.batch_size = config.get('OUTBOX_BATCH_SIZE', self.batch_size)
+        self.poll_seconds = config.get('OUTBOX_POLL_SECONDS', self.poll_seconds)
+        self.lease_seconds = config.get('OUTBOX_LEASE_SECONDS', self.lease_seconds)
+        self.max_attempts = config.get('OUTBOX_MAX_ATTEMPTS', self.max_attempts)
+        self.backoff_seconds = config.get('OUTBOX_BACKOFF_SECONDS', self.backoff_seconds)
+        self.retention_seconds = config.get('OUTBOX_RETENTION_SECONDS', self.retention_seconds)
+
+    def enqueue(self, to_address, subject, body):
+        """Add an email to the session; it is queued when the caller commits"""
+        self.start(current_app._get_current_object())
+        email = OutboxEmail(to_address=to_address, subject=subject, body=body)
+        db.session.add(email)
+        return email
+
+    def wake(self):
+        """Have the dispatcher look for work now instead of at its next poll"""
+        self._wake.set()
+
+    # ============= DISPATCH =============
+
+    def claim(self, now):
+        """Lease a batch of due emails to this call; returns them oldest first"""
+        token = uuid.uuid4().hex
+        due = select(OutboxEmail.id).where(
+            OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now
+        ).order_by(OutboxEmail.next_attempt_at, OutboxEmail.id).limit(self.batch_size)
+        db.session.execute(
+            update(OutboxEmail)
+            .where(OutboxEmail.id.in_(due.scalar_subquery()), OutboxEmail.status == 'pending',
+                   OutboxEmail.next_attempt_at <= now)
+            .values(claimed_by=token, next_attempt_at=now + timedelta(seconds=self.lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboxEmail.query.filter_by(claimed_by=token, status='pending').order_by(OutboxEmail.id).all()
+
+    def message(self, email):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = email.to_address
+        message['Subject'] = email.subject
+        message.set_content(email.body)
+        return message
+
+    def dispatch_once(self):
+        """Send one batch; needs an app context. Returns counts by outcome"""
+        outcome = {'sent': 0, 'retried': 0, 'failed': 0}
+        if not self.server:
+            return outcome
+        emails = self.claim(datetime.utcnow())
+        for index, email in enumerate(emails):
+            try:
+                smtp = self.connection.get()
+            except (smtplib.SMTPException, OSError) as e:
+                # Cannot connect or log in: nothing wrong with the emails, retry them all later
+                self.connection.discard()
+                self._defer(emails[index:], f'Connecting to {self.server}: {e}', outcome)
+                break
+            try:
+                smtp.send_message(self.message(email))
+            except smtplib.SMTPRecipientsRefused as e:
+                code, reason = next(iter(e.recipients.values()))
+                self._failed_attempt(email, code, reason, outcome)
+            except smtplib.SMTPResponseException as e:
+                self._failed_attempt(email, e.smtp_code, e.smtp_error, outcome)
+                if e.smtp_code == 421:  # server is closing the connection
+                    self.connection.discard()
+            except TRANSIENT_ERRORS as e:
+                self.connection.discard()
+                self._defer(emails[index:], str(e) or type(e).__name__, outcome)
+                break
+            else:
+                email.status = 'sent'
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+                DELIVERY_SECONDS.observe((email.sent_at - email.created_at).total_seconds())
+                EMAILS_TOTAL.labels(outcome='sent').inc()
+                outcome['sent'] += 1
+        db.session.commit()
+        with self._lock:
+            self.sent += outcome['sent']
+            self.retried += outcome['retried']
+            self.failed += outcome['failed']
+        return outcome
+
+    def _failed_attempt(self, email, code, reason, outcome):
+        if isinstance(reason, bytes):
+            reason = reason.decode('utf-8', 'replace')
+        email.attempts += 1
+        email.last_error = (f'{code} {reason}' if code else str(reason))[:255]
+        permanent = code is not None and code >= 500
+        if permanent or email.attempts >= self.max_attempts:
+            email.status = 'failed'
+            EMAILS_TOTAL.labels(outcome='failed').inc()
+            outcome['failed'] += 1
+        else:
+            delay = self.backoff_seconds * 2 ** (email.attempts - 1) * random.uniform(0.8, 1.2)
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            EMAILS_TOTAL.labels(outcome='retried').inc()
+            outcome['retried'] += 1
+
+    def _defer(self, emails, reason, outcome):
+        # The first email used up an attempt; the rest wait as long without being charged one
+        self._failed_attempt(emails[0], None, reason, outcome)
+        for email in emails[1:]:
+            email.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.backoff_seconds)
+
+    def prune(self):
+        """Delete sent emails older than the retention period; returns how many"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention_seconds)
+        deleted = OutboxEmail.query.filter(OutboxEmail.status == 'sent', OutboxEmail.sent_at < cutoff) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+    def start(self, app):
+        """Start the dispatcher thread once per process (no-op while MAIL_SERVER is unset)"""
+        # Started on first use so importing the app never starts threads
+        if self._dispatcher is not None or not self.server:
+            return
+        with self._lock:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_forever, args=(app,),
+                                                    name='outbox-dispatcher', daemon=True)
+                self._dispatcher.start()
+
+    def _dispatch_forever(self, app):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            with app.app_context():
+                try:
+                    # Keep going while batches come back full
+                    while sum(self.dispatch_once().values()) >= self.batch_size:
+                        pass
+                    if time.monotonic() - self._last_prune > 600:
+                        self._last_prune = time.monotonic()
+                        self.prune()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Dispatching outbox emails failed')
+                finally:
+                    db.session.remove()
+            if self.connection.smtp is not None and time.monotonic() - self.connection.last_used > self.idle_seconds:
+                self.connection.close()
+
+    def stats(self):
+        """Delivery counters for this process and the queue depth in the database"""
+        return {
+            'enabled': bool(self.server),
+            'pending': OutboxEmail.query.filter_by(status='pending').count(),
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'smtp_connections_opened': self.connection.opened,
+        }
+
+
+outbox = Outbox()
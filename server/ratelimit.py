@@ -0,0 +1,193 @@
+"""
+Per-client rate limiting for the endpoints that spend bcrypt time.
+
+Each client IP and each email address gets a token bucket per endpoint: a
+bucket holds up to `burst` tokens, refills at `per_minute` tokens a minute, and
+every request takes one. A request that finds an empty bucket is answered 429
+with Retry-After before the view runs, so throttled clients never reach the
+hashing pool.
+
+Buckets live in a fixed-size table split into lock stripes, so concurrent
+requests for different clients rarely wait on each other. When a stripe is
+full the least recently used bucket is dropped; that only ever forgives a
+client, since a new bucket starts full.
+
+Set RATELIMIT_STORAGE_URL=redis://... to share buckets between workers (needs
+the optional `redis` package); otherwise each worker limits on its own.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, jsonify
+
+try:
+    import redis
+except ImportError:  # optional, only needed for a shared backend
+    redis = None
+
+
+class BucketStore:
+    """In-process token buckets in a fixed-size, lock-striped LRU table"""
+
+    def __init__(self, max_keys=100000, stripes=16):
+        self.stripes = max(int(stripes), 1)
+        self.max_keys = max_keys
+        self._per_stripe = max(int(max_keys) // self.stripes, 1)
+        self._buckets = [OrderedDict() for _ in range(self.stripes)]  # key -> (tokens, updated)
+        self._locks = [threading.Lock() for _ in range(self.stripes)]
+
+    def consume(self, key, per_minute, burst, now=None):
+        """Take a token from key's bucket; returns (allowed, seconds until one is available)"""
+        now = time.monotonic() if now is None else now
+        rate = per_minute / 60.0
+        index = hash(key) % self.stripes
+        buckets = self._buckets[index]
+        with self._locks[index]:
+            tokens, updated = buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+            buckets.move_to_end(key)
+            if len(buckets) > self._per_stripe:
+                buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        for lock, buckets in zip(self._locks, self._buckets):
+            with lock:
+                buckets.clear()
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._buckets)
+
+
+class RedisBucketStore:
+    """Token buckets in Redis, shared by every worker; same contract as BucketStore"""
+
+    # Refill and take atomically on the server; keys expire once they would be full again
+    SCRIPT = """
+    local burst = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+    local allowed = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_STORAGE_URL needs the redis package (pip install redis)')
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._consume = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key, per_minute, burst, now=None):
+        rate = per_minute / 60.0
+        allowed, tokens = self._consume(keys=[self.prefix + key], args=[burst, rate, now or time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + '*'))
+
+
+class RateLimiter:
+    """Token-bucket limits by client IP and by email, applied with @rate_limiter.limit()"""
+
+    def __init__(self):
+        self.enabled = True
+        self.limits = {'ip': (60, 30), 'email': (5, 5)}  # per minute, burst
+        self.store = BucketStore()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def init_app(self, app):
+        """Read the RATELIMIT_* settings and pick the bucket backend"""
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.limits = {
+            'ip': (app.config.get('RATELIMIT_IP_PER_MINUTE', 60), app.config.get('RATELIMIT_IP_BURST', 30)),
+            'email': (app.config.get('RATELIMIT_EMAIL_PER_MINUTE', 5), app.config.get('RATELIMIT_EMAIL_BURST', 5)),
+        }
+        url = app.config.get('RATELIMIT_STORAGE_URL')
+        if url:
+            self.store = RedisBucketStore(url)
+        else:
+            self.store = BucketStore(app.config.get('RATELIMIT_MAX_KEYS', 100000))
+        self.reset()
+
+    def reset(self):
+        """Refill every bucket and zero the counters"""
+        self.store.clear()
+        with self._lock:
+            self.allowed = 0
+            self.limited = 0
+
+    def check(self, scope, by_email=True):
+        """Seconds the current request must wait, or None if it may proceed"""
+        keys = [('ip', request.remote_addr or 'unknown')]
+        if by_email:
+            data = request.get_json(silent=True)
+            email = data.get('email') if isinstance(data, dict) else None
+            if isinstance(email, str) and email.strip():
+                keys.append(('email', email.strip().lower()))
+
+        retry_after = None
+        for kind, value in keys:
+            per_minute, burst = self.limits[kind]
+            allowed, wait = self.store.consume(f'{scope}:{kind}:{value}', per_minute, burst)
+            if not allowed:
+                retry_after = max(retry_after or 0.0, wait)
+        with self._lock:
+            if retry_after is None:
+                self.allowed += 1
+            else:
+                self.limited += 1
+        return retry_after
+
+    def limit(self, scope, by_email=True):
+        """Decorator answering 429 + Retry-After once a client exceeds its budget"""
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if self.enabled:
+                    retry_after = self.check(scope, by_email)
+                    if retry_after is not None:
+                        response = jsonify({'error': 'Too many requests, please try again later'})
+                        response.status_code = 429
+                        response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+                        return response
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    def stats(self):
+        """Allowed/limited counts and tracked buckets for health checks and metrics"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'buckets': len(self.store),
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,100 @@
+"""
+Password reset tokens.
+
+Reset tokens live in their own table, keyed by a SHA-256 of the token that was
+emailed, so redeeming one is a single probe on a unique index rather than a
+scan of users, and a leaked database cannot be used to reset passwords.
+SHA-256 (not bcrypt) is enough here: the tokens are 256 random bits.
+
+Expired rows are deleted by a background sweeper every RESET_TOKEN_SWEEP_SECONDS,
+so the table stays about as large as the number of resets still in flight.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, PasswordResetToken
+
+
+def hash_token(token):
+    """Hex SHA-256 of a reset token, as stored in password_reset_tokens"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class ResetTokenStore:
+    """Issues, redeems and sweeps hashed password reset tokens"""
+
+    def __init__(self, ttl=3600, sweep_interval=600):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.swept = 0
+
+    def init_app(self, app):
+        """Read RESET_TOKEN_TTL_SECONDS / RESET_TOKEN_SWEEP_SECONDS"""
+        self.ttl = app.config.get('RESET_TOKEN_TTL_SECONDS', self.ttl)
+        self.sweep_interval = app.config.get('RESET_TOKEN_SWEEP_SECONDS', self.sweep_interval)
+
+    def issue(self, user):
+        """Replace the user's outstanding resets with a new one; returns the raw token
+
+        The caller commits, together with whatever else it changed.
+        """
+        self.start_sweeper(current_app._get_current_object())
+        token = secrets.token_urlsafe(32)
+        PasswordResetToken.query.filter_by(user_id=user.id).delete(synchronize_session=False)
+        db.session.add(PasswordResetToken(
+            user_id=user.id,
+            token_hash=hash_token(token),
+            expires_at=datetime.utcnow() + timedelta(seconds=self.ttl)
+        ))
+        return token
+
+    def find(self, token):
+        """The stored reset for a raw token (expired or not), or None"""
+        return PasswordResetToken.query.filter_by(token_hash=hash_token(token)).first()
+
+    def discard(self, user_id):
+        """Drop every outstanding reset of a user (after a successful reset)"""
+        PasswordResetToken.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+
+    def sweep(self, now=None):
+        """Delete expired resets; returns how many rows were removed"""
+        deleted = PasswordResetToken.query \
+            .filter(PasswordResetToken.expires_at <= (now or datetime.utcnow())) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        self.swept += deleted
+        return deleted
+
+    def start_sweeper(self, app):
+        """Start the sweeper thread once per process (no-op if sweeping is disabled)"""
+        # Started on first use so importing the app never starts threads
+        if self._sweeper is not None or not self.sweep_interval or self.sweep_interval <= 0:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, args=(app,),
+                                                 name='reset-token-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self, app):
+        while True:
+            time.sleep(self.sweep_interval)
+            with app.app_context():
+                try:
+                    self.sweep()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Sweeping expired reset tokens failed')
+                finally:
+                    db.session.remove()
+
+
+reset_tokens = ResetTokenStore()
@@ -1,5 +1,7 @@
 from app import app, db
 from models import User
+from import_users import import_users
+from user_directory import set_role
 
 
 users = [
@@ -28,37 +30,13 @@ def seed_database():
         
         print("Starting database seeding...")
         
-        for user_data in users_data:
-            # Check if user already exists
-            existing_user = User.query.filter_by(email=user_data['email']).first()
-            
-            if existing_user:
-                print(f"User {user_data['email']} already exists.")
-                continue
-            
-            # Create new user
-            new_user = User(
-                first_name=user_data['firstName'],
-                last_name=user_data['lastName'],
-                email=user_data['email']
-            )
-            
-            # Set password
-            new_user.set_password(user_data['password'])
-            
-            # Add to database
-            db.session.add(new_user)
-            print(f"Created user: {user_data['email']} ({user_data['firstName']} {user_data['lastName']})")
-        
-        # Commit all changes
-        db.session.commit()
-        print("Database seeding completed!")
-        
-        # Show all users
-        all_users = User.query.all()
-        print(f"\nTotal users in database: {len(all_users)}")
-        for user in all_users:
-            print(f"   - {user.email} ({user.first_name} {user.last_name})")
+        # Existing emails are skipped; use import_users.py directly for large rosters
+        stats = import_users(users_data, workers=1)
+        # Skipped users still get their seeded role, e.g. the admin on an upgraded database
+        for user in users_data:
+            set_role(user['email'], user['role'])
+        print(f"Database seeding completed! {stats}")
+        print(f"\nTotal users in database: {User.query.count()}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,94 @@
+"""
+Response serialization.
+
+Model -> dict conversion goes through Serializer, which compiles its field
+mapping once into a plain function building a dict literal, so dumping an
+object costs the same as the hand-written dict it replaces, with no
+per-call schema walking. USER_SERIALIZER is the one definition of the public
+user profile, used by the auth responses, the user cache and the token claims.
+
+FastJSONProvider plugs orjson (when installed) into Flask as app.json, so
+jsonify() and request.get_json() skip the stdlib encoder. Output keeps
+Flask's conventions: sorted keys, and datetimes as HTTP dates through the
+default provider.
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib provider is used instead
+    orjson = None
+
+
+class Serializer:
+    """Maps object attributes to output keys with a function compiled once"""
+
+    def __init__(self, fields):
+        """`fields` is a sequence of (output key, attribute name) pairs"""
+        self.fields = tuple(fields)
+        for _, attribute in self.fields:
+            if not attribute.isidentifier():
+                raise ValueError(f'Not an attribute name: {attribute!r}')
+        # The same dict literal a hand-written view would build, e.g. {'id': obj.id, ...}
+        literal = '{' + ', '.join(f'{key!r}: obj.{attribute}' for key, attribute in self.fields) + '}'
+        namespace = {}
+        exec(f'def dump(obj):\n    return {literal}\n'
+             f'def dump_many(objs):\n    return [{literal} for obj in objs]\n', namespace)
+        self.dump = namespace['dump']
+        self.dump_many = namespace['dump_many']
+
+    @property
+    def keys(self):
+        return tuple(key for key, _ in self.fields)
+
+
+USER_SERIALIZER = Serializer((
+    ('id', 'id'),
+    ('firstName', 'first_name'),
+    ('lastName', 'last_name'),
+    ('email', 'email'),
+))
+
+
+def user_to_dict(user):
+    """Public profile fields, as returned by the API and embedded in tokens"""
+    return USER_SERIALIZER.dump(user)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            self.options |= orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self.options).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self.options
+        if self.compact is False or (self.compact is None and self._app.debug):
+            options |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=options) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the provider chosen by JSON_PROVIDER ('auto', 'orjson' or 'default')"""
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+    if choice in ('auto', 'orjson') and orjson is not None:
+        app.json = FastJSONProvider(app)
+    return type(app.json).__name__
@@ -0,0 +1,36 @@
+"""
+Promote or demote a user.
+
+Usage:
+    python set_role.py jane@example.com admin
+    python set_role.py jane@example.com user
+
+Admins can use the /api/admin/* endpoints; the change applies to their next
+request, no new login needed.
+"""
+
+import argparse
+import sys
+
+from models import db, ROLES
+from user_directory import set_role
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Set the role of an existing user')
+    parser.add_argument('email', help='Email of the user')
+    parser.add_argument('role', choices=ROLES, help='New role')
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        db.create_all()  # adds the role column to an older database
+        if not set_role(args.email, args.role):
+            print(f"No user with email {args.email}", file=sys.stderr)
+            sys.exit(1)
+    print(f"{args.email} is now {args.role}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Static file serving from a manifest built at startup.
+
+Every file under the client directory is read once when the app starts: its
+SHA-256 becomes a strong ETag, text assets get gzip (and, when the optional
+`brotli` package is installed, brotli) variants, and small files are kept in
+memory. A request is then a dictionary lookup, with no filesystem calls:
+
+- If-None-Match matching the ETag answers 304 Not Modified
+- the smallest encoding the client accepts is sent, with Vary: Accept-Encoding
+- fingerprinted names (style.3f9a1c2b.css) are cached for a year as immutable;
+  everything else must be revalidated (Cache-Control: no-cache)
+- unknown paths get the SPA fallback page (index.html) from memory
+
+The manifest does not notice files edited after startup; set
+STATIC_MANIFEST=false while working on the client.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request, send_file, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+# Below this, compression saves less than the header overhead
+MIN_COMPRESS_SIZE = 512
+# name.<8+ hex digits>.ext, as written by the asset build
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+class StaticAsset:
+    """One file in the manifest, with its precompressed variants"""
+
+    def __init__(self, path, filename, data, keep_in_memory):
+        self.path = path
+        self.filename = filename
+        self.size = len(data)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type == 'application/javascript':
+            self.content_type += '; charset=utf-8'
+        self.etag = hashlib.sha256(data).hexdigest()[:32]
+        self.cache_control = IMMUTABLE if FINGERPRINT_RE.search(path) else REVALIDATE
+        self.body = data if keep_in_memory else None
+        self.variants = {}  # content-encoding -> bytes
+        if keep_in_memory and self.size >= MIN_COMPRESS_SIZE and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < self.size:
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < self.size:
+                    self.variants['br'] = compressed
+
+    @property
+    def compressible(self):
+        return bool(self.variants)
+
+
+def accepted_encodings(header):
+    """Encodings the client accepts (q > 0) from an Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticManifest:
+    """Content-hashed index of the client directory"""
+
+    def __init__(self):
+        self.root = None
+        self.enabled = True
+        self.max_memory_file = 1024 * 1024
+        self.fallback = 'index.html'
+        self.assets = {}
+
+    def init_app(self, app):
+        """Build the manifest from CLIENT_DIR (unless STATIC_MANIFEST is off)"""
+        self.root = os.path.abspath(app.config['CLIENT_DIR'])
+        self.enabled = app.config.get('STATIC_MANIFEST', True)
+        self.max_memory_file = app.config.get('STATIC_MAX_MEMORY_FILE', self.max_memory_file)
+        if self.enabled:
+            self.build()
+
+    def build(self):
+        """(Re)read every file under the root; returns the number of assets"""
+        assets = {}
+        for directory, subdirs, files in os.walk(self.root):
+            subdirs[:] = [d for d in subdirs if not d.startswith('.') and d != '__pycache__']
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                filename = os.path.join(directory, name)
+                path = os.path.relpath(filename, self.root).replace(os.sep, '/')
+                with open(filename, 'rb') as f:
+                    data = f.read()
+                assets[path] = StaticAsset(path, filename, data, len(data) <= self.max_memory_file)
+        self.assets = assets
+        return len(assets)
+
+    def lookup(self, path):
+        return self.assets.get(path.lstrip('/'))
+
+    def serve(self, path):
+        """Response for a client path, falling back to the SPA page for unknown paths"""
+        if not self.enabled:
+            # Development: read from disk on every request
+            if path and os.path.isfile(os.path.join(self.root, path)):
+                return send_from_directory(self.root, path)
+            return send_from_directory(self.root, self.fallback)
+
+        asset = self.lookup(path) or self.lookup(self.fallback)
+        if asset is None:
+            return Response('Not Found', status=404, mimetype='text/plain')
+        return self.respond(asset)
+
+    def respond(self, asset):
+        headers = {
+            'ETag': f'"{asset.etag}"',
+            'Cache-Control': asset.cache_control,
+        }
+        if asset.compressible:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if asset.etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+
+        if asset.body is None:
+            # Large file kept on disk; our ETag and cache policy still apply
+            response = send_file(asset.filename, mimetype=asset.content_type, etag=False, conditional=False)
+            response.headers.update(headers)
+            return response
+
+        body = asset.body
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding')) if asset.compressible else ()
+        for encoding in ('br', 'gzip'):
+            if encoding in accepted and encoding in asset.variants:
+                body = asset.variants[encoding]
+                headers['Content-Encoding'] = encoding
+                break
+        return Response(body, headers=headers, content_type=asset.content_type)
+
+    def stats(self):
+        """Asset counts and bytes held in memory"""
+        return {
+            'assets': len(self.assets),
+            'memory_bytes': sum((a.size if a.body is not None else 0) + sum(len(v) for v in a.variants.values())
+                                for a in self.assets.values()),
+            'compressed_assets': sum(1 for a in self.assets.values() if a.compressible),
+            'brotli': brotli is not None,
+        }
+
+
+static_manifest = StaticManifest()
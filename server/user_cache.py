@@ -0,0 +1,87 @@
+"""
+Per-worker cache of user profiles.
+
+/api/user needs reasonably fresh profile data but is called on every protected
+page, so profiles are kept in a small LRU cache with a TTL. Any ORM update or
+delete of a User (password reset, profile change) drops its entry straight
+away in this worker, and bulk UPDATE/DELETE statements on users clear it;
+other workers pick the change up once the TTL expires.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, User
+from serialization import user_to_dict
+
+
+class UserCache:
+    """Bounded TTL + LRU cache of user profile dicts keyed by user id"""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user id -> (expires, profile)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Read USER_CACHE_SIZE / USER_CACHE_TTL_SECONDS"""
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('USER_CACHE_TTL_SECONDS', self.ttl)
+        self.clear()
+
+    def get(self, user_id):
+        """Profile dict for user_id, loading it on a miss; None if no such user"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        profile = user_to_dict(user)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _invalidate_on_bulk_change(orm_execute_state):
+    # Bulk query.update()/delete() skip the per-row events above
+    mapper = orm_execute_state.bind_mapper
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and mapper is not None and mapper.class_ is User:
+        user_cache.clear()
@@ -0,0 +1,170 @@
+"""
+Admin user directory: keyset pagination and full-text search.
+
+Users are listed newest first, ordered by (created_at, id). Each page ends
+with an opaque cursor holding the last row's (created_at, id); the next page
+is `WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC LIMIT n`,
+which the (created_at, id) and (role, created_at, id) indexes answer by
+reading just n rows. Page 2000 costs the same as page 1, where OFFSET would
+walk every row before it.
+
+On SQLite, names and emails are searched through an FTS5 index (users_fts)
+that mirrors the users table. Triggers keep it in sync with every insert,
+update and delete, including the bulk importer's executemany and bulk
+query deletes. The index and triggers are created with the tables, and an
+existing database gets them, and the role column, on its next create_all().
+Other databases fall back to LIKE matching.
+"""
+
+import base64
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import Integer, column, event, inspect, or_, text, tuple_
+
+from models import db, User, ROLES
+from serialization import Serializer
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ADMIN_USER_SERIALIZER = Serializer((
+    ('id', 'id'),
+    ('firstName', 'first_name'),
+    ('lastName', 'last_name'),
+    ('email', 'email'),
+    ('role', 'role'),
+    ('createdAt', 'created_at'),
+))
+
+# External-content FTS5 table: it stores only the index, the text stays in users
+FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        first_name, last_name, email,
+        content='users', content_rowid='id', tokenize='unicode61', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_update
+    AFTER UPDATE OF first_name, last_name, email ON users BEGIN
+        INSERT INTO users_fts(users_fts, rowid, first_name, last_name, email)
+        VALUES ('delete', old.id, old.first_name, old.last_name, old.email);
+        INSERT INTO users_fts(rowid, first_name, last_name, email)
+        VALUES (new.id, new.first_name, new.last_name, new.email);
+    END""",
+]
+FTS_DROP = [
+    'DROP TRIGGER IF EXISTS users_fts_insert',
+    'DROP TRIGGER IF EXISTS users_fts_delete',
+    'DROP TRIGGER IF EXISTS users_fts_update',
+    'DROP TABLE IF EXISTS users_fts',
+]
+
+SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+# ============= SCHEMA =============
+
+@event.listens_for(db.metadata, 'after_create')
+def _upgrade_schema(metadata, connection, **kw):
+    """Bring an existing users table up to date; runs at the end of every create_all()"""
+    table = User.__table__
+    existing = {col['name'] for col in inspect(connection).get_columns(table.name)}
+    if 'role' not in existing:
+        connection.execute(text("ALTER TABLE users ADD COLUMN role VARCHAR(20) NOT NULL DEFAULT 'user'"))
+    # create_all() only creates indexes together with a new table
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+    if connection.dialect.name == 'sqlite':
+        fts_exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users_fts'")).first()
+        for statement in FTS_SCHEMA:
+            connection.execute(text(statement))
+        if not fts_exists:
+            # Index the rows that were there before the triggers
+            connection.execute(text("INSERT INTO users_fts(users_fts) VALUES ('rebuild')"))
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(metadata, connection, **kw):
+    # Otherwise the index outlives the rows it points at
+    if connection.dialect.name == 'sqlite':
+        for statement in FTS_DROP:
+            connection.execute(text(statement))
+
+
+# ============= ROLES =============
+
+def set_role(email, role):
+    """Give the user with `email` a role and commit; returns False if there is no such user"""
+    if role not in ROLES:
+        raise ValueError(f'Unknown role: {role}')
+    updated = User.query.filter_by(email=email.lower()).update({'role': role}, synchronize_session=False)
+    db.session.commit()
+    return bool(updated)
+
+
+# ============= LISTING =============
+
+def encode_cursor(user):
+    position = [user.created_at.isoformat() if user.created_at else None, user.id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; ValueError if it was not issued by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def fts_query(search):
+    """FTS5 MATCH expression requiring every word as a prefix, or None if there are no words"""
+    tokens = SEARCH_TOKEN_RE.findall(search)
+    if not tokens:
+        return None
+    # Quoted, so words like AND/NOT/NEAR are matched rather than parsed as operators
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def list_users(limit=DEFAULT_PAGE_SIZE, cursor=None, role=None, search=None):
+    """One page of users, newest first; returns (users, next cursor or None)
+
+    Raises ValueError for an unknown role or a malformed cursor.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = User.query
+    if role:
+        if role not in ROLES:
+            raise ValueError(f'Unknown role: {role}')
+        query = query.filter(User.role == role)
+    if search and search.strip():
+        if db.engine.dialect.name == 'sqlite':
+            match = fts_query(search)
+            if match is None:
+                return [], None
+            matching_ids = text('SELECT rowid FROM users_fts WHERE users_fts MATCH :match') \
+                .columns(column('rowid', Integer)).bindparams(match=match)
+            query = query.filter(User.id.in_(matching_ids))
+        else:
+            pattern = f'%{search.strip()}%'
+            query = query.filter(or_(User.first_name.ilike(pattern), User.last_name.ilike(pattern),
+                                     User.email.ilike(pattern)))
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        query = query.filter(tuple_(User.created_at, User.id) < (created_at, user_id))
+
+    users = query.order_by(User.created_at.desc(), User.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(users[limit - 1]) if len(users) > limit else None
+    return users[:limit], next_cursor
@@ -0,0 +1,30 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is built (and the tables created) once when this module is imported;
+with gunicorn's preload_app that happens in the master, and forked workers
+share its memory. after_fork() then drops the state a worker must not share.
+"""
+
+from app import create_app, db, init_db
+from blocklist import token_blocklist
+from hashing import password_pool
+from outbox import outbox
+
+application = create_app()
+init_db(application)
+print(application.extensions['startup'].report(), flush=True)
+
+
+def after_fork():
+    """Called in each new worker: no inherited connections, threads or revocation state"""
+    with application.app_context():
+        # Sockets opened by the master must not be used from two processes
+        db.engine.dispose(close=False)
+    # Executor threads do not survive fork; start with a fresh pool
+    password_pool.configure(password_pool.workers, password_pool.queue_size)
+    token_blocklist.reset()
+    # Deliver emails queued before a restart without waiting for a new one
+    outbox.start(application)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+USIU G6 Auth API Benchmark
+==========================
+Load-tests the auth API with a weighted mix of register, login, verify-token,
+user and logout requests from concurrent virtual users, and reports
+requests/sec, p50/p95/p99 latency and error rates per operation.
+
+Usage:
+    python bench_auth_api.py                                  # in-process, 8 users, 10s
+    python bench_auth_api.py --concurrency 32 --duration 30
+    python bench_auth_api.py --mix register=1,login=2,verify=6,user=6,logout=1
+    python bench_auth_api.py --url http://localhost:5000      # a running server
+    python bench_auth_api.py --save-baseline                  # store this run as the baseline
+    python bench_auth_api.py --baseline bench_results/baseline.json --threshold 15
+
+In-process runs use a fresh SQLite database, rate limiting off and bcrypt at
+--bcrypt-rounds (default 4) so results show the API's own cost; pass
+--bcrypt-rounds 0 to keep the server's calibrated cost. Against --url, start
+the server with RATELIMIT_ENABLED=false or the limiter will answer 429s.
+
+Results are written to bench_results/ as JSON. With a baseline, the run fails
+(exit code 1) when throughput drops or p95 latency rises by more than
+--threshold percent, or the error rate rises by more than one percentage point.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'server')
+RESULTS_DIR = os.path.join(TESTS_DIR, 'bench_results')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+sys.path.insert(0, TESTS_DIR)
+from bench_db_contention import percentile, print_header
+
+DEFAULT_MIX = 'register=1,login=3,verify=6,user=6,logout=1'
+# Absolute increase in error rate tolerated versus the baseline (1 percentage point)
+ERROR_RATE_TOLERANCE = 0.01
+# Latency changes smaller than this are scheduler noise, whatever their percentage
+MIN_LATENCY_DELTA_MS = 2.0
+EXPECTED_STATUS = {'register': 201, 'login': 200, 'verify': 200, 'user': 200, 'logout': 200}
+
+
+class InProcessClient:
+    """Calls the Flask app through its test client"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self._client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True) or {}
+
+
+class HTTPClient:
+    """Calls a running server over HTTP with a keep-alive session"""
+
+    def __init__(self, base_url):
+        import requests
+        self._base_url = base_url.rstrip('/')
+        self._session = requests.Session()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self._session.request(method, self._base_url + path, json=body, headers=headers, timeout=30)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return response.status_code, data
+
+
+def parse_mix(text):
+    """'register=1,login=3' -> [('register', 1.0), ('login', 3.0)]"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in EXPECTED_STATUS:
+            raise ValueError(f'Unknown operation in --mix: {name}')
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+class VirtualUser:
+    """One client session: owns an account and a token, and runs the mix"""
+
+    def __init__(self, client, run_id, index, sequence, record):
+        self.client = client
+        self.prefix = f'bench-{run_id}-{index}'
+        self.sequence = sequence
+        self.record = record
+        self.email = None
+        self.token = None
+
+    def call(self, name, method, path, body=None, token=None):
+        started = time.perf_counter()
+        try:
+            status, data = self.client.request(method, path, body, token)
+        except Exception:
+            status, data = None, {}
+        self.record(name, time.perf_counter() - started, status == EXPECTED_STATUS[name])
+        return status, data
+
+    def register(self):
+        email = f'{self.prefix}-{next(self.sequence)}@bench.local'
+        status, data = self.call('register', 'POST', '/api/register', {
+            'firstName': 'Bench', 'lastName': 'User', 'email': email, 'password': 'password123'})
+        if status == 201:
+            self.email, self.token = email, data.get('access_token')
+
+    def login(self):
+        status, data = self.call('login', 'POST', '/api/login', {'email': self.email, 'password': 'password123'})
+        if status == 200:
+            self.token = data.get('access_token')
+
+    def run(self, name):
+        if self.token is None and name != 'register':
+            # Lost the session (failed register/login): get a new one first
+            return self.register() if self.email is None else self.login()
+        if name == 'register':
+            self.register()
+        elif name == 'login':
+            self.login()
+        elif name == 'verify':
+            self.call('verify', 'GET', '/api/verify-token', token=self.token)
+        elif name == 'user':
+            self.call('user', 'GET', '/api/user', token=self.token)
+        else:
+            self.call('logout', 'POST', '/api/logout', token=self.token)
+            self.token = None
+
+
+def run_load(make_client, mix, concurrency, duration, seed=0):
+    """Drive the mix from `concurrency` threads for `duration` seconds"""
+    samples = {name: [] for name in EXPECTED_STATUS}
+    errors = {name: 0 for name in EXPECTED_STATUS}
+    lock = threading.Lock()
+    sequence = itertools.count()
+    run_id = f'{int(time.time())}{random.Random(seed).randrange(1000):03d}'
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+
+    def record(name, elapsed, ok):
+        with lock:
+            if ok:
+                samples[name].append(elapsed)
+            else:
+                errors[name] += 1
+
+    ready = threading.Barrier(concurrency + 1)
+    go = threading.Event()
+    deadline = [None]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        user = VirtualUser(make_client(), run_id, index, sequence, record)
+        user.register()
+        ready.wait()
+        go.wait()
+        while time.perf_counter() < deadline[0]:
+            user.run(rng.choices(names, weights)[0])
+
+    threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    # Sign-up of the virtual users is warm-up, not part of the measurement
+    ready.wait()
+    with lock:
+        for name in samples:
+            samples[name].clear()
+            errors[name] = 0
+    started = time.perf_counter()
+    deadline[0] = started + duration
+    go.set()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, errors, time.perf_counter() - started)
+
+
+def summarize(samples, errors, elapsed):
+    """Per-operation and overall throughput, latency percentiles and error rate"""
+    def stats(latencies, failed):
+        count = len(latencies) + failed
+        return {
+            'requests': count,
+            'errors': failed,
+            'error_rate': round(failed / count, 4) if count else 0.0,
+            'requests_per_second': round(count / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    operations = {name: stats(samples[name], errors[name]) for name in samples if samples[name] or errors[name]}
+    overall = stats([value for values in samples.values() for value in values], sum(errors.values()))
+    return {'elapsed_seconds': round(elapsed, 2), 'overall': overall, 'operations': operations}
+
+
+def find_regressions(result, baseline, threshold):
+    """Human-readable list of metrics that got worse than the baseline by more than threshold%"""
+    limit = threshold / 100.0
+    regressions = []
+
+    def check(label, before, after, higher_is_better=False):
+        if not before or (not higher_is_better and after - before < MIN_LATENCY_DELTA_MS):
+            return
+        change = (after - before) / before
+        if (higher_is_better and change < -limit) or (not higher_is_better and change > limit):
+            regressions.append(f"{label}: {before} -> {after} ({change * 100:+.1f}%)")
+
+    old, new = baseline['summary'], result['summary']
+    check('overall requests/sec', old['overall']['requests_per_second'],
+          new['overall']['requests_per_second'], higher_is_better=True)
+    check('overall p95 ms', old['overall']['p95_ms'], new['overall']['p95_ms'])
+    for name, stats in new['operations'].items():
+        before = old['operations'].get(name)
+        if before:
+            check(f'{name} p95 ms', before['p95_ms'], stats['p95_ms'])
+    # Error rates are compared in absolute terms: 0% -> 2% is a regression, not +inf%
+    if new['overall']['error_rate'] - old['overall']['error_rate'] > ERROR_RATE_TOLERANCE:
+        regressions.append(f"overall error rate: {old['overall']['error_rate']} -> {new['overall']['error_rate']}")
+    return regressions
+
+
+def in_process_app(args):
+    """Import the app against a scratch database with benchmark-friendly settings"""
+    workdir = tempfile.mkdtemp(prefix='usiu-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ.setdefault('RESET_TOKEN_SWEEP_SECONDS', '0')
+    if args.bcrypt_rounds:
+        os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    sys.path.insert(0, SERVER_DIR)
+    from app import app, db
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the USIU G6 auth API')
+    parser.add_argument('--url', help='Benchmark a running server instead of the app in-process')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds (after warm-up)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Operation weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help='bcrypt cost for in-process runs (0 keeps the server setting)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the request mix')
+    parser.add_argument('--output', help='Where to write the JSON result')
+    parser.add_argument('--baseline', help='Fail if this run regresses versus this result file')
+    parser.add_argument('--threshold', type=float, default=10, help='Allowed regression in percent')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Also write the result to {DEFAULT_BASELINE}')
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    print_header("USIU G6 AUTH API BENCHMARK")
+    if args.url:
+        target = args.url
+        make_client = lambda: HTTPClient(args.url)
+    else:
+        app = in_process_app(args)
+        target = 'in-process'
+        make_client = lambda: InProcessClient(app)
+    print(f"Target: {target}, {args.concurrency} users, {args.duration:g}s, mix {args.mix}\n")
+
+    summary = run_load(make_client, mix, args.concurrency, args.duration, args.seed)
+
+    print(f"{'operation':10} {'req/s':>8} {'errors':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, stats in list(summary['operations'].items()) + [('overall', summary['overall'])]:
+        print(f"{name:10} {stats['requests_per_second']:>8} {stats['error_rate']:>8.2%} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+    result = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'target': target,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'mix': args.mix,
+            'bcrypt_rounds': None if args.url else (args.bcrypt_rounds or 'server'),
+        },
+        'summary': summary,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('auth_%Y%m%d_%H%M%S.json'))
+    paths = [output] + ([DEFAULT_BASELINE] if args.save_baseline else [])
+    for path in paths:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(result, baseline, args.threshold)
+        print_header("COMPARISON WITH BASELINE")
+        if baseline.get('config') != result['config']:
+            print(f"⚠️  Baseline was recorded with different settings: {baseline['config']}\n")
+        if regressions:
+            print(f"❌ Regressed by more than {args.threshold:g}%:")
+            for line in regressions:
+                print(f"   - {line}")
+            return 1
+        print(f"✅ Within {args.threshold:g}% of the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
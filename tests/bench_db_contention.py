@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+USIU G6 Database Contention Benchmark
+=====================================
+Drives a mix of auth reads and writes from many threads against a file-backed
+SQLite database, once with SQLite's stock settings and once with the server's
+tuned profile (WAL, synchronous=NORMAL, mmap, larger cache), and compares
+throughput, latency and "database is locked" failures.
+
+Usage:
+    python bench_db_contention.py
+    python bench_db_contention.py --threads 32 --seconds 20
+    python bench_db_contention.py --dir /var/tmp --output results.json
+
+Each profile runs in its own process against a fresh database, because the
+server reads its configuration at import. bcrypt runs at its minimum cost so
+the numbers reflect the database, not hashing. Put --dir on the same kind of
+disk as production: fsync cost is what synchronous=NORMAL saves.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'server')
+
+# Settings that reproduce a plain sqlite3 connection
+PROFILES = {
+    'stock': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_BUSY_TIMEOUT_MS': '5000',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_CACHE_SIZE_KB': '2000',
+    },
+    'tuned': {},  # the server defaults
+}
+
+# Share of requests per operation; /api/user always reads the database here
+MIX = [('profile', 0.6), ('login', 0.25), ('register', 0.1), ('forgot', 0.05)]
+
+
+def print_header(text):
+    """Print a formatted header"""
+    print("\n" + "=" * 70)
+    print(text.center(70))
+    print("=" * 70 + "\n")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(int(-(-pct * len(ordered) // 100)) - 1, 0)]
+
+
+def run_profile(args):
+    """Child process: seed users, run the mixed workload, print a JSON result"""
+    sys.path.insert(0, SERVER_DIR)
+    from app import app, db
+    from import_users import import_users
+
+    with app.app_context():
+        db.create_all()
+        import_users(({'email': f'user{i}@bench.local', 'password': 'password123',
+                       'firstName': 'Bench', 'lastName': str(i)} for i in range(args.users)),
+                     workers=1, rounds=4)
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    tokens = []
+    client = app.test_client()
+    for i in range(min(args.users, 50)):
+        response = client.post('/api/login', json={'email': f'user{i}@bench.local', 'password': 'password123'})
+        tokens.append(response.get_json()['access_token'])
+
+    results = {name: {'latencies': [], 'errors': 0, 'locked': 0} for name, _ in MIX}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    counter = iter(range(10 ** 9))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        names = [name for name, _ in MIX]
+        weights = [weight for _, weight in MIX]
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            if name == 'profile':
+                response = client.get('/api/user', headers={'Authorization': f'Bearer {rng.choice(tokens)}'})
+            elif name == 'login':
+                response = client.post('/api/login', json={
+                    'email': f'user{rng.randrange(args.users)}@bench.local', 'password': 'password123'})
+            elif name == 'register':
+                response = client.post('/api/register', json={
+                    'firstName': 'New', 'lastName': 'User',
+                    'email': f'new{seed}-{next(counter)}@bench.local', 'password': 'password123'})
+            else:
+                response = client.post('/api/forgot-password', json={
+                    'email': f'user{rng.randrange(args.users)}@bench.local'})
+            elapsed = time.perf_counter() - started
+            with lock:
+                record = results[name]
+                if response.status_code >= 500:
+                    record['errors'] += 1
+                    if 'locked' in response.get_data(as_text=True):
+                        record['locked'] += 1
+                else:
+                    record['latencies'].append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'operations': {
+            name: {
+                'ok': len(record['latencies']),
+                'errors': record['errors'],
+                'locked': record['locked'],
+                'mean_ms': round(statistics.mean(record['latencies']) * 1000, 2) if record['latencies'] else 0.0,
+                'p50_ms': round(percentile(record['latencies'], 50) * 1000, 2),
+                'p95_ms': round(percentile(record['latencies'], 95) * 1000, 2),
+            }
+            for name, record in results.items()
+        },
+        'requests_per_second': round(sum(len(r['latencies']) for r in results.values()) / args.seconds, 1),
+    }))
+
+
+def launch(profile, args):
+    """Run one profile in a fresh process and database; returns its result dict"""
+    workdir = tempfile.mkdtemp(prefix=f'usiu-contention-{profile}-', dir=args.dir)
+    env = dict(os.environ, **PROFILES[profile])
+    env.update({
+        'DATABASE_URL': 'sqlite:///' + os.path.join(workdir, 'bench.db'),
+        'BCRYPT_ROUNDS': '4',
+        'USER_CACHE_TTL_SECONDS': '0',
+        'RESET_TOKEN_SWEEP_SECONDS': '0',
+        'RATELIMIT_ENABLED': 'false',
+    })
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               '--threads', str(args.threads), '--seconds', str(args.seconds), '--users', str(args.users)]
+    output = subprocess.run(command, env=env, cwd=SERVER_DIR, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare stock and tuned SQLite under mixed auth traffic')
+    parser.add_argument('--threads', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--seconds', type=float, default=10, help='Duration per profile')
+    parser.add_argument('--users', type=int, default=500, help='Users seeded before the run')
+    parser.add_argument('--dir', help='Where to create the databases (default: system temp)')
+    parser.add_argument('--output', help='Write both results as JSON to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args)
+        return 0
+
+    print_header("USIU G6 DATABASE CONTENTION BENCHMARK")
+    print(f"{args.threads} threads, {args.seconds:g}s per profile, {args.users} seeded users\n")
+    results = {}
+    for profile in PROFILES:
+        print(f"▶️  Running {profile} profile...")
+        results[profile] = launch(profile, args)
+
+    print(f"\n{'operation':10} {'profile':7} {'ok':>7} {'locked':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, _ in MIX:
+        for profile, result in results.items():
+            op = result['operations'][name]
+            print(f"{name:10} {profile:7} {op['ok']:>7} {op['locked']:>7} {op['p50_ms']:>8} {op['p95_ms']:>8}")
+
+    stock, tuned = results['stock']['requests_per_second'], results['tuned']['requests_per_second']
+    change = f"{(tuned - stock) / stock * 100:+.1f}%" if stock else "n/a"
+    print(f"\nThroughput: stock {stock} req/s ({results['stock']['journal_mode']}), "
+          f"tuned {tuned} req/s ({results['tuned']['journal_mode']}) -> {change}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+USIU G6 Serialization Micro-benchmark
+=====================================
+Measures what it costs to turn users into a JSON response, split into the
+two steps the API performs:
+
+- field mapping: User -> dict, by hand, through the precompiled Serializer
+  and (if marshmallow is installed) through an equivalent marshmallow schema
+- encoding: the dict -> a Flask response, with Flask's default JSON provider
+  and with the orjson-backed FastJSONProvider
+
+Each case runs for a single profile (the /api/user response) and for a page
+of profiles (an admin listing).
+
+Usage:
+    python bench_serialization.py
+    python bench_serialization.py --page 500 --repeat 7
+    python bench_serialization.py --output serialization.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'server')
+sys.path.insert(0, SERVER_DIR)
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from models import User
+from serialization import USER_SERIALIZER, FastJSONProvider, orjson
+
+try:
+    from marshmallow import Schema, fields
+except ImportError:
+    Schema = None
+
+
+def print_header(text):
+    """Print a formatted header"""
+    print("\n" + "=" * 70)
+    print(text.center(70))
+    print("=" * 70 + "\n")
+
+
+def make_users(count):
+    return [User(id=i, first_name=f'First{i}', last_name=f'Last{i}', email=f'user{i}@usiu.ac.ke')
+            for i in range(1, count + 1)]
+
+
+def by_hand(user):
+    return {
+        'id': user.id,
+        'firstName': user.first_name,
+        'lastName': user.last_name,
+        'email': user.email
+    }
+
+
+def marshmallow_schema():
+    class UserSchema(Schema):
+        id = fields.Integer()
+        firstName = fields.String(attribute='first_name')
+        lastName = fields.String(attribute='last_name')
+        email = fields.String()
+    return UserSchema()
+
+
+def per_call(function, repeat):
+    """Best-of-`repeat` time per call in microseconds"""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def run(args):
+    users = make_users(args.page)
+    user = users[0]
+    results = {'mapping': {}, 'encoding': {}}
+
+    mappers = {'by hand': (by_hand, lambda objs: [by_hand(u) for u in objs]),
+               'Serializer': (USER_SERIALIZER.dump, USER_SERIALIZER.dump_many)}
+    if Schema is not None:
+        schema = marshmallow_schema()
+        mappers['marshmallow'] = (schema.dump, lambda objs: schema.dump(objs, many=True))
+    for name, (one, many) in mappers.items():
+        results['mapping'][name] = {
+            'one': per_call(lambda: one(user), args.repeat),
+            'page': per_call(lambda: many(users), args.repeat),
+        }
+
+    profile = {'user': USER_SERIALIZER.dump(user)}
+    page = {'users': USER_SERIALIZER.dump_many(users), 'next': None}
+    providers = {'flask default': DefaultJSONProvider}
+    if orjson is not None:
+        providers['orjson'] = FastJSONProvider
+    for name, provider in providers.items():
+        app = Flask(__name__)
+        app.json = provider(app)
+        with app.app_context():
+            results['encoding'][name] = {
+                'one': per_call(lambda: jsonify(profile), args.repeat),
+                'page': per_call(lambda: jsonify(page), args.repeat),
+            }
+    return results
+
+
+def report(results, page_size):
+    for step, label in (('mapping', 'User -> dict'), ('encoding', 'dict -> JSON response')):
+        print(f"{label}:")
+        print(f"  {'':16} {'1 profile':>12} {f'{page_size} profiles':>16}")
+        fastest = min(r['page'] for r in results[step].values())
+        for name, times in results[step].items():
+            print(f"  {name:16} {times['one']:>9.2f} µs {times['page']:>13.1f} µs"
+                  f"   ({times['page'] / fastest:.1f}x)")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time user serialization and JSON encoding per response')
+    parser.add_argument('--page', type=int, default=100, help='Profiles in the "page" case')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is kept)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    print_header("SERIALIZATION MICRO-BENCHMARK")
+    if orjson is None:
+        print("ℹ️  orjson is not installed; only Flask's default provider is measured\n")
+    results = run(args)
+    report(results, args.page)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
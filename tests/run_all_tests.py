@@ -9,6 +9,7 @@ Usage:
     python run_all_tests.py --server     # Run only server tests
     python run_all_tests.py --integration # Run only integration tests
     python run_all_tests.py --client     # Run only client tests
+    python run_all_tests.py --bench      # Run the auth API benchmark (vs. bench_results/baseline.json if present)
 """
 
 import sys
@@ -44,24 +45,41 @@ def run_test_file(test_file, name):
     return result.returncode == 0
 
 
+def run_benchmark():
+    """Run the auth API benchmark, failing on a regression versus the stored baseline"""
+    print_header("Running Auth API Benchmark")
+    
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    command = [sys.executable, os.path.join(tests_dir, 'bench_auth_api.py')]
+    baseline = os.path.join(tests_dir, 'bench_results', 'baseline.json')
+    if os.path.exists(baseline):
+        command += ['--baseline', baseline]
+    else:
+        print("ℹ️  No baseline yet; run bench_auth_api.py --save-baseline to record one\n")
+    result = subprocess.run(command, cwd=tests_dir)
+    
+    return result.returncode == 0
+
+
 def main():
     """Main test runner"""
     parser = argparse.ArgumentParser(description='Run USIU G6 test suite')
     parser.add_argument('--server', action='store_true', help='Run only server tests')
     parser.add_argument('--integration', action='store_true', help='Run only integration tests')
     parser.add_argument('--client', action='store_true', help='Run only automated client tests')
+    parser.add_argument('--bench', action='store_true', help='Run the auth API benchmark (not part of the default run)')
     
     args = parser.parse_args()
     
     # If no specific flag, run all tests
-    run_all = not (args.server or args.integration or args.client)
+    run_all = not (args.server or args.integration or args.client or args.bench)
     
     print_header("USIU G6 TEST SUITE")
     print("📋 Test Suite Configuration")
-    print("   - Server Tests: 12 tests")
+    print("   - Server Tests: 33 tests")
     print("   - Integration Tests: 4 tests")
     print("   - Automated Client Tests: 10 tests")
-    print("   - Total: 26 tests\n")
+    print("   - Total: 47 tests\n")
     
     results = {}
     
@@ -90,6 +108,9 @@ def main():
         else:
             results['client'] = False
     
+    if args.bench:
+        results['bench'] = run_benchmark()
+    
     # Print final summary
     print_header("FINAL TEST SUMMARY")
     
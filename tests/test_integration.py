@@ -15,6 +15,8 @@ import json
 import time
 import sys
 import os
+import shutil
+import tempfile
 
 # Add parent and server directories to path
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -22,8 +24,19 @@ server_dir = os.path.join(parent_dir, 'server')
 sys.path.insert(0, parent_dir)
 sys.path.insert(0, server_dir)
 
-from app import app, db
+from app import create_app, db
 from models import User
+from ratelimit import rate_limiter
+from auth_events import auth_events
+
+# A throwaway database and the cheapest bcrypt cost, never the tracked instance/usiu_app.db
+test_db_dir = tempfile.mkdtemp()
+app = create_app({
+    'TESTING': True,
+    'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(test_db_dir, 'test.db')}",
+    'JWT_SECRET_KEY': 'test-secret-key',
+    'BCRYPT_ROUNDS': 4,
+})
 
 
 class TestIntegrationFlows(unittest.TestCase):
@@ -32,9 +45,6 @@ class TestIntegrationFlows(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """Set up test environment"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-        app.config['JWT_SECRET_KEY'] = 'test-secret-key'
         cls.client = app.test_client()
         
         with app.app_context():
@@ -44,14 +54,18 @@ class TestIntegrationFlows(unittest.TestCase):
     def tearDownClass(cls):
         """Clean up"""
         with app.app_context():
+            auth_events.flush(app)  # buffered events need their table
             db.session.remove()
             db.drop_all()
+            db.engine.dispose()
+        shutil.rmtree(test_db_dir, ignore_errors=True)
 
     def setUp(self):
         """Clear database before each test"""
         with app.app_context():
             User.query.delete()
             db.session.commit()
+        rate_limiter.reset()
 
     def test_01_complete_registration_and_login_flow(self):
         """Test: User registers → logs in → accesses protected resources"""
@@ -202,11 +216,10 @@ class TestIntegrationFlows(unittest.TestCase):
         self.assertEqual(reset_request.status_code, 200)
         print("  ✓ Step 2: Password reset requested")
         
-        # Step 3: Get reset token from database
-        with app.app_context():
-            user = User.query.filter_by(email='resetflow@example.com').first()
-            reset_token = user.reset_token
-            self.assertIsNotNone(reset_token)
+        # Step 3: Get reset token from the reset link (only its hash is stored)
+        reset_url = json.loads(reset_request.data)['reset_url']
+        reset_token = reset_url.split('token=', 1)[1]
+        self.assertTrue(reset_token)
         print("  ✓ Step 3: Reset token generated")
         
         # Step 4: Reset password
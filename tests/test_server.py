@@ -17,6 +17,8 @@ import unittest
 import json
 import sys
 import os
+import threading
+import time
 
 # Add parent and server directories to path
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -24,8 +26,98 @@ server_dir = os.path.join(parent_dir, 'server')
 sys.path.insert(0, parent_dir)
 sys.path.insert(0, server_dir)
 
-from app import app, db
-from models import User
+from app import create_app, db
+from models import User, RevokedToken, PasswordResetToken
+from blocklist import token_blocklist
+from user_cache import user_cache
+from reset_tokens import reset_tokens, hash_token
+from import_users import import_users, read_records
+from ratelimit import rate_limiter
+from static_assets import static_manifest, StaticAsset, StaticManifest
+from build_assets import AssetBuilder, minify_css, minify_js
+from build_images import build_images
+from serialization import Serializer, USER_SERIALIZER, user_to_dict
+from export_users import export_users
+from user_directory import set_role
+import csv
+import io
+import socketserver
+from email import message_from_string
+from outbox import outbox
+from models import OutboxEmail, AuthEvent
+from auth_events import auth_events, event_totals, events_per_minute
+from PIL import Image
+import gzip
+import shutil
+import tempfile
+import subprocess
+from sqlalchemy import event
+from datetime import datetime, timedelta
+from hashing import password_pool, hash_rounds
+import bcrypt
+
+# An app of the tests' own: a throwaway database (never the tracked
+# instance/usiu_app.db) and the cheapest bcrypt cost instead of calibrating
+test_db_dir = tempfile.mkdtemp()
+app = create_app({
+    'TESTING': True,
+    'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(test_db_dir, 'test.db')}",
+    'JWT_SECRET_KEY': 'test-secret-key',
+    'BCRYPT_ROUNDS': 4,
+})
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server for the outbox tests
+
+    Accepts every message into `messages` unless `reject` holds a reply
+    (e.g. '451 try later') to give instead of accepting the next message.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPStandInHandler)
+        self.messages = []
+        self.reject = []
+        self.connections = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('utf-8'))
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in ready')
+        while True:
+            line = self.rfile.readline().decode('utf-8').strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'DATA':
+                self.reply('354 end with .')
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode('utf-8')
+                    if data in ('.\r\n', ''):
+                        break
+                    lines.append(data[1:] if data.startswith('..') else data)
+                if self.server.reject:
+                    self.reply(self.server.reject.pop(0))
+                else:
+                    self.server.messages.append(message_from_string(''.join(lines)))
+                    self.reply('250 queued')
+            else:  # MAIL, RCPT, RSET, NOOP
+                self.reply('250 ok')
 
 
 class TestServerAPI(unittest.TestCase):
@@ -34,9 +126,6 @@ class TestServerAPI(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         """Set up test client and database once for all tests"""
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # In-memory database
-        app.config['JWT_SECRET_KEY'] = 'test-secret-key'
         cls.client = app.test_client()
         
         with app.app_context():
@@ -46,15 +135,28 @@ class TestServerAPI(unittest.TestCase):
     def tearDownClass(cls):
         """Clean up after all tests"""
         with app.app_context():
+            auth_events.flush(app)  # buffered events need their table
             db.session.remove()
             db.drop_all()
+            db.engine.dispose()
+        shutil.rmtree(test_db_dir, ignore_errors=True)
 
     def setUp(self):
         """Set up before each test"""
         with app.app_context():
-            # Clear all users before each test
+            # Write out buffered events first: once the deletes below start, this
+            # session holds the write lock and the recorder's connection would wait on it
+            auth_events.flush(app)
+            # Clear all users and revocations before each test
             User.query.delete()
+            RevokedToken.query.delete()
+            PasswordResetToken.query.delete()
+            OutboxEmail.query.delete()
+            AuthEvent.query.delete()
             db.session.commit()
+        token_blocklist.reset()
+        user_cache.clear()
+        rate_limiter.reset()
 
     def test_01_user_registration_success(self):
         """Test successful user registration"""
@@ -325,6 +427,846 @@ class TestServerAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         print("✅ Test 12: Missing fields properly rejected")
 
+    def test_13_login_rejected_when_hashing_pool_saturated(self):
+        """Test that a full hashing pool answers 503 with Retry-After"""
+        self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Busy',
+                'lastName': 'Pool',
+                'email': 'busy@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        
+        original = (password_pool.workers, password_pool.queue_size)
+        password_pool.configure(workers=1, queue_size=0)
+        release = threading.Event()
+        blocker = threading.Thread(target=password_pool.run, args=(release.wait, 5))
+        try:
+            # Occupy the only worker, then try to log in
+            blocker.start()
+            while password_pool.stats()['running'] < 1:
+                time.sleep(0.01)
+            
+            response = self.client.post('/api/login',
+                data=json.dumps({
+                    'email': 'busy@example.com',
+                    'password': 'password123'
+                }),
+                content_type='application/json'
+            )
+        finally:
+            release.set()
+            blocker.join()
+            password_pool.configure(*original)
+        
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+        print("✅ Test 13: Saturated hashing pool rejects fast with 503")
+
+    def test_14_health_reports_password_pool(self):
+        """Test that the health check exposes hashing queue depth and wait time"""
+        response = self.client.get('/api/health')
+        
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['status'], 'ok')
+        self.assertIn('queued', data['password_pool'])
+        self.assertIn('wait_ms_avg', data['password_pool'])
+        print("✅ Test 14: Health check reports hashing pool stats")
+
+    def test_15_login_rehashes_outdated_bcrypt_cost(self):
+        """Test that login upgrades a hash stored at a lower bcrypt cost, and only upgrades"""
+        # The tests run at cost 4: raise the current cost so a cost-4 hash is outdated
+        rounds = password_pool.rounds
+        password_pool.rounds = 5
+        self.addCleanup(setattr, password_pool, 'rounds', rounds)
+        with app.app_context():
+            user = User(
+                first_name='Old',
+                last_name='Hash',
+                email='oldhash@example.com'
+            )
+            user.password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(4)).decode('utf-8')
+            db.session.add(user)
+            db.session.commit()
+        
+        response = self.client.post('/api/login',
+            data=json.dumps({
+                'email': 'oldhash@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            user = User.query.filter_by(email='oldhash@example.com').first()
+            self.assertEqual(hash_rounds(user.password_hash), password_pool.rounds)
+            self.assertTrue(user.check_password('password123'))
+        
+        # A hash above the current cost (made by a process that calibrated higher) is never downgraded
+        password_pool.rounds = 4
+        response = self.client.post('/api/login', json={'email': 'oldhash@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            self.assertEqual(hash_rounds(User.query.filter_by(email='oldhash@example.com').first().password_hash), 5)
+        print("✅ Test 15: Login transparently rehashes outdated bcrypt cost")
+
+    def test_16_revocation_visible_to_other_workers(self):
+        """Test that a logout is persisted and seen by a worker with a fresh mirror"""
+        reg_response = self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Shared',
+                'lastName': 'Revoke',
+                'email': 'shared@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        token = json.loads(reg_response.data)['access_token']
+        
+        self.client.post('/api/logout', headers={'Authorization': f'Bearer {token}'})
+        
+        # A restarted or different worker starts with an empty mirror
+        token_blocklist.reset()
+        response = self.client.get('/api/user',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+        
+        self.assertEqual(response.status_code, 401)
+        print("✅ Test 16: Revoked token rejected by a fresh worker")
+
+    def test_17_expired_revocations_are_pruned(self):
+        """Test that revocations past their token expiry are deleted"""
+        with app.app_context():
+            db.session.add(RevokedToken(jti='expired-jti', expires_at=datetime.utcnow() - timedelta(minutes=1)))
+            db.session.commit()
+            
+            prune_interval = token_blocklist.prune_interval
+            token_blocklist.prune_interval = 0
+            try:
+                token_blocklist.refresh()
+            finally:
+                token_blocklist.prune_interval = prune_interval
+            
+            self.assertIsNone(RevokedToken.query.filter_by(jti='expired-jti').first())
+            self.assertFalse(token_blocklist.is_revoked('expired-jti'))
+        print("✅ Test 17: Expired revocations pruned")
+
+    def test_18_blocklist_store_consulted_only_on_filter_hit(self):
+        """Test that unrevoked tokens are answered by the Bloom filter alone"""
+        tokens = []
+        for email in ('kept@example.com', 'revoked@example.com'):
+            reg_response = self.client.post('/api/register',
+                data=json.dumps({
+                    'firstName': 'Bloom',
+                    'lastName': 'Filter',
+                    'email': email,
+                    'password': 'password123'
+                }),
+                content_type='application/json'
+            )
+            tokens.append(json.loads(reg_response.data)['access_token'])
+        kept, revoked = tokens
+        self.client.post('/api/logout', headers={'Authorization': f'Bearer {revoked}'})
+        token_blocklist.reset()
+        
+        response = self.client.get('/api/user', headers={'Authorization': f'Bearer {kept}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(token_blocklist.stats()['store_lookups'], 0)
+        
+        response = self.client.get('/api/user', headers={'Authorization': f'Bearer {revoked}'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(token_blocklist.stats()['store_lookups'], 1)
+        
+        # Confirmed revocations are cached, so replays don't query again
+        self.client.get('/api/user', headers={'Authorization': f'Bearer {revoked}'})
+        self.assertEqual(token_blocklist.stats()['store_lookups'], 1)
+        
+        # A row committed after a higher id was read still reaches the filters
+        expires = datetime.utcnow() + timedelta(hours=1)
+        with app.app_context():
+            newest = db.session.query(db.func.max(RevokedToken.id)).scalar()
+            db.session.add(RevokedToken(id=newest + 2, jti='committed-first', expires_at=expires))
+            db.session.commit()
+            token_blocklist.refresh()
+            db.session.add(RevokedToken(id=newest + 1, jti='committed-late', expires_at=expires))
+            db.session.commit()
+            token_blocklist.refresh()
+            self.assertTrue(token_blocklist.is_revoked('committed-late', expires))
+            self.assertEqual(len(token_blocklist), 3)  # re-read rows are not counted twice
+        
+        # The first check waits for the initial load rather than answering from empty filters
+        token_blocklist.reset()
+        answers = []
+        def check():
+            with app.app_context():
+                answers.append(token_blocklist.is_revoked('committed-late', expires))
+        with token_blocklist._lock:  # as if another thread were mid-load
+            thread = threading.Thread(target=check)
+            thread.start()
+            thread.join(0.3)
+            self.assertTrue(thread.is_alive())
+        thread.join(10)
+        self.assertEqual(answers, [True])
+        print("✅ Test 18: Blocklist store consulted only on Bloom filter hits")
+
+    def test_19_verify_token_answers_from_claims(self):
+        """Test that /api/verify-token runs no SQL when the token carries a profile"""
+        reg_response = self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Claims',
+                'lastName': 'Only',
+                'email': 'claims@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        token = json.loads(reg_response.data)['access_token']
+        self.client.get('/api/user', headers={'Authorization': f'Bearer {token}'})  # warm the blocklist
+        
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            response = self.client.get('/api/verify-token',
+                headers={'Authorization': f'Bearer {token}'}
+            )
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(statements, [])
+        print("✅ Test 19: Token verified from claims without a DB query")
+
+    def test_20_user_cache_invalidated_on_update(self):
+        """Test that /api/user serves cached profiles but sees profile changes"""
+        reg_response = self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Before',
+                'lastName': 'Change',
+                'email': 'cache@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        token = json.loads(reg_response.data)['access_token']
+        headers = {'Authorization': f'Bearer {token}'}
+        
+        self.client.get('/api/user', headers=headers)
+        hits = user_cache.hits
+        self.client.get('/api/user', headers=headers)
+        self.assertEqual(user_cache.hits, hits + 1)
+        
+        with app.app_context():
+            user = User.query.filter_by(email='cache@example.com').first()
+            user.first_name = 'After'
+            db.session.commit()
+        
+        response = self.client.get('/api/user', headers=headers)
+        self.assertEqual(json.loads(response.data)['user']['firstName'], 'After')
+        print("✅ Test 20: User cache invalidated on profile change")
+
+    def test_21_reset_token_stored_hashed_and_swept(self):
+        """Test that reset tokens are stored hashed, redeemed once and swept when expired"""
+        self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Hashed',
+                'lastName': 'Reset',
+                'email': 'hashedreset@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        response = self.client.post('/api/forgot-password',
+            data=json.dumps({'email': 'hashedreset@example.com'}),
+            content_type='application/json'
+        )
+        token = json.loads(response.data)['reset_url'].split('token=', 1)[1]
+        
+        with app.app_context():
+            reset = PasswordResetToken.query.one()
+            self.assertEqual(reset.token_hash, hash_token(token))
+            self.assertNotEqual(reset.token_hash, token)
+        
+        response = self.client.post('/api/reset-password',
+            data=json.dumps({'token': token, 'newPassword': 'newpassword123'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        # Tokens are single use
+        response = self.client.post('/api/reset-password',
+            data=json.dumps({'token': token, 'newPassword': 'again123'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        
+        # Expired resets are rejected and removed by the sweeper
+        self.client.post('/api/forgot-password',
+            data=json.dumps({'email': 'hashedreset@example.com'}),
+            content_type='application/json'
+        )
+        with app.app_context():
+            PasswordResetToken.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+            db.session.commit()
+            self.assertEqual(reset_tokens.sweep(), 1)
+            self.assertEqual(PasswordResetToken.query.count(), 0)
+        print("✅ Test 21: Reset tokens hashed, single use and swept when expired")
+
+    def test_22_bulk_import_skips_existing_and_resumes(self):
+        """Test bulk import: existing, duplicate and invalid rows, and checkpoint resume"""
+        self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Already',
+                'lastName': 'Here',
+                'email': 'student1@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        records = [{'email': f'Student{i}@example.com', 'password': 'pw123456',
+                    'first_name': 'Student', 'last_name': str(i)} for i in range(5)]
+        records.append({'email': 'student2@example.com', 'password': 'pw', 'firstName': 'Dup', 'lastName': 'Row'})
+        records.append({'email': 'nopassword@example.com', 'firstName': 'No', 'lastName': 'Password'})
+        
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'roster.ndjson')
+        with open(path, 'w') as f:
+            f.write('\n'.join(json.dumps(r) for r in records))
+        checkpoint = path + '.checkpoint'
+        
+        with app.app_context():
+            stats = import_users(read_records(path), chunk_size=3, workers=1, rounds=4, checkpoint=checkpoint)
+            self.assertEqual((stats.imported, stats.existing, stats.duplicates, stats.invalid), (4, 1, 1, 1))
+            self.assertEqual(User.query.count(), 5)
+            self.assertEqual(User.query.filter_by(email='student3@example.com').first().first_name, 'Student')
+            
+            # Resuming a finished import consumes nothing
+            stats = import_users(read_records(path), chunk_size=3, workers=1, rounds=4,
+                                 checkpoint=checkpoint, resume=True)
+            self.assertEqual((stats.imported, stats.existing), (0, 0))
+        
+        login = self.client.post('/api/login',
+            data=json.dumps({'email': 'student4@example.com', 'password': 'pw123456'}),
+            content_type='application/json'
+        )
+        self.assertEqual(login.status_code, 200)
+        print("✅ Test 22: Bulk import skips existing rows and resumes from checkpoint")
+
+    def test_23_login_rate_limited_before_hashing(self):
+        """Test that clients over their budget get 429 without touching bcrypt"""
+        self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Rate',
+                'lastName': 'Limited',
+                'email': 'ratelimit@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        rate_limiter.reset()
+        limits = rate_limiter.limits
+        rate_limiter.limits = {'ip': (60, 3), 'email': (1, 2)}
+        try:
+            def attempt(email, ip):
+                return self.client.post('/api/login',
+                    data=json.dumps({'email': email, 'password': 'wrongpassword'}),
+                    content_type='application/json',
+                    environ_base={'REMOTE_ADDR': ip}
+                )
+            
+            # Per-email budget applies across IPs
+            self.assertEqual(attempt('ratelimit@example.com', '10.0.0.1').status_code, 401)
+            self.assertEqual(attempt('ratelimit@example.com', '10.0.0.2').status_code, 401)
+            hashed = password_pool.stats()['completed']
+            response = attempt('ratelimit@example.com', '10.0.0.3')
+            self.assertEqual(response.status_code, 429)
+            self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+            self.assertEqual(password_pool.stats()['completed'], hashed)
+            
+            # Per-IP budget applies across emails
+            for i in range(3):
+                self.assertEqual(attempt(f'other{i}@example.com', '10.0.0.9').status_code, 401)
+            self.assertEqual(attempt('other3@example.com', '10.0.0.9').status_code, 429)
+            self.assertEqual(rate_limiter.stats()['limited'], 2)
+        finally:
+            rate_limiter.limits = limits
+        print("✅ Test 23: Login rate limited per IP and per email before hashing")
+
+    def test_24_metrics_endpoint(self):
+        """Test that /metrics exposes route latency, status, bcrypt and SQL metrics"""
+        self.client.post('/api/register',
+            data=json.dumps({
+                'firstName': 'Metrics',
+                'lastName': 'User',
+                'email': 'metrics@example.com',
+                'password': 'password123'
+            }),
+            content_type='application/json'
+        )
+        self.client.post('/api/login',
+            data=json.dumps({'email': 'metrics@example.com', 'password': 'wrongpassword'}),
+            content_type='application/json'
+        )
+        
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('usiu_http_requests_total{method="POST",route="/api/login",status="401"}', body)
+        self.assertIn('usiu_http_request_duration_seconds_bucket{le="+Inf",method="POST",route="/api/register"}', body)
+        self.assertIn('usiu_password_hash_seconds_count{operation="verify"}', body)
+        self.assertIn('usiu_db_query_duration_seconds_count{operation="SELECT"}', body)
+        self.assertIn('usiu_component_state{component="token_blocklist_entries"}', body)
+        self.assertIn('usiu_http_requests_in_flight 1.0', body)  # the scrape itself
+        
+        # With a shared PROMETHEUS_MULTIPROC_DIR (as under gunicorn), any process reports every worker's counts
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp())
+        worker = "import metrics; metrics.REQUESTS_TOTAL.labels(method='GET', route='/x', status=200).inc()"
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', worker], cwd=server_dir, env=env, check=True, timeout=60)
+        scrape = subprocess.run([sys.executable, '-c', "import metrics; print(metrics.render().decode())"],
+                                cwd=server_dir, env=env, capture_output=True, text=True, timeout=60)
+        self.assertIn('usiu_http_requests_total{method="GET",route="/x",status="200"} 2.0', scrape.stdout)
+        print("✅ Test 24: Prometheus metrics exposed on /metrics")
+
+    def test_25_static_assets_from_manifest(self):
+        """Test ETag revalidation, gzip variants, immutable caching and the SPA fallback"""
+        response = self.client.get('/assets/css/style.css', headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(response.headers['Cache-Control'], 'no-cache')
+        with open(os.path.join(app.config['CLIENT_DIR'], 'assets', 'css', 'style.css'), 'rb') as f:
+            self.assertEqual(gzip.decompress(response.data), f.read())
+        
+        etag = response.headers['ETag']
+        response = self.client.get('/assets/css/style.css', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        
+        # Unknown paths get the in-memory index.html
+        index = self.client.get('/')
+        fallback = self.client.get('/some/client/route')
+        self.assertEqual(fallback.status_code, 200)
+        self.assertEqual(fallback.headers['ETag'], index.headers['ETag'])
+        
+        # Fingerprinted names are cached as immutable
+        asset = StaticAsset('assets/js/app.0123abcd.js', '', b'console.log(1);', True)
+        static_manifest.assets[asset.path] = asset
+        try:
+            response = self.client.get('/assets/js/app.0123abcd.js')
+            self.assertIn('immutable', response.headers['Cache-Control'])
+        finally:
+            del static_manifest.assets[asset.path]
+        print("✅ Test 25: Static assets served from manifest with ETags and compression")
+
+    def test_26_asset_build_fingerprints_and_rewrites_pages(self):
+        """Test the client build: minified, hashed bundles referenced from the pages"""
+        self.assertEqual(minify_css('a  :hover { color: red ; margin: 0  auto; } /* x */'),
+                         'a :hover{color:red;margin:0 auto}\n')
+        self.assertEqual(minify_js('var a = "//x"; // note\n  /* c */ var b = /\\//g;\n'),
+                         'var a = "//x";\nvar b = /\\//g;\n')
+        
+        output = os.path.join(tempfile.mkdtemp(), 'client')
+        report = AssetBuilder(app.config['CLIENT_DIR'], output).build()
+        
+        with open(os.path.join(output, 'index.html')) as f:
+            html = f.read()
+        self.assertNotIn('assets/css/style.css', html)
+        bundle = next(path for path in report['bundles'] if path.startswith('assets/bundles/style.'))
+        self.assertIn(f'/{bundle}', html)
+        self.assertLess(report['bundles'][bundle]['bytes'], report['bundles'][bundle]['source_bytes'])
+        
+        manifest = StaticManifest()
+        manifest.root = output
+        manifest.build()
+        self.assertIn('immutable', manifest.lookup(bundle).cache_control)
+        self.assertEqual(manifest.lookup('index.html').cache_control, 'no-cache')
+        print("✅ Test 26: Asset build writes fingerprinted bundles and rewrites pages")
+
+    def test_27_responsive_images_are_cached_and_rewritten(self):
+        """Test image derivatives: widths, content-hash cache and <picture> rewrite"""
+        root = tempfile.mkdtemp()
+        client = os.path.join(root, 'client')
+        os.makedirs(os.path.join(client, 'assets', 'img'))
+        Image.new('RGB', (100, 50), 'red').save(os.path.join(client, 'assets', 'img', 'photo.jpg'))
+        with open(os.path.join(client, 'index.html'), 'w') as f:
+            f.write('<img src="assets/img/photo.jpg" alt="Photo" class="thumb">'
+                    '<img src="assets/img/photo.jpg" alt="Avatar" sizes="50px">')
+        cache = os.path.join(root, 'cache')
+        output = os.path.join(root, 'derived')
+        
+        images, rebuilt = build_images(os.path.join(client, 'assets', 'img'), output, cache, widths=(40, 200))
+        self.assertEqual(rebuilt, 1)
+        photo = images['photo.jpg']
+        self.assertIn('image/jpeg', photo['srcset'])
+        self.assertIn(' 40w', photo['srcset']['image/jpeg'])
+        self.assertIn(' 100w', photo['srcset']['image/jpeg'])  # never upscaled past the source
+        self.assertNotIn(' 200w', photo['srcset']['image/jpeg'])
+        with Image.open(os.path.join(output, photo['fallback'].rsplit('/', 1)[1])) as derived:
+            self.assertEqual(derived.size, (100, 50))
+        
+        # Unchanged sources come from the cache; an edited one is re-encoded
+        self.assertEqual(build_images(os.path.join(client, 'assets', 'img'), output, cache, widths=(40, 200))[1], 0)
+        Image.new('RGB', (100, 50), 'blue').save(os.path.join(client, 'assets', 'img', 'photo.jpg'))
+        images, rebuilt = build_images(os.path.join(client, 'assets', 'img'), output, cache, widths=(40, 200))
+        self.assertEqual(rebuilt, 1)
+        self.assertNotEqual(images['photo.jpg']['fallback'], photo['fallback'])
+        
+        built = os.path.join(root, 'build')
+        report = AssetBuilder(client, built, images=True, image_cache=cache).build()
+        self.assertEqual(report['pages']['index.html']['responsive_images'], 2)
+        with open(os.path.join(built, 'index.html')) as f:
+            html = f.read()
+        self.assertTrue(html.startswith('<picture>'))
+        self.assertEqual(html.count('sizes="(max-width: 768px) 100vw, 33vw"'), len(photo['srcset']))
+        self.assertEqual(html.count('sizes="50px"'), len(photo['srcset']))  # a page's own sizes wins
+        self.assertIn('alt="Photo"', html)
+        self.assertIn('class="thumb"', html)
+        self.assertIn('srcset="/assets/img/responsive/photo-', html)
+        self.assertNotIn('src="assets/img/photo.jpg"', html)
+        print("✅ Test 27: Responsive images are cached by content and rewritten as <picture>")
+
+    def test_28_app_factory_and_wsgi_entry_point(self):
+        """Test create_app and the production entry point with its startup breakdown"""
+        # The tests' overrides win over the environment
+        self.assertEqual(app.config['SQLALCHEMY_DATABASE_URI'], f"sqlite:///{os.path.join(test_db_dir, 'test.db')}")
+        self.assertEqual(password_pool.rounds, 4)
+        phases = dict(app.extensions['startup'].phases)
+        self.assertIn('bcrypt calibration', phases)
+        self.assertIn('static manifest', phases)
+        
+        db_path = os.path.join(tempfile.mkdtemp(), 'wsgi.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', BCRYPT_ROUNDS='4', METRICS_ENABLED='false',
+                   TRUSTED_PROXIES='1')
+        script = (
+            "import wsgi\n"
+            "from auth_events import auth_events\n"
+            "from models import AuthEvent\n"
+            "wsgi.after_fork()\n"
+            "client = wsgi.application.test_client()\n"
+            "print('health', client.get('/api/health').status_code)\n"
+            "print('metrics', client.get('/metrics').status_code)\n"
+            # Behind one trusted proxy, the client address comes from X-Forwarded-For
+            "client.post('/api/login', json={'email': 'a@example.com', 'password': 'x'},\n"
+            "            headers={'X-Forwarded-For': '203.0.113.9'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})\n"
+            "auth_events.flush(wsgi.application)\n"
+            "with wsgi.application.app_context():\n"
+            "    print('client ip', AuthEvent.query.one().ip)\n"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=server_dir, env=env,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn('Startup took', result.stdout)
+        self.assertIn('create tables', result.stdout)
+        self.assertIn('health 200', result.stdout)
+        self.assertIn('metrics 404', result.stdout)  # environment settings reach the factory
+        self.assertIn('client ip 203.0.113.9', result.stdout)
+        self.assertTrue(os.path.exists(db_path))
+        print("✅ Test 28: App factory and WSGI entry point build a working app")
+
+    def test_29_user_serialization_and_json_provider(self):
+        """Test the compiled user serializer and the orjson response provider"""
+        serializer = Serializer((('userId', 'id'), ('mail', 'email')))
+        user = User(id=7, first_name='Ada', last_name='Lovelace', email='ada@usiu.ac.ke')
+        self.assertEqual(serializer.dump(user), {'userId': 7, 'mail': 'ada@usiu.ac.ke'})
+        self.assertEqual(serializer.dump_many([user, user]), [{'userId': 7, 'mail': 'ada@usiu.ac.ke'}] * 2)
+        self.assertEqual(USER_SERIALIZER.keys, ('id', 'firstName', 'lastName', 'email'))
+        with self.assertRaises(ValueError):
+            Serializer((('x', 'email; import os'),))
+        
+        self.assertEqual(type(app.json).__name__, 'FastJSONProvider')
+        with app.app_context():
+            body = app.json.response({'b': 1, 'a': datetime(2024, 1, 2, 3, 4, 5)}).get_data(as_text=True)
+        self.assertEqual(body, '{"a":"Tue, 02 Jan 2024 03:04:05 GMT","b":1}\n')  # Flask's key order and dates
+        
+        response = self.client.post('/api/register', json={
+            'firstName': 'Grace', 'lastName': 'Hopper', 'email': 'grace@example.com', 'password': 'password123'})
+        registered = json.loads(response.data)['user']
+        with app.app_context():
+            stored = User.query.filter_by(email='grace@example.com').first()
+            self.assertEqual(registered, user_to_dict(stored))
+        headers = {'Authorization': f"Bearer {json.loads(response.data)['access_token']}"}
+        self.assertEqual(json.loads(self.client.get('/api/user', headers=headers).data)['user'], registered)
+        print("✅ Test 29: One user serializer, responses encoded by orjson")
+
+    def test_30_admin_user_listing_pages_and_searches(self):
+        """Test the admin listing: keyset pages, role filter, FTS search kept in sync"""
+        records = [{'email': f'member{i}@example.com', 'password': 'pw123456', 'firstName': 'Member',
+                    'lastName': f'Number{i}', 'role': 'admin' if i < 3 else 'user'} for i in range(20)]
+        records[5]['firstName'] = 'Wanjiku'
+        with app.app_context():
+            # One chunk, so every row shares created_at and pages are split by id alone
+            import_users(records, chunk_size=50, workers=1, rounds=4)
+        
+        login = lambda email: self.client.post('/api/login', json={'email': email, 'password': 'pw123456'})
+        admin = {'Authorization': f"Bearer {json.loads(login('member0@example.com').data)['access_token']}"}
+        member = {'Authorization': f"Bearer {json.loads(login('member9@example.com').data)['access_token']}"}
+        self.assertEqual(self.client.get('/api/admin/users', headers=member).status_code, 403)
+        self.assertEqual(self.client.get('/api/admin/users').status_code, 401)
+        
+        seen, cursor = [], None
+        while True:
+            query = f'/api/admin/users?limit=7' + (f'&cursor={cursor}' if cursor else '')
+            page = json.loads(self.client.get(query, headers=admin).data)
+            self.assertLessEqual(len(page['users']), 7)
+            seen.extend(user['id'] for user in page['users'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 20)
+        self.assertEqual(seen, sorted(seen, reverse=True))  # newest first, no repeats
+        
+        admins = json.loads(self.client.get('/api/admin/users?role=admin', headers=admin).data)['users']
+        self.assertEqual(sorted(user['email'] for user in admins),
+                         ['member0@example.com', 'member1@example.com', 'member2@example.com'])
+        self.assertEqual(self.client.get('/api/admin/users?role=owner', headers=admin).status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/users?cursor=nonsense', headers=admin).status_code, 400)
+        
+        # Promotion applies to the existing token at once
+        with app.app_context():
+            self.assertTrue(set_role('Member9@example.com', 'admin'))
+            self.assertFalse(set_role('nobody@example.com', 'admin'))
+            self.assertRaises(ValueError, set_role, 'member9@example.com', 'owner')
+        self.assertEqual(self.client.get('/api/admin/users', headers=member).status_code, 200)
+        
+        search = lambda q: [user['email'] for user in
+                            json.loads(self.client.get(f'/api/admin/users?q={q}', headers=admin).data)['users']]
+        self.assertEqual(search('wanj'), ['member5@example.com'])  # prefix match on the first name
+        self.assertEqual(search('member number7'), ['member7@example.com'])
+        self.assertEqual(search('member13%40example'), ['member13@example.com'])
+        
+        # The search index follows updates and deletes through the triggers
+        with app.app_context():
+            user = User.query.filter_by(email='member5@example.com').first()
+            user.first_name = 'Achieng'
+            db.session.commit()
+            User.query.filter_by(email='member6@example.com').delete()
+            db.session.commit()
+        self.assertEqual(search('wanjiku'), [])
+        self.assertEqual(search('achieng'), ['member5@example.com'])
+        self.assertEqual(search('member6'), [])
+        print("✅ Test 30: Admin listing pages by cursor, filters by role and searches names/emails")
+
+    def test_31_user_export_streams_csv_and_ndjson(self):
+        """Test the streaming export: batches, formats, role filter, admin-only endpoint"""
+        records = [{'email': f'export{i}@example.com', 'password': 'pw123456', 'firstName': 'Export',
+                    'lastName': f'User, {i}', 'role': 'admin' if i == 0 else 'user'} for i in range(12)]
+        with app.app_context():
+            import_users(records, workers=1, rounds=4)
+            chunks = list(export_users('csv', batch_size=5))
+            progress = []
+            list(export_users('ndjson', batch_size=5, progress=progress.append))
+        self.assertEqual(len(chunks), 3)  # one chunk per batch of rows
+        self.assertEqual(progress, [5, 10, 12])
+        rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[3]['lastName'], 'User, 3')  # quoted, not split
+        self.assertNotIn('password_hash', rows[0])
+        
+        login = self.client.post('/api/login', json={'email': 'export0@example.com', 'password': 'pw123456'})
+        admin = {'Authorization': f"Bearer {json.loads(login.data)['access_token']}"}
+        response = self.client.get('/api/admin/users/export?format=ndjson&role=user', headers=admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertIn('users.ndjson', response.headers['Content-Disposition'])
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(lines), 11)
+        self.assertEqual({line['role'] for line in lines}, {'user'})
+        self.assertEqual(self.client.get('/api/admin/users/export?format=xml', headers=admin).status_code, 400)
+        
+        member = self.client.post('/api/login', json={'email': 'export5@example.com', 'password': 'pw123456'})
+        headers = {'Authorization': f"Bearer {json.loads(member.data)['access_token']}"}
+        self.assertEqual(self.client.get('/api/admin/users/export', headers=headers).status_code, 403)
+        print("✅ Test 31: User export streams CSV and NDJSON in batches")
+
+    def test_32_reset_emails_go_through_the_outbox(self):
+        """Test the outbox: queued with the token, batched over one SMTP connection, retried"""
+        for i in range(3):
+            self.client.post('/api/register', json={'firstName': f'Mail{i}', 'lastName': 'User',
+                                                    'email': f'mail{i}@example.com', 'password': 'password123'})
+            response = self.client.post('/api/forgot-password', json={'email': f'mail{i}@example.com'})
+            self.assertEqual(response.status_code, 200)
+        with app.app_context():
+            # Queued by the request, nothing sent yet (MAIL_SERVER is unset)
+            self.assertEqual(OutboxEmail.query.filter_by(status='pending').count(), 3)
+            self.assertEqual(outbox.dispatch_once(), {'sent': 0, 'retried': 0, 'failed': 0})
+        
+        smtp = SMTPStandIn()
+        settings = (outbox.server, outbox.port, outbox.backoff_seconds)
+        outbox.server, outbox.port, outbox.backoff_seconds = '127.0.0.1', smtp.port, 60
+        try:
+            with app.app_context():
+                smtp.reject = ['451 mailbox busy']
+                self.assertEqual(outbox.dispatch_once(), {'sent': 2, 'retried': 1, 'failed': 0})
+                self.assertEqual(smtp.connections, 1)  # the whole batch over one connection
+                retry = OutboxEmail.query.filter_by(status='pending').one()
+                self.assertEqual(retry.attempts, 1)
+                self.assertIn('451', retry.last_error)
+                self.assertGreater(retry.next_attempt_at, datetime.utcnow() + timedelta(seconds=30))
+                
+                # Not due yet; once it is, it goes out on the same open connection
+                self.assertEqual(outbox.dispatch_once()['sent'], 0)
+                retry.next_attempt_at = datetime.utcnow()
+                db.session.commit()
+                self.assertEqual(outbox.dispatch_once(), {'sent': 1, 'retried': 0, 'failed': 0})
+                self.assertEqual(smtp.connections, 1)
+                
+                # Permanent rejections are not retried
+                outbox.enqueue('nobody@example.com', 'Hello', 'Body')
+                db.session.commit()
+                smtp.reject = ['550 no such user']
+                self.assertEqual(outbox.dispatch_once(), {'sent': 0, 'retried': 0, 'failed': 1})
+                self.assertEqual(OutboxEmail.query.filter_by(status='sent').count(), 3)
+                self.assertEqual(OutboxEmail.query.filter_by(status='failed').count(), 1)
+        finally:
+            outbox.connection.close()
+            outbox.server, outbox.port, outbox.backoff_seconds = settings
+            smtp.shutdown()
+            smtp.server_close()
+        
+        self.assertEqual(sorted(m['To'] for m in smtp.messages),
+                         ['mail0@example.com', 'mail1@example.com', 'mail2@example.com'])
+        self.assertIn('Hi Mail', smtp.messages[0].get_payload())
+        
+        # The emailed link opens the reset page, and its token resets the password
+        body = smtp.messages[0].get_payload(decode=True).decode('utf-8')
+        link = next(line for line in body.splitlines() if 'token=' in line)
+        self.assertTrue(link.startswith('http://localhost/resetpassword.html?token='))
+        page = self.client.get(link)
+        self.assertEqual(page.status_code, 200)
+        self.assertIn(b'newPassword', page.data)
+        self.assertNotEqual(page.data, self.client.get('/').data)
+        response = self.client.post('/api/reset-password', json={'token': link.split('token=', 1)[1],
+                                                                 'newPassword': 'fromtheemail1'})
+        self.assertEqual(response.status_code, 200)
+        
+        # Outside testing/debug the link only travels by email
+        app.config['TESTING'] = False
+        try:
+            response = self.client.post('/api/forgot-password', json={'email': 'mail0@example.com'})
+        finally:
+            app.config['TESTING'] = True
+        self.assertNotIn('reset_url', json.loads(response.data))
+        print("✅ Test 32: Reset emails are queued with the token and delivered by the outbox")
+
+    def test_33_auth_events_are_batched_and_bounded(self):
+        """Test the auth event log: recorded off the request path, batched, bounded, aggregated"""
+        with app.app_context():
+            import_users([{'email': 'auditor@example.com', 'password': 'pw123456', 'firstName': 'Audit',
+                           'lastName': 'Or', 'role': 'admin'}], workers=1, rounds=4)
+        self.client.post('/api/register', json={'firstName': 'Event', 'lastName': 'User',
+                                                'email': 'events@example.com', 'password': 'password123'})
+        for _ in range(2):
+            self.client.post('/api/login', json={'email': 'events@example.com', 'password': 'wrong'})
+        login = self.client.post('/api/login', json={'email': 'events@example.com', 'password': 'password123'})
+        headers = {'Authorization': f"Bearer {json.loads(login.data)['access_token']}"}
+        self.client.post('/api/logout', headers=headers)
+        
+        with app.app_context():
+            auth_events.flush(app)
+            totals = event_totals()
+            self.assertEqual((totals['register'], totals['login'], totals['login_failed'], totals['logout']),
+                             (1, 1, 2, 1))
+            failed = AuthEvent.query.filter_by(event='login_failed').first()
+            self.assertEqual(failed.email, 'events@example.com')
+            self.assertEqual(failed.ip, '127.0.0.1')
+            
+            # Per-minute buckets
+            now = datetime.utcnow().replace(second=30, microsecond=0)
+            db.session.add_all([AuthEvent(event='login', created_at=now - timedelta(minutes=10)),
+                                AuthEvent(event='login', created_at=now - timedelta(minutes=10, seconds=20)),
+                                AuthEvent(event='login_failed', created_at=now - timedelta(minutes=10))])
+            db.session.commit()
+            buckets = events_per_minute(since=now - timedelta(minutes=15), until=now - timedelta(minutes=5))
+            self.assertEqual(buckets, [{'minute': (now - timedelta(minutes=10)).strftime('%Y-%m-%d %H:%M'),
+                                        'login': 2, 'login_failed': 1}])
+            
+            # A full buffer drops events instead of blocking; holding the write lock keeps the writer out
+            settings = (auth_events.max_queue, auth_events.dropped)
+            with auth_events._write_lock, app.test_request_context():
+                auth_events.max_queue = 3
+                accepted = [auth_events.record('login', 1) for _ in range(5)]
+            self.assertEqual(accepted, [True, True, True, False, False])
+            self.assertEqual(auth_events.dropped - settings[1], 2)
+            auth_events.max_queue = settings[0]
+            self.assertEqual(auth_events.flush(app), 3)
+            
+            # An over-long email is cut to fit, and a row that cannot be written costs only itself
+            self.client.post('/api/login', json={'email': 'x' * 500 + '@example.com', 'password': 'wrong'})
+            auth_events.flush(app)
+            with auth_events._write_lock, app.test_request_context():
+                auth_events.record('logout', 1)
+                auth_events.record(None, 2)  # violates NOT NULL
+                auth_events.record('logout', 3)
+            dropped = auth_events.dropped
+            self.assertEqual(auth_events.flush(app), 2)
+            self.assertEqual(auth_events.dropped - dropped, 1)
+            long_email = AuthEvent.query.filter(AuthEvent.email.like('xxx%')).one().email
+            self.assertEqual(len(long_email), 120)
+            self.assertEqual(AuthEvent.query.filter_by(event='logout', user_id=3).count(), 1)
+        
+        # An unavailable sink (its directory path is taken by a file) keeps the batch for a retry
+        with tempfile.TemporaryDirectory() as directory:
+            blocked = os.path.join(directory, 'blocked')
+            open(blocked, 'w').close()
+            settings = (auth_events.sink, auth_events.directory, auth_events.dropped)
+            with auth_events._write_lock:
+                auth_events.sink, auth_events.directory = 'ndjson', blocked
+            try:
+                with auth_events._write_lock, app.test_request_context():
+                    for i in range(3):
+                        auth_events.record('login', i)
+                self.assertEqual(auth_events.flush(app), 0)
+                with auth_events._write_lock:
+                    self.assertEqual(auth_events.stats()['queued'], 3)
+                    self.assertGreater(auth_events.stats()['backoff_seconds'], 0)
+                    auth_events.directory = directory
+                auth_events.flush(app)
+                with open(os.path.join(directory, 'auth-events.ndjson'), encoding='utf-8') as f:
+                    self.assertEqual([json.loads(line)['user_id'] for line in f], [0, 1, 2])
+                self.assertEqual(auth_events.dropped, settings[2])
+            finally:
+                with auth_events._write_lock:
+                    auth_events.sink, auth_events.directory = settings[:2]
+        
+        # NDJSON sink rotates files past the size limit
+        with tempfile.TemporaryDirectory() as directory:
+            settings = (auth_events.sink, auth_events.directory, auth_events.rotate_bytes)
+            with auth_events._write_lock:
+                auth_events.sink, auth_events.directory, auth_events.rotate_bytes = 'ndjson', directory, 300
+            try:
+                with app.test_request_context():
+                    for i in range(6):
+                        auth_events.record('login', i, f'user{i}@example.com')
+                        auth_events.flush(app)
+            finally:
+                with auth_events._write_lock:
+                    auth_events.sink, auth_events.directory, auth_events.rotate_bytes = settings
+            files = sorted(os.listdir(directory))
+            self.assertGreater(len(files), 1)
+            lines = [json.loads(line) for name in files
+                     for line in open(os.path.join(directory, name), encoding='utf-8')]
+            self.assertEqual(sorted(line['user_id'] for line in lines), list(range(6)))
+        
+        # Admin summary
+        admin = self.client.post('/api/login', json={'email': 'auditor@example.com', 'password': 'pw123456'})
+        admin = {'Authorization': f"Bearer {json.loads(admin.data)['access_token']}"}
+        self.assertEqual(self.client.get('/api/admin/auth-events/summary', headers=headers).status_code, 401)
+        summary = json.loads(self.client.get('/api/admin/auth-events/summary?minutes=5', headers=admin).data)
+        self.assertEqual(summary['totals']['login_failed'], 3)
+        self.assertEqual(summary['top_failed_ips'], [{'ip': '127.0.0.1', 'failures': 3, 'emails': 2}])
+        self.assertGreaterEqual(summary['totals']['login'], 4)
+        self.assertEqual(self.client.get('/api/admin/auth-events/summary?minutes=0', headers=admin).status_code, 400)
+        print("✅ Test 33: Auth events are batched off the request path, bounded and aggregated")
+
 
 def run_tests():
     """Run all tests and display results"""